@@ -142,5 +142,8 @@ def create_app():
     
     from app.routes_support import support_bp
     app.register_blueprint(support_bp)
+
+    from app.routes_jobs import jobs_bp
+    app.register_blueprint(jobs_bp)
     
     return app
@@ -1,5 +1,6 @@
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime, timedelta
+import json
 
 db = SQLAlchemy()
 
@@ -27,6 +28,8 @@ class SystemConfig(db.Model):
     value = db.Column(db.String(255), nullable=False)
     description = db.Column(db.String(200))
     category = db.Column(db.String(50), default='general')
+    # Carimbo de versao do cache de ConfigService.
+    updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
 
 class StorePause(db.Model):
     """
@@ -155,12 +158,18 @@ class Store(db.Model):
     assignees_json = db.Column(db.Text, nullable=True) # JSON de membros/avatares
     total_time_tracked = db.Column(db.Integer, default=0) # Total em segundos
 
+    # Datas efetivas materializadas (refresh_effective_dates) para filtros em SQL.
+    effective_start_at = db.Column(db.DateTime, nullable=True, index=True)
+    effective_end_at = db.Column(db.DateTime, nullable=True, index=True)
+    paused_days = db.Column(db.Integer, default=0) # Dias pausados na janela de implantacao
+
     
     # Relacionamentos
     steps = db.relationship('TaskStep', backref='store', lazy=True, cascade="all, delete-orphan")
     pauses = db.relationship('StorePause', backref='store', lazy=True, cascade="all, delete-orphan")
     observations = db.relationship('StoreObservation', backref='store', lazy=True, cascade="all, delete-orphan")
     deep_sync_state = db.relationship('StoreDeepSyncState', uselist=False, backref='store', cascade="all, delete-orphan")
+    risk = db.relationship('StoreRisk', uselist=False, backref='store', cascade="all, delete-orphan")
 
     status_history = db.relationship('TimeInStatusCache', backref='store', lazy=True, cascade="all, delete-orphan")
     logs = db.relationship('StoreSyncLog', backref='store', lazy=True, cascade="all, delete-orphan")
@@ -198,16 +207,16 @@ class Store(db.Model):
         # Se não existir, usar clickup_created_at.
         return self.manual_start_date or self.created_at
 
-    @property
-    def dias_em_progresso(self):
+    def _progress_window(self):
+        """Janela (inicio, fim de referencia) usada na contagem de dias; None se nao se aplica."""
         if self.is_scheduled:
-            return 0
+            return None
             
         end_date = self.effective_finished_at
         start_date = self.effective_started_at
         
         if not start_date:
-            return 0
+            return None
             
         # Data de referência final (Data de Fim ou Hoje)
         if self.status_norm == 'DONE':
@@ -217,12 +226,23 @@ class Store(db.Model):
             ref_end = end_date or self.created_at
         else:
             ref_end = end_date or datetime.now()
+        return start_date, ref_end
+
+    @property
+    def dias_em_progresso(self):
+        window = self._progress_window()
+        if not window:
+            return 0
+        start_date, ref_end = window
         
         # Delta Total Bruto
         delta = ref_end - start_date
         total_days = max(0, delta.days)
         
-        # Calcular dias pausados
+        # Descontar pausas
+        return max(0, total_days - self._paused_days_between(start_date, ref_end))
+
+    def _paused_days_between(self, start_date, ref_end):
         paused_days = 0
         for pause in self.pauses:
             # Pausa deve estar dentro do intervalo [start_date, ref_end]
@@ -243,9 +263,49 @@ class Store(db.Model):
             if eff_end > eff_start:
                 p_delta = eff_end - eff_start
                 paused_days += p_delta.days
-                
-        # Descontar pausas
-        return max(0, total_days - paused_days)
+        return paused_days
+
+    def refresh_effective_dates(self):
+        """
+        Recalcula effective_start_at/effective_end_at/paused_days a partir das
+        propriedades. Deve ser chamado por quem altera loja, pausas ou etapas.
+        Retorna True se alguma coluna mudou.
+        """
+        window = self._progress_window()
+        values = {
+            'effective_start_at': self.effective_started_at,
+            'effective_end_at': self.effective_finished_at,
+            'paused_days': self._paused_days_between(*window) if window else 0,
+        }
+        previous_end = self.effective_end_at
+        changed = False
+        for column, value in values.items():
+            if getattr(self, column) != value:
+                setattr(self, column, value)
+                changed = True
+
+        # Meses de entrega a reagregar (MonthlyRollupService.apply_pending): o antigo e o atual,
+        # ja que implantador, tipo e MRR da loja tambem podem ter mudado.
+        dirty_months = db.session.info.setdefault('rollup_dirty_months', set())
+        for end in (previous_end, self.effective_end_at):
+            if end:
+                dirty_months.add(end.date().replace(day=1))
+        return changed
+
+    @classmethod
+    def scheduled_clause(cls, now=None):
+        """SQL de `is_scheduled`: derivado do inicio efetivo, nao envelhece como um flag gravado."""
+        return cls.effective_start_at > (now or datetime.now())
+
+    @classmethod
+    def unscheduled_clause(cls, now=None):
+        """SQL de `not is_scheduled` (lojas sem inicio tambem nao sao programadas)."""
+        return db.or_(cls.effective_start_at.is_(None), cls.effective_start_at <= (now or datetime.now()))
+
+    @classmethod
+    def active_clause(cls, now=None):
+        """SQL de `not effective_finished_at and not is_scheduled` (lojas em WIP)."""
+        return db.and_(cls.effective_end_at.is_(None), cls.unscheduled_clause(now))
 
     @property
     def dias_totais_implantacao(self):
@@ -315,6 +375,78 @@ class StoreDeepSyncState(db.Model):
     # Se clickup_updated_at da loja não mudou, não precisamos rodar deep sync de novo
     last_synced_clickup_updated_at = db.Column(db.String(50), nullable=True) 
 
+class ClickUpTaskFingerprint(db.Model):
+    """
+    Impressao digital da ultima versao sincronizada de cada tarefa do ClickUp.
+    Permite ao sync pular o trabalho de ORM para tarefas que nao mudaram.
+    """
+    __tablename__ = 'clickup_task_fingerprints'
+    
+    clickup_task_id = db.Column(db.String(50), primary_key=True)
+    entity_type = db.Column(db.String(20), nullable=False, index=True) # 'store' ou 'step'
+    date_updated = db.Column(db.BigInteger, nullable=True) # date_updated do ClickUp (ms)
+    content_hash = db.Column(db.String(32), nullable=False) # md5 dos campos mapeados
+    synced_at = db.Column(db.DateTime, default=datetime.now)
+
+class ClickUpResponseCache(db.Model):
+    """
+    Respostas por tarefa do ClickUp (comentarios, time tracking, time_in_status).
+    Valida enquanto o date_updated da tarefa nao avancar e o TTL nao expirar.
+    """
+    __tablename__ = 'clickup_response_cache'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    task_id = db.Column(db.String(50), nullable=False, index=True)
+    kind = db.Column(db.String(30), nullable=False) # 'comments', 'time_tracking', 'time_in_status'
+    date_updated = db.Column(db.BigInteger, nullable=True) # versao da tarefa quando buscada (ms)
+    payload = db.Column(db.Text, nullable=False) # JSON text
+    fetched_at = db.Column(db.DateTime, default=datetime.now, index=True)
+    
+    __table_args__ = (
+        db.UniqueConstraint('task_id', 'kind', name='uix_clickup_response_cache'),
+    )
+
+class StepDurationStats(db.Model):
+    """
+    Estatisticas de duracao por lista de etapas (base da previsao do AnalysisService).
+    Recalculadas apos cada sync apenas para as listas alteradas.
+    """
+    __tablename__ = 'step_duration_stats'
+    
+    step_list_name = db.Column(db.String(100), primary_key=True)
+    avg = db.Column(db.Float, nullable=False)
+    std = db.Column(db.Float, default=0.0)
+    p50 = db.Column(db.Float, nullable=False)
+    p75 = db.Column(db.Float, nullable=False)
+    count = db.Column(db.Integer, default=0)
+    computed_at = db.Column(db.DateTime, default=datetime.now)
+
+class StoreRisk(db.Model):
+    """
+    Score de risco materializado por loja (saida do ScoringService.calculate_risk_score).
+    Evita recalcular o score de todas as lojas a cada requisicao.
+    """
+    __tablename__ = 'store_risk'
+    
+    store_id = db.Column(db.Integer, db.ForeignKey('stores.id'), primary_key=True)
+    total = db.Column(db.Float, nullable=False, default=0.0, index=True)
+    level = db.Column(db.String(20))
+    ai_risk_level = db.Column(db.String(20))
+    ai_boost = db.Column(db.Float, default=0.0)
+    breakdown = db.Column(db.Text) # JSON stringified
+    hints = db.Column(db.Text) # JSON stringified list
+    computed_at = db.Column(db.DateTime, default=datetime.now, index=True)
+
+    def to_dict(self):
+        return {
+            "total": self.total,
+            "level": self.level,
+            "ai_risk_level": self.ai_risk_level,
+            "ai_boost": self.ai_boost,
+            "hints": json.loads(self.hints) if self.hints else [],
+            "breakdown": json.loads(self.breakdown) if self.breakdown else {},
+        }
+
 class TimeInStatusCache(db.Model):
     """
     Cache do histórico de tempo em cada status (Deep Sync).
@@ -438,8 +570,42 @@ class MetricsSnapshotDaily(db.Model):
     def __repr__(self):
         return f'<SnapshotDaily {self.snapshot_date} Store={self.store_id}>'
 
+class MonthlyDeliveryRollup(db.Model):
+    """
+    Entregas pre-agregadas por mes de conclusao (effective_end_at) x implantador x tipo de loja.
+    Alimenta as tendencias do AnalyticsService; pontos saem de delivered_count x peso do tipo.
+    """
+    __tablename__ = 'monthly_delivery_rollup'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    month = db.Column(db.Date, nullable=False, index=True) # Primeiro dia do mes
+    implantador = db.Column(db.String(255), nullable=False, default='')
+    tipo_loja = db.Column(db.String(20), nullable=False, default='Filial') # Matriz ou Filial
+    
+    delivered_count = db.Column(db.Integer, default=0)
+    mrr = db.Column(db.Float, default=0.0)
+    on_time_count = db.Column(db.Integer, default=0)
+    cycle_days_sum = db.Column(db.Integer, default=0) # Soma de dias_totais_implantacao
+    updated_at = db.Column(db.DateTime, default=datetime.now)
+
+    __table_args__ = (
+        db.UniqueConstraint('month', 'implantador', 'tipo_loja', name='uix_monthly_delivery_rollup'),
+    )
+
+    def __repr__(self):
+        return f'<MonthlyDeliveryRollup {self.month} {self.implantador} {self.tipo_loja}>'
+
 # --- V2.5 Models (Governance & Audit) ---
 
+class SchedulerLease(db.Model):
+    """Lease de execucao exclusiva (jobs agendados / sync do ClickUp) com expiracao e heartbeat."""
+    __tablename__ = 'scheduler_leases'
+    name = db.Column(db.String(100), primary_key=True)
+    owner = db.Column(db.String(150), nullable=True) # host:pid:token de quem detem o lease
+    acquired_at = db.Column(db.DateTime, nullable=True)
+    heartbeat_at = db.Column(db.DateTime, nullable=True)
+    expires_at = db.Column(db.DateTime, nullable=False)
+
 class SyncRun(db.Model):
     __tablename__ = 'sync_runs'
     id = db.Column(db.Integer, primary_key=True)
@@ -460,6 +626,45 @@ class SyncError(db.Model):
     traceback = db.Column(db.Text, nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.now)
 
+class BackgroundJob(db.Model):
+    """Job longo (syncs) executado fora do ciclo do request, com heartbeat e log de progresso."""
+    __tablename__ = 'background_jobs'
+    id = db.Column(db.Integer, primary_key=True)
+    job_type = db.Column(db.String(50), nullable=False, index=True)
+    status = db.Column(db.String(20), default="QUEUED", index=True) # QUEUED, RUNNING, SUCCESS, ERROR
+    params = db.Column(db.Text, nullable=True) # JSON text
+    result = db.Column(db.Text, nullable=True) # JSON text
+    error = db.Column(db.Text, nullable=True)
+    created_by = db.Column(db.String(50), nullable=True)
+    worker = db.Column(db.String(100), nullable=True) # host:pid que executa o job
+    created_at = db.Column(db.DateTime, default=datetime.now, index=True)
+    started_at = db.Column(db.DateTime, nullable=True)
+    heartbeat_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "type": self.job_type,
+            "status": self.status,
+            "params": json.loads(self.params) if self.params else {},
+            "result": json.loads(self.result) if self.result else None,
+            "error": self.error,
+            "created_by": self.created_by,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "heartbeat_at": self.heartbeat_at.isoformat() if self.heartbeat_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+        }
+
+class BackgroundJobEvent(db.Model):
+    """Linha do log de progresso de um BackgroundJob (id crescente serve de cursor do SSE)."""
+    __tablename__ = 'background_job_events'
+    id = db.Column(db.Integer, primary_key=True)
+    job_id = db.Column(db.Integer, db.ForeignKey('background_jobs.id', ondelete='CASCADE'), nullable=False, index=True)
+    message = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.now)
+
 class ForecastAuditLog(db.Model):
     __tablename__ = 'forecast_audit_logs'
     id = db.Column(db.Integer, primary_key=True)
@@ -702,6 +907,20 @@ class ZenviaWebhookEvent(db.Model):
     processed_at = db.Column(db.DateTime, nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+class ClickUpWebhookEvent(db.Model):
+    """Caixa de entrada duravel dos webhooks do ClickUp (aplicada em segundo plano)."""
+    __tablename__ = 'clickup_webhook_events'
+    id = db.Column(db.Integer, primary_key=True)
+    event_key = db.Column(db.String(200), unique=True, nullable=False, index=True) # webhook_id + history_items
+    event_type = db.Column(db.String(50), nullable=False)
+    task_id = db.Column(db.String(50), nullable=False, index=True)
+    webhook_id = db.Column(db.String(100), nullable=True)
+    raw_payload = db.Column(db.Text, nullable=False) # JSON text
+    attempts = db.Column(db.Integer, default=0)
+    last_error = db.Column(db.Text, nullable=True)
+    processed_at = db.Column(db.DateTime, nullable=True, index=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
 class SupportContact(db.Model):
     __tablename__ = 'support_contacts'
     id = db.Column(db.Integer, primary_key=True)
@@ -710,7 +929,7 @@ class SupportContact(db.Model):
     phone = db.Column(db.String(50), nullable=True, index=True)
     email = db.Column(db.String(150), nullable=True)
     store_id = db.Column(db.Integer, db.ForeignKey('stores.id'), nullable=True) # Para contatos órfãos
-    created_at_zenvia = db.Column(db.DateTime, nullable=True)
+    created_at_zenvia = db.Column(db.DateTime, nullable=True, index=True)
     linked_store_name = db.Column(db.String(255), nullable=True) # Nome da loja livre (legado/externo)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow)
     
@@ -744,6 +963,11 @@ class SupportConversation(db.Model):
     
     contact = db.relationship('SupportContact', backref='conversations')
 
+    __table_args__ = (
+        # Cobre a linha do tempo do suporte (contagens por bucket sem ler a tabela).
+        db.Index('ix_support_conversations_timeline', 'created_at_zenvia', postgresql_include=['status', 'nps_score']),
+    )
+
 class SupportMessage(db.Model):
     __tablename__ = 'support_messages'
     id = db.Column(db.Integer, primary_key=True)
@@ -755,7 +979,7 @@ class SupportMessage(db.Model):
     to_number = db.Column(db.String(50), nullable=True)
     content_type = db.Column(db.String(50), nullable=True)
     text = db.Column(db.Text, nullable=True)
-    timestamp = db.Column(db.DateTime, nullable=True)
+    timestamp = db.Column(db.DateTime, nullable=True, index=True)
     status = db.Column(db.String(50), nullable=True) # SENT, DELIVERED, READ, FAILED
     
     conversation = db.relationship('SupportConversation', backref='messages')
@@ -1,17 +1,39 @@
 from flask import Blueprint, jsonify, request, Response, stream_with_context, current_app
-from app.models import db, Store, StoreSyncLog, SystemConfig
+from app.models import db, Store, StoreSyncLog, BackgroundJob
 from app.services.monitor_import_service import importar_planilha_monitor
 from app.services.metrics import MetricsService
 from app.services.sync_service import SyncService
+from app.services.risk_service import StoreRiskService
+from app.services.rollup_service import MonthlyRollupService
+from app.services.config_service import ConfigService
+from app.services.job_service import JobService, JobConflictError
+from app.services.change_detection import TaskFingerprintService
+from app.services.lease_service import LeaseService
 from app.services.security_service import require_auth, require_permission, log_audit
 from datetime import datetime
 from sqlalchemy import func
+from sqlalchemy.orm import selectinload
 import json
 
 # Blueprint principal mantido para health checks e estrutura futura
 main_bp = Blueprint('main', __name__)
 api_bp = Blueprint('api', __name__, url_prefix='/api')
 
+def _refresh_store_aggregates(stores):
+    """Score de risco e rollup mensal apos edicao manual de lojas (commit com o chamador)."""
+    StoreRiskService().refresh_stores(stores)
+    MonthlyRollupService().apply_pending()
+
+def _clickup_sync_lease():
+    """Sync sincrono: mesmo lease dos syncs agendados, jobs e webhooks do ClickUp."""
+    return LeaseService.hold(LeaseService.CLICKUP_SYNC, wait_seconds=JobService.CLICKUP_LOCK_WAIT_SECONDS)
+
+CLICKUP_SYNC_BUSY = {"error": "Outro sync do ClickUp esta em andamento. Tente novamente em instantes."}
+
+def _run_async():
+    """?async=true: enfileira o sync como job em segundo plano e responde 202."""
+    return request.args.get('async', 'false').lower() == 'true'
+
 @main_bp.route('/ping', methods=['GET'])
 def ping():
     return jsonify({
@@ -25,200 +47,17 @@ def ping():
 @api_bp.route('/dashboard', methods=['GET'])
 @require_auth
 def get_dashboard_data(payload):
-    from app.services.scoring_service import ScoringService
+    from app.services.dashboard_service import DashboardService
     
     # Filtro de status vindo por query string.
     # Opcoes: 'active' (padrao), 'concluded', 'all'.
     status_filter = request.args.get('status', 'active')
 
     # Carrega pesos configuraveis de matriz/filial.
-    w_matriz = 1.0
-    w_filial = 0.7
-    
-    try:
-        cfg_m = SystemConfig.query.filter_by(key='weight_matriz').first()
-        cfg_f = SystemConfig.query.filter_by(key='weight_filial').first()
-        if cfg_m:
-            w_matriz = float(cfg_m.value)
-        if cfg_f:
-            w_filial = float(cfg_f.value)
-    except Exception:
-        pass
-
-    all_stores = Store.query.all()
-    
-    # Listas globais para calculo de KPIs.
-    # Regra V6: ativas = nao concluidas e inicio <= hoje.
-    active_stores_global = [s for s in all_stores if not s.effective_finished_at and not s.is_scheduled]
-    
-    # Filtrar entregas: somente a partir de 2026
-    concluded_stores_global = [s for s in all_stores if s.effective_finished_at and s.effective_finished_at.year >= 2026]
-
-    # Escopo filtrado para listas de risco, MRR e tabelas operacionais.
-    if status_filter == 'active':
-        scope_stores = active_stores_global
-    elif status_filter == 'concluded':
-        scope_stores = concluded_stores_global
-    else: # all preservado como contrato da API
-        scope_stores = all_stores
-    
-    # 1. KPIs
-    count_wip = len(active_stores_global)
-    count_done = len(concluded_stores_global)
-    
-    # KPIs de topo permanecem globais para dar contexto executivo.
-    # Listas analiticas abaixo respeitam o filtro selecionado.
-    
-    total_points_wip = 0.0
-    for s in active_stores_global:
-        if s.tipo_loja == 'Matriz':
-            total_points_wip += w_matriz
-        else: # Filial
-            total_points_wip += w_filial
-            
-    total_points_done = 0.0
-    for s in concluded_stores_global:
-        if s.tipo_loja == 'Matriz':
-            total_points_done += w_matriz
-        else:
-            total_points_done += w_filial
-    
-    # Percentual no prazo considera apenas lojas concluidas.
-    on_time = sum(1 for s in concluded_stores_global if s.dias_totais_implantacao <= (s.tempo_contrato or 90))
-    pct_prazo = (on_time / count_done * 100) if count_done > 0 else 0
-    
-    # MRR dos cards e global; MRR devedor respeita o filtro operacional.
+    w_matriz, w_filial = ConfigService.get_weights()
 
-    mrr_implantacao = sum(s.valor_mensalidade for s in active_stores_global if s.valor_mensalidade and s.status_norm != 'DONE')
-    mrr_ja_pagando = sum(s.valor_mensalidade for s in all_stores if s.financeiro_status in ['Pago', 'Em dia'] and s.valor_mensalidade)
-    mrr_devendo = sum(s.valor_mensalidade for s in scope_stores if s.financeiro_status == 'Devendo' and s.valor_mensalidade)
-    
-    current_year = datetime.now().year
-    mrr_concluidas_ano = sum(s.valor_mensalidade for s in concluded_stores_global if s.effective_finished_at and s.effective_finished_at.year == current_year and s.valor_mensalidade)
-
-    # 2. Rankings: considera implantadores com pelo menos uma loja ativa.
-    active_implantadores = set()
-    for s in active_stores_global:
-        if s.implantador:
-            active_implantadores.add(s.implantador)
-
-    kpi_by_imp = {}
-    for s in active_stores_global:
-        imp = s.implantador
-        if not imp or imp not in active_implantadores:
-            continue
-        if imp not in kpi_by_imp:
-            kpi_by_imp[imp] = {"wip": 0, "done": 0, "on_time": 0}
-        
-        if not s.effective_finished_at:
-             kpi_by_imp[imp]["wip"] += 1
-
-    # Contabiliza entregas 2026+ para implantadores ainda ativos.
-    for s in concluded_stores_global:
-        imp = s.implantador
-        if not imp or imp not in active_implantadores:
-            continue
-        if imp not in kpi_by_imp:
-            kpi_by_imp[imp] = {"wip": 0, "done": 0, "on_time": 0}
-        kpi_by_imp[imp]["done"] += 1
-        if s.dias_totais_implantacao <= (s.tempo_contrato or 90):
-            kpi_by_imp[imp]["on_time"] += 1
-            
-    rankings = []
-    for imp, data in kpi_by_imp.items():
-        total_done = data['done']
-        pct = (data['on_time'] / total_done * 100) if total_done > 0 else 0
-        rankings.append({
-            "implantador": imp,
-            "wip": data['wip'],
-            "done": data['done'],
-            "pct_prazo": round(pct, 1)
-        })
-    rankings.sort(key=lambda x: x['done'], reverse=True)
-
-    # 3. Top 10 de risco respeitando o filtro de status.
-    risk_list = []
-    for s in scope_stores:
-        # Mantem compatibilidade com valores externos active/concluded.
-        if status_filter == 'active' and s.effective_finished_at:
-            continue
-        if status_filter == 'concluded' and not s.effective_finished_at:
-            continue
-        
-        risk_data = ScoringService.calculate_risk_score(s)
-        
-        # Identifica a etapa ativa para mostrar gargalo operacional.
-        active_step_name = "N/A"
-        for step in s.steps:
-            if step.start_real_at and not step.end_real_at:
-                active_step_name = step.step_name
-                break
-        
-        risk_list.append({
-            "id": s.id,
-            "name": s.store_name,
-            "implantador": s.implantador,
-            "status": s.status,
-            "etapa_parada": active_step_name, 
-            "score": risk_data['total'],
-            "breakdown": risk_data['breakdown'], 
-            "dias": s.dias_em_progresso,
-            "idle": s.idle_days,
-            "financeiro": s.financeiro_status
-        })
-    risk_list.sort(key=lambda x: x['score'], reverse=True)
-    top_risk = risk_list[:10]
-
-    # 4. Dados dos graficos.
-    # 4.1 Volume por implantador em andamento.
-    sorted_imps = sorted(kpi_by_imp.items(), key=lambda x: x[1]['wip'], reverse=True)
-    impl_labels = [item[0] for item in sorted_imps[:15]]
-    impl_values = [item[1]['wip'] for item in sorted_imps[:15]]
-    
-    # 4.2 Evolucao dos ultimos seis meses disponiveis.
-    from collections import defaultdict
-    evo_map = defaultdict(int)
-    for s in concluded_stores_global:
-        if s.effective_finished_at:
-            m_key = s.effective_finished_at.strftime('%m/%Y')
-            evo_map[m_key] += 1
-            
-    # Ordena por datetime para evitar erro de ordenacao por string mes/ano.
-    date_map = defaultdict(int) 
-    for s in concluded_stores_global:
-        if s.effective_finished_at:
-            # Normaliza para o inicio do mes.
-            dt = s.effective_finished_at.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-            date_map[dt] += 1
-            
-    sorted_dates = sorted(date_map.keys())
-    # Mantem apenas os seis meses mais recentes.
-    sorted_dates = sorted_dates[-6:]
-    
-    evo_labels = [d.strftime('%m/%Y') for d in sorted_dates]
-    evo_values = [date_map[d] for d in sorted_dates]
-
-    return jsonify({
-        "kpis": {
-            "wip": count_wip,
-            "done_total": count_done,
-            "pct_prazo": round(pct_prazo, 1),
-            "mrr_implantacao": mrr_implantacao,
-            "mrr_pagando": mrr_ja_pagando,
-            "mrr_devendo": mrr_devendo,
-            "mrr_concluidas_ano": mrr_concluidas_ano,
-            "points_wip": round(total_points_wip, 1),
-            "points_done": round(total_points_done, 1)
-        },
-        "charts": {
-            "impl_labels": impl_labels,
-            "impl_values": impl_values,
-            "evo_labels": evo_labels,
-            "evo_values": evo_values
-        },
-        "rankings": rankings,
-        "risk_stores": top_risk
-    })
+    # KPIs, rankings, evolucao e top de risco em consultas agrupadas.
+    return jsonify(DashboardService(w_matriz, w_filial).get_data(status_filter))
 
 @api_bp.route('/stores', methods=['GET'])
 @require_auth
@@ -227,12 +66,13 @@ def get_stores(payload):
     status_filter = request.args.get('status', 'active') # Padrao da API.
     
     query = Store.query
-    today = datetime.now().date()
+    now = datetime.now()
+    today = now.date()
     
     if status_filter == 'active':
         # Active = nao concluidas e sem inicio futuro.
         query = query.filter(Store.manual_finished_at.is_(None), Store.end_real_at.is_(None), Store.finished_at.is_(None))
-        query = query.filter(or_(Store.manual_start_date.is_(None), func.date(Store.manual_start_date) <= today))
+        query = query.filter(Store.unscheduled_clause(now))
     elif status_filter == 'scheduled':
         # Scheduled = nao concluidas com data de inicio manual futura.
         query = query.filter(Store.manual_finished_at.is_(None), Store.end_real_at.is_(None), Store.finished_at.is_(None))
@@ -250,46 +90,29 @@ def get_stores(payload):
             )
         )
         
+    # Relacionamentos usados por linha (risco, pausas, previsao, matriz) em consultas IN (...) unicas.
+    query = query.options(
+        selectinload(Store.steps),
+        selectinload(Store.pauses),
+        selectinload(Store.deep_sync_state),
+        selectinload(Store.matriz),
+    ).order_by(Store.created_at.desc())
+
     page = request.args.get('page', type=int)
     limit = request.args.get('limit', type=int)
     
     if page and limit:
-        # Se for active ou scheduled, precisamos filtrar em Python por causa das properties
-        if status_filter in ['active', 'scheduled']:
-            all_potential = query.order_by(Store.created_at.desc()).all()
-            if status_filter == 'active':
-                filtered = [s for s in all_potential if not s.is_scheduled]
-            else:
-                filtered = [s for s in all_potential if s.is_scheduled]
-            
-            total = len(filtered)
-            start = (page - 1) * limit
-            end = start + limit
-            stores = filtered[start:end]
-            meta = {
-                "total": total,
-                "pages": (total + limit - 1) // limit,
-                "page": page,
-                "limit": limit
-            }
-        else:
-            pagination = query.order_by(Store.created_at.desc()).paginate(page=page, per_page=limit, error_out=False)
-            stores = pagination.items
-            meta = {
-                "total": pagination.total,
-                "pages": pagination.pages,
-                "page": page,
-                "limit": limit
-            }
+        # Filtro de programadas ja esta no SQL (datas efetivas materializadas): paginacao no banco.
+        pagination = query.paginate(page=page, per_page=limit, error_out=False)
+        stores = pagination.items
+        meta = {
+            "total": pagination.total,
+            "pages": pagination.pages,
+            "page": page,
+            "limit": limit
+        }
     else:
-        all_stores = query.order_by(Store.created_at.desc()).all()
-        if status_filter == 'active':
-            stores = [s for s in all_stores if not s.is_scheduled]
-        elif status_filter == 'scheduled':
-            stores = [s for s in all_stores if s.is_scheduled]
-        else:
-            stores = all_stores
-            
+        stores = query.all()
         meta = {
             "total": len(stores),
             "pages": 1,
@@ -301,24 +124,38 @@ def get_stores(payload):
     all_matrices = Store.query.filter_by(tipo_loja='Matriz').all()
     matrices = [{'id': s.id, 'name': s.store_name} for s in all_matrices]
 
+    # Ultima mudanca de status por loja em uma unica consulta agrupada (dias_na_etapa).
+    last_status_change = {}
+    if stores:
+        last_status_change = dict(db.session.query(
+            StoreSyncLog.store_id, func.max(StoreSyncLog.changed_at)
+        ).filter(
+            StoreSyncLog.store_id.in_([s.id for s in stores]),
+            StoreSyncLog.field_name == 'status',
+        ).group_by(StoreSyncLog.store_id).all())
     
     results = []
     
     # Inicializar Serviço de Análise de IA
     from app.services.analysis import AnalysisService
-    from app.services.scoring_service import ScoringService
     analyzer = AnalysisService()
+    risk_by_store = StoreRiskService().get_many(stores)
 
     def fmt_date(d):
         return d.strftime('%Y-%m-%d') if d else None
         
     for s in stores:
-        risk_data = ScoringService.calculate_risk_score(s)
+        risk_data = risk_by_store[s.id]
         risk_score = risk_data['total']
         
         deep_status = "NEVER"
         if s.deep_sync_state:
             deep_status = s.deep_sync_state.sync_status
+
+        dias_na_etapa = 0
+        if s.effective_started_at:
+            stage_start = last_status_change.get(s.id) or s.effective_started_at
+            dias_na_etapa = (now - stage_start).days
             
         results.append({
             'id': s.id,
@@ -363,15 +200,8 @@ def get_stores(payload):
             'clickup_created_at': fmt_date(s.created_at),
             'manual_start_date': fmt_date(s.manual_start_date),
             'total_paused_days': sum([(p.end_date - p.start_date).days for p in s.pauses if p.end_date]) if s.pauses else 0,
-            'ai_prediction': analyzer.predict_store_completion(s.id),
-            'dias_na_etapa': (datetime.now() - (
-                StoreSyncLog.query.filter_by(store_id=s.id, field_name='status')
-                .order_by(StoreSyncLog.changed_at.desc())
-                .with_entities(StoreSyncLog.changed_at)
-                .first()[0] 
-                if StoreSyncLog.query.filter_by(store_id=s.id, field_name='status').first() 
-                else s.effective_started_at or datetime.now()
-            )).days if s.effective_started_at else 0
+            'ai_prediction': analyzer.predict_store_completion(s.id, store=s),
+            'dias_na_etapa': dias_na_etapa
         })
 
     return jsonify({"stores": results, "matrices": matrices, "meta": meta})
@@ -386,9 +216,18 @@ def delete_store(payload, id):
         from app.models import MetricsSnapshotDaily
         MetricsSnapshotDaily.query.filter_by(store_id=id).delete()
         
-        # 2. Deletar Loja (Cascades steps, logs, deep_sync, etc.)
+        # 2. Invalida as impressoes digitais da loja e etapas para o proximo sync recria-las
+        TaskFingerprintService().forget(
+            [store.clickup_task_id] + [step.clickup_task_id for step in store.steps]
+        )
+
+        # 3. Deletar Loja (Cascades steps, logs, deep_sync, etc.)
         store_name = store.store_name
+        delivered_at = store.effective_end_at
         db.session.delete(store)
+        db.session.flush()
+        if delivered_at:
+            MonthlyRollupService().refresh_months([delivered_at])
         db.session.commit()
         
         log_audit(
@@ -414,8 +253,7 @@ def get_store(payload, id):
     def fmt_date(d):
         return d.strftime('%Y-%m-%d') if d else None
 
-    from app.services.scoring_service import ScoringService
-    risk_data = ScoringService.calculate_risk_score(store)
+    risk_data = StoreRiskService().get(store)
     risk_score = risk_data['total']
     risk_level = risk_data['level']
 
@@ -573,6 +411,8 @@ def update_store(payload, id):
             p.end_date = store.manual_finished_at or datetime.now()
             p.reason = f"{(p.reason or '')} (Fechado via Finalização Manual)".strip()
             
+    store.refresh_effective_dates()
+    _refresh_store_aggregates([store])
     db.session.commit()
     
     log_audit(
@@ -589,17 +429,32 @@ def update_store(payload, id):
 @require_auth
 def sync_clickup(payload):
     full = request.args.get('full', 'false').lower() == 'true'
-    service = SyncService()
-    result = service.run_sync(force_full=full)
+    if _run_async():
+        try:
+            job = JobService.enqueue('sync', {'full': full, 'vital_only': False}, created_by=payload.get('sub'))
+        except JobConflictError as e:
+            return jsonify({"error": str(e), "job": e.job.to_dict()}), 409
+        return jsonify(job.to_dict()), 202
+    with _clickup_sync_lease() as acquired:
+        if not acquired:
+            return jsonify(CLICKUP_SYNC_BUSY), 409
+        service = SyncService()
+        result = service.run_sync(force_full=full)
     return jsonify(result)
 
 @api_bp.route('/implantacao/sync', methods=['POST'])
 @require_auth
 @require_permission('manage_sync')
 def sync_implantacao(payload):
+    if _run_async():
+        job = JobService.enqueue('implantacao_sync', created_by=payload.get('sub'))
+        return jsonify(job.to_dict()), 202
     service = SyncService()
     try:
-        result = service.run_implantacao_sync()
+        with _clickup_sync_lease() as acquired:
+            if not acquired:
+                return jsonify(CLICKUP_SYNC_BUSY), 409
+            result = service.run_implantacao_sync()
         return jsonify(result), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -608,13 +463,8 @@ def sync_implantacao(payload):
 @require_auth
 @require_permission('manage_sync')
 def sync_implantacao_docs(payload):
-    from app.models import SystemConfig
     service = SyncService()
-    cfg = SystemConfig.query.filter_by(key='clickup_docs_check_limit').first()
-    try:
-        limit = int(cfg.value) if cfg and cfg.value else 50
-    except (TypeError, ValueError):
-        limit = 50
+    limit = ConfigService.get_int('clickup_docs_check_limit', 50)
     try:
         result = service.sync_parent_card_documentation(limit=limit)
         return jsonify(result), 200
@@ -643,6 +493,7 @@ def bulk_link_stores(payload):
                  parent_store.rede = parent_store.name
 
         count = 0
+        changed_stores = [parent_store]
         for store_id in store_ids:
             # Evita auto-referência
             if int(store_id) == int(parent_id):
@@ -653,8 +504,13 @@ def bulk_link_stores(payload):
                 store.parent_id = parent_id
                 store.tipo_loja = 'Filial'
                 store.rede = parent_store.rede # Herda o nome da rede
+                changed_stores.append(store)
                 count += 1
         
+        # tipo_loja muda o peso no rollup mensal: marca os meses afetados
+        for store in changed_stores:
+            store.refresh_effective_dates()
+        _refresh_store_aggregates(changed_stores)
         db.session.commit()
         return jsonify({'message': f'{count} lojas vinculadas com sucesso', 'count': count}), 200
 
@@ -690,6 +546,7 @@ def bulk_update_stores(payload):
                 parent_store.tipo_loja = 'Matriz'
 
         count = 0
+        updated_stores = []
         for store_id in store_ids:
             # Evita auto-referência se houver parent_id
             if parent_id and int(store_id) == int(parent_id):
@@ -746,8 +603,11 @@ def bulk_update_stores(payload):
                     except Exception:
                         pass
                         
+                store.refresh_effective_dates()
+                updated_stores.append(store)
                 count += 1
         
+        _refresh_store_aggregates(updated_stores)
         db.session.commit()
         return jsonify({'message': f'{count} lojas atualizadas com sucesso', 'count': count}), 200
 
@@ -915,8 +775,14 @@ def get_store_logs(payload, id):
 @api_bp.route('/deep-sync/store/<int:id>', methods=['POST'])
 @require_auth
 def deep_sync_store(payload, id):
-    service = SyncService()
-    result = service.run_deep_sync(id)
+    if _run_async():
+        job = JobService.enqueue('deep_sync', {'store_id': id}, created_by=payload.get('sub'))
+        return jsonify(job.to_dict()), 202
+    with _clickup_sync_lease() as acquired:
+        if not acquired:
+            return jsonify(CLICKUP_SYNC_BUSY), 409
+        service = SyncService()
+        result = service.run_deep_sync(id)
     if "error" in result:
         return jsonify(result), 500
     return jsonify(result)
@@ -925,10 +791,26 @@ def deep_sync_store(payload, id):
 @require_auth
 @require_permission('manage_sync')
 def sync_stream(payload):
-    full = request.args.get('full', 'false').lower() == 'true'
-    vital_only = request.args.get('vital_only', 'false').lower() == 'true'
-    service = SyncService()
-    return Response(stream_with_context(service.run_sync_stream(force_full=full, vital_only=vital_only)), mimetype='text/event-stream')
+    """
+    Acompanha (SSE) o job de sync em segundo plano. Sem ?job_id, enfileira um novo
+    ou se conecta ao sync ja ativo com o mesmo modo (outro modo ativo responde 409);
+    a queda da conexao nao interrompe o job.
+    """
+    job_id = request.args.get('job_id', type=int)
+    if job_id:
+        job = BackgroundJob.query.get_or_404(job_id)
+    else:
+        full = request.args.get('full', 'false').lower() == 'true'
+        vital_only = request.args.get('vital_only', 'false').lower() == 'true'
+        try:
+            job = JobService.enqueue('sync', {'full': full, 'vital_only': vital_only}, created_by=payload.get('sub'))
+        except JobConflictError as e:
+            return jsonify({"error": str(e), "job": e.job.to_dict()}), 409
+
+    after_id = request.headers.get('Last-Event-ID', type=int) or 0
+    response = Response(stream_with_context(JobService.stream(job.id, after_id)), mimetype='text/event-stream')
+    response.headers['X-Job-Id'] = str(job.id)
+    return response
 
 @api_bp.route('/analyze/store/<int:id>', methods=['POST'])
 @require_auth
@@ -1030,24 +912,15 @@ def get_monthly_implantation_report(payload):
     import math
     
     # ── Configurações de meta (SystemConfig) ──
-    mrr_target = 180000.0
-    stores_target = 180
-    try:
-        cfg_mrr = SystemConfig.query.filter_by(key='annual_mrr_target').first()
-        cfg_stores = SystemConfig.query.filter_by(key='annual_stores_target').first()
-        if cfg_mrr:
-            mrr_target = float(cfg_mrr.value)
-        if cfg_stores:
-            stores_target = int(cfg_stores.value)
-    except Exception:
-        pass
+    mrr_target = ConfigService.get_float('annual_mrr_target', 180000.0)
+    stores_target = ConfigService.get_int('annual_stores_target', 180)
     
     w_matriz, w_filial = 1.0, 0.7
     SLA_TARGET = 90
     
     # ── Buscar lojas concluídas em 2026+ ──
-    all_stores = Store.query.all()
-    finished_stores = [s for s in all_stores if s.effective_finished_at and s.effective_finished_at.year >= 2026]
+    store_loader = Store.query.options(selectinload(Store.pauses))
+    finished_stores = store_loader.filter(Store.effective_end_at >= datetime(2026, 1, 1)).all()
     
     # ── Agrupar por mês ──
     grouped = defaultdict(list)
@@ -1077,7 +950,6 @@ def get_monthly_implantation_report(payload):
     ytd_mrr = sum(s['mrr'] for month in grouped.values() for s in month)
     ytd_stores = sum(len(month) for month in grouped.values())
     ytd_points = sum(s['points'] for month in grouped.values() for s in month)
-    from datetime import datetime
     from dateutil.relativedelta import relativedelta
     now = datetime.now()
     
@@ -1103,7 +975,11 @@ def get_monthly_implantation_report(payload):
     
     # ── WIP Overview (Board Stages) ──
     # Regra V6: WIP ignora programadas
-    wip_stores = [s for s in all_stores if s.status_norm == 'IN_PROGRESS' and not s.manual_finished_at and not s.is_scheduled]
+    wip_stores = store_loader.filter(
+        Store.status_norm == 'IN_PROGRESS',
+        Store.manual_finished_at.is_(None),
+        Store.unscheduled_clause(now),
+    ).all()
     wip_count = len(wip_stores)
     mrr_backlog = sum(s.valor_mensalidade or 0 for s in wip_stores)
     
@@ -1484,6 +1360,9 @@ def update_store_step(payload, store_id, step_id):
         else:
             step.total_time_days = 0.0
             
+        # Fim efetivo da loja pode depender das etapas (fallback de lojas DONE).
+        step.store.refresh_effective_dates()
+        _refresh_store_aggregates([step.store])
         db.session.commit()
         
         # Log da acao como auditoria se o payload possuir email/sub
@@ -1601,6 +1480,7 @@ def seed_default_configs():
             except Exception:
                 pass
     db.session.commit()
+    ConfigService.invalidate()
 
 @api_bp.route('/config', methods=['GET'])
 @require_auth
@@ -1667,22 +1547,6 @@ def update_config(payload):
             return jsonify({"error": "Chave de configuracao invalida."}), 400
         key = key.strip()
         default_meta = DEFAULT_CONFIG_MAP.get(key, {})
-        cfg = SystemConfig.query.filter_by(key=key).first()
-        if not cfg:
-            cfg = SystemConfig(
-                key=key,
-                description=default_meta.get("description", key),
-                category=default_meta.get("category", "general")
-            )
-            db.session.add(cfg)
-        elif default_meta:
-            if not cfg.description:
-                cfg.description = default_meta.get("description", cfg.description)
-            try:
-                if not cfg.category:
-                    cfg.category = default_meta.get("category", "general")
-            except Exception:
-                pass
 
         if val is None:
             normalized_value = ""
@@ -1691,9 +1555,10 @@ def update_config(payload):
         else:
             normalized_value = str(val)
 
-        if cfg.value != normalized_value:
+        previous_value = SystemConfig.query.with_entities(SystemConfig.value).filter_by(key=key).scalar()
+        if previous_value != normalized_value:
             changed_keys.append(key)
-        cfg.value = normalized_value
+        ConfigService.set(key, normalized_value, default_meta.get("description"), default_meta.get("category"))
         
     db.session.commit()
     if changed_keys:
@@ -1753,6 +1618,10 @@ def add_store_pause(payload, id):
             reason=reason
         )
         db.session.add(pause)
+        store = Store.query.get(id)
+        if store:
+            store.refresh_effective_dates()
+            _refresh_store_aggregates([store])
         db.session.commit()
         return jsonify({'status': 'created', 'id': pause.id}), 201
     except Exception as e:
@@ -1773,6 +1642,8 @@ def close_pause(payload, pause_id):
              return jsonify({'error': 'Data de fim deve ser maior que data de início'}), 400
              
         pause.end_date = end_date
+        pause.store.refresh_effective_dates()
+        _refresh_store_aggregates([pause.store])
         db.session.commit()
         return jsonify({'status': 'closed'}), 200
     except Exception as e:
@@ -1801,6 +1672,8 @@ def update_pause(payload, pause_id):
         if 'reason' in data:
             pause.reason = data['reason']
             
+        pause.store.refresh_effective_dates()
+        _refresh_store_aggregates([pause.store])
         db.session.commit()
         return jsonify({'status': 'updated'}), 200
     except Exception as e:
@@ -1814,7 +1687,11 @@ def delete_pause(payload, pause_id):
         pause = StorePause.query.get(pause_id)
         if not pause:
             return jsonify({'error': 'Pausa não encontrada'}), 404
+        store = pause.store
         db.session.delete(pause)
+        db.session.flush()
+        store.refresh_effective_dates()
+        _refresh_store_aggregates([store])
         db.session.commit()
         return jsonify({'status': 'deleted'}), 200
     except Exception as e:
@@ -1,6 +1,7 @@
 from flask import Blueprint, jsonify, request
 from app.models import db, SystemConfig, User, Role
-from app.services.security_service import require_auth, require_permission, hash_password, log_audit
+from app.services.security_service import require_auth, require_permission, hash_password, log_audit, invalidate_permission_cache
+from app.services.config_service import ConfigService
 from datetime import datetime
 
 admin_bp = Blueprint('admin', __name__, url_prefix='/api/admin')
@@ -29,13 +30,7 @@ def update_config(payload):
     
     if not key: return jsonify({"error": "Chave obrigatoria"}), 400
     
-    config = SystemConfig.query.filter_by(key=key).first()
-    if config:
-        config.value = str(value)
-    else:
-        config = SystemConfig(key=key, value=str(value), description=data.get('description'))
-        db.session.add(config)
-        
+    ConfigService.set(key, value, data.get('description'))
     db.session.commit()
     
     log_audit(
@@ -119,6 +114,7 @@ def update_user(payload, id):
     if 'name' in data: user.name = data['name']
     
     db.session.commit()
+    invalidate_permission_cache(user.id)
     
     log_audit(
         action="UPDATE_USER",
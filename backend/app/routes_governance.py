@@ -1,6 +1,8 @@
 from flask import Blueprint, jsonify, request
-from app.models import SyncRun, SyncError, SystemConfig
+from app.models import SyncRun, SyncError
+from app.services.config_service import ConfigService
 from app.services.audit_service import AuditService
+from app.services.clickup import ClickUpService
 from app.services.security_service import require_auth
 from datetime import datetime, timedelta
 
@@ -8,8 +10,7 @@ gov_bp = Blueprint('governance', __name__, url_prefix='/api')
 
 
 def _config_value(key, fallback):
-    cfg = SystemConfig.query.filter_by(key=key).first()
-    return cfg.value if cfg and cfg.value is not None else fallback
+    return ConfigService.get(key, fallback)
 
 
 @gov_bp.route('/sync/health', methods=['GET'])
@@ -78,6 +79,7 @@ def get_sync_health(payload):
             "vital_schedule": _config_value("sync_vital_schedule", "10:00,12:00,14:00,16:00,18:00"),
             "deep_schedule": _config_value("sync_deep_schedule", "03:00"),
         },
+        "clickup_client": ClickUpService.get_client_stats(),
         "recent_errors": [{
             "id": e.id,
             "msg": e.error_msg,
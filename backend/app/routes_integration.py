@@ -194,32 +194,15 @@ def get_monthly_integration_report(payload):
     from collections import defaultdict
     import statistics
     import math
-    from app.models import Store, IntegrationMetric, SystemConfig
+    from app.models import Store, IntegrationMetric
+    from app.services.config_service import ConfigService
     
     try:
         # ── Configurações de meta (SystemConfig) ──
-        mrr_target = 180000.0
-        stores_target = 180
-        try:
-            cfg_mrr = SystemConfig.query.filter_by(key='annual_mrr_target').first()
-            cfg_stores = SystemConfig.query.filter_by(key='annual_stores_target').first()
-            if cfg_mrr: mrr_target = float(cfg_mrr.value)
-            if cfg_stores: stores_target = int(cfg_stores.value)
-        except: pass
-        
-        SLA_TARGET = 60
-        try:
-            cfg_sla = SystemConfig.query.filter_by(key='sla_integration_days').first()
-            if cfg_sla: SLA_TARGET = int(cfg_sla.value)
-        except: pass
-
-        w_matriz, w_filial = 1.0, 0.7
-        try:
-            cfg_m = SystemConfig.query.filter_by(key='weight_matriz').first()
-            cfg_f = SystemConfig.query.filter_by(key='weight_filial').first()
-            if cfg_m: w_matriz = float(cfg_m.value)
-            if cfg_f: w_filial = float(cfg_f.value)
-        except: pass
+        mrr_target = ConfigService.get_float('annual_mrr_target', 180000.0)
+        stores_target = ConfigService.get_int('annual_stores_target', 180)
+        SLA_TARGET = ConfigService.get_int('sla_integration_days', 60)
+        w_matriz, w_filial = ConfigService.get_weights()
 
         # ── Buscar métricas concluídas em 2026+ ──
         metrics = IntegrationMetric.query.join(Store).filter(
@@ -476,9 +459,17 @@ def sync_integration_tasks(payload):
     Dispara sincronização manual apenas da fase de Integração.
     """
     from app.services.sync_service import SyncService
+    from app.services.job_service import JobService
+    from app.services.lease_service import LeaseService
+    if request.args.get('async', 'false').lower() == 'true':
+        job = JobService.enqueue('integration_sync', created_by=payload.get('sub'))
+        return jsonify(job.to_dict()), 202
     service = SyncService()
     try:
-        result = service.run_integration_sync()
+        with LeaseService.hold(LeaseService.CLICKUP_SYNC, wait_seconds=JobService.CLICKUP_LOCK_WAIT_SECONDS) as acquired:
+            if not acquired:
+                return jsonify({"error": "Outro sync do ClickUp esta em andamento. Tente novamente em instantes."}), 409
+            result = service.run_integration_sync()
         return jsonify(result), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -0,0 +1,65 @@
+from flask import Blueprint, Response, jsonify, request, stream_with_context
+from app.models import BackgroundJob
+from app.services.job_service import JobService, JobConflictError
+from app.services.security_service import require_auth, require_permission
+
+jobs_bp = Blueprint('jobs', __name__, url_prefix='/api/jobs')
+
+
+@jobs_bp.route('', methods=['GET'])
+@require_auth
+@require_permission('manage_sync')
+def list_jobs(payload):
+    """Jobs mais recentes (opcionalmente filtrados por tipo/status)."""
+    limit = min(int(request.args.get('limit', 20)), 100)
+    query = BackgroundJob.query
+    if request.args.get('type'):
+        query = query.filter(BackgroundJob.job_type == request.args['type'])
+    if request.args.get('status'):
+        query = query.filter(BackgroundJob.status == request.args['status'].upper())
+    return jsonify([job.to_dict() for job in query.order_by(BackgroundJob.id.desc()).limit(limit).all()])
+
+
+@jobs_bp.route('', methods=['POST'])
+@require_auth
+@require_permission('manage_sync')
+def create_job(payload):
+    """Enfileira um job ({"type": "...", "params": {...}}); devolve 202 com o job criado ou o ja ativo."""
+    data = request.get_json(silent=True) or {}
+    try:
+        job = JobService.enqueue(data.get('type'), data.get('params') or {}, created_by=payload.get('sub'))
+    except JobConflictError as e:
+        return jsonify({"error": str(e), "job": e.job.to_dict()}), 409
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(job.to_dict()), 202
+
+
+@jobs_bp.route('/<int:job_id>', methods=['GET'])
+@require_auth
+@require_permission('manage_sync')
+def get_job(payload, job_id):
+    return jsonify(BackgroundJob.query.get_or_404(job_id).to_dict())
+
+
+@jobs_bp.route('/<int:job_id>/events', methods=['GET'])
+@require_auth
+@require_permission('manage_sync')
+def get_job_events(payload, job_id):
+    """Log de progresso a partir do cursor ?after=<id> (polling sem SSE)."""
+    BackgroundJob.query.get_or_404(job_id)
+    events = JobService.events_since(job_id, request.args.get('after', 0, type=int))
+    return jsonify([{
+        "id": e.id,
+        "message": e.message,
+        "at": e.created_at.isoformat() if e.created_at else None,
+    } for e in events])
+
+
+@jobs_bp.route('/<int:job_id>/stream', methods=['GET'])
+@require_auth
+@require_permission('manage_sync')
+def stream_job(payload, job_id):
+    BackgroundJob.query.get_or_404(job_id)
+    after_id = request.headers.get('Last-Event-ID', type=int) or request.args.get('after', 0, type=int)
+    return Response(stream_with_context(JobService.stream(job_id, after_id)), mimetype='text/event-stream')
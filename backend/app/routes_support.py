@@ -3,10 +3,11 @@ from datetime import datetime
 
 from flask import Blueprint, current_app, jsonify, request
 
-from app.models import SupportContact, SupportConversation, db
+from app.models import Store, SupportContact, SupportConversation, db
+from app.services.config_service import ConfigService
 from app.services.event_processor_service import process_pending_zenvia_events
 from app.services.security_service import require_auth, require_permission
-from app.services.support_importer import import_support_files
+from app.services.support_importer import NameTokenIndex, import_support_files
 from app.services.support_metrics_service import (
     get_agent_performance,
     get_conversations,
@@ -89,12 +90,23 @@ def get_orphans(_payload):
         SupportContact.store_id.is_(None),
         SupportContact.linked_store_name.is_(None),
     ).limit(100).all()
-    return jsonify([{
-        "id": c.id,
-        "phone": c.phone,
-        "name": c.name,
-        "created_at": c.created_at_zenvia.isoformat() if c.created_at_zenvia else None,
-    } for c in contacts])
+
+    # Sugestao de vinculo: loja cujo nome casa com o do contato (mesmo criterio da importacao).
+    store_index = NameTokenIndex(
+        db.session.query(Store.id, Store.store_name).order_by(Store.id),
+        name_of=lambda row: row.store_name,
+    )
+    payload = []
+    for c in contacts:
+        suggestion = store_index.find(c.name) if c.name else None
+        payload.append({
+            "id": c.id,
+            "phone": c.phone,
+            "name": c.name,
+            "created_at": c.created_at_zenvia.isoformat() if c.created_at_zenvia else None,
+            "suggested_store": suggestion.store_name if suggestion else None,
+        })
+    return jsonify(payload)
 
 
 @support_bp.route("/api/support/messages", methods=["GET"])
@@ -131,18 +143,12 @@ def sync_data(_payload):
     try:
         results = process_pending_zenvia_events()
         sync_time = datetime.now().strftime("%d/%m/%Y %H:%M:%S")
-        from app.models import SystemConfig
-
-        config = SystemConfig.query.filter_by(key="last_support_sync").first()
-        if config:
-            config.value = sync_time
-        else:
-            db.session.add(SystemConfig(
-                key="last_support_sync",
-                value=sync_time,
-                category="webhooks",
-                description="Ultima sincronizacao manual de eventos de suporte",
-            ))
+        ConfigService.set(
+            "last_support_sync",
+            sync_time,
+            description="Ultima sincronizacao manual de eventos de suporte",
+            category="webhooks",
+        )
         db.session.commit()
         return jsonify({
             "status": "success",
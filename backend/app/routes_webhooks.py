@@ -4,10 +4,13 @@ import logging
 from flask import Blueprint, request, jsonify
 from datetime import datetime
 from sqlalchemy.exc import IntegrityError
-from app.models import db, ZenviaWebhookEvent, SystemConfig
+from app.models import db, ZenviaWebhookEvent, ClickUpWebhookEvent
 from app.services.security_service import require_auth, require_permission
+from app.services.config_service import ConfigService
 
 from app.services.clickup_integration_validator import ClickUpIntegrationValidator
+from app.services.clickup_webhook_service import ClickUpWebhookService
+from config import Config
 
 webhook_bp = Blueprint('webhook_bp', __name__)
 logger = logging.getLogger(__name__)
@@ -32,14 +35,63 @@ def run_clickup_validator():
         logger.error(f"[Validator Webhook] Erro ao executar validador: {str(e)}")
         return jsonify({"error": "Erro interno do servidor"}), 500
 
+@webhook_bp.route('/api/webhooks/clickup', methods=['POST'])
+def clickup_webhook():
+    # 1. Assinatura HMAC enviada pelo ClickUp em X-Signature.
+    raw_body = request.get_data()
+    secret = Config.CLICKUP_WEBHOOK_SECRET
+    if not secret:
+        if Config.IS_PRODUCTION:
+            logger.error("[ClickUp Webhook] Segredo ausente em producao. Configure CLICKUP_WEBHOOK_SECRET.")
+            return jsonify({"error": "Webhook nao configurado"}), 503
+    elif not ClickUpWebhookService.verify_signature(raw_body, request.headers.get("X-Signature"), secret):
+        return jsonify({"error": "Nao autorizado"}), 401
+
+    payload = request.get_json(silent=True)
+    if not payload:
+        return jsonify({"error": "Payload ausente"}), 400
+
+    event_type = payload.get('event')
+    task_id = payload.get('task_id')
+    if not event_type:
+        return jsonify({"error": "Missing event type"}), 400
+    if event_type not in ClickUpWebhookService.SUPPORTED_EVENTS:
+        return jsonify({"message": "Evento ignorado"}), 200
+    if not task_id:
+        return jsonify({"error": "Missing task id"}), 400
+
+    # 2. Persiste rapido e garante idempotencia pela chave do evento.
+    try:
+        new_event = ClickUpWebhookEvent(
+            event_key=ClickUpWebhookService.event_key(payload, raw_body),
+            event_type=event_type,
+            task_id=str(task_id),
+            webhook_id=payload.get('webhook_id'),
+            raw_payload=json.dumps(payload),
+            created_at=datetime.utcnow()
+        )
+        db.session.add(new_event)
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        # Reentrega do ClickUp: responde 200 para encerrar as tentativas.
+        return jsonify({"message": "Evento ja processado"}), 200
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"[ClickUp Webhook] Erro ao salvar evento: {str(e)}")
+        return jsonify({"error": "Erro interno do servidor"}), 500
+
+    # 3. O job clickup_webhook_apply_job aplica os eventos com processed_at=None.
+
+    return jsonify({"message": "Evento recebido com sucesso"}), 200
+
 @webhook_bp.route('/api/webhooks/zenvia', methods=['POST'])
 def zenvia_webhook():
     # 1. Validacao do token de seguranca.
     token = request.headers.get("X-Zenvia-Token")
     
     # Busca o token no banco ou usa variavel de ambiente como fallback.
-    db_token = SystemConfig.query.filter_by(key='webhook_token').first()
-    valid_token = db_token.value if db_token and db_token.value else os.environ.get("ZENVIA_WEBHOOK_TOKEN", "my-secret-token")
+    valid_token = ConfigService.get('webhook_token') or os.environ.get("ZENVIA_WEBHOOK_TOKEN", "my-secret-token")
     if os.environ.get("FLASK_ENV") == "production" and valid_token == "my-secret-token":
         logger.error("[Zenvia Webhook] Token default detectado em producao. Configure ZENVIA_WEBHOOK_TOKEN.")
         return jsonify({"error": "Webhook nao configurado"}), 503
@@ -1,10 +1,38 @@
 from flask_apscheduler import APScheduler
 import logging
 from datetime import datetime
+from functools import wraps
+from config import Config
 
 scheduler = APScheduler()
 logger = logging.getLogger(__name__)
 
+# Tempo que um job cron segura o lease apos terminar: as outras instancias disparam
+# no mesmo minuto e nao devem repetir o job so porque chegaram depois do fim.
+CRON_HOLD_SECONDS = 300
+
+def exclusive(lock_name, ttl_seconds=300, hold_seconds=0):
+    """
+    Garante que o job rode em uma unica instancia por vez (lease em scheduler_leases).
+    As demais instancias pulam a execucao; se o dono cair, o lease expira em ttl_seconds.
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with scheduler.app.app_context():
+                from app.services.lease_service import LeaseService
+
+                try:
+                    with LeaseService.hold(lock_name, ttl_seconds, hold_seconds) as acquired:
+                        if not acquired:
+                            logger.debug(f"Lease '{lock_name}' com outra instancia. Pulando {func.__name__}.")
+                            return None
+                        return func(*args, **kwargs)
+                except Exception as e:
+                    logger.error(f"Erro no lease '{lock_name}' do job {func.__name__}: {e}")
+        return wrapper
+    return decorator
+
 def init_scheduler(app):
     """Inicializa o agendador com a aplicação Flask."""
     if not app.config.get('SCHEDULER_API_ENABLED'):
@@ -49,52 +77,129 @@ def init_scheduler(app):
             logger.error(f"Erro ao verificar warm-up sync: {e}")
 
 @scheduler.task('cron', id='sync_vital_job', hour='10,12,14,16,18', minute=0)
+@exclusive('sync_vital_job', hold_seconds=CRON_HOLD_SECONDS)
 def scheduled_vital_sync():
     """Job para sincronismo vital (rápido) durante o dia."""
+    from app.services.job_service import JobService
+    from app.services.lease_service import LeaseService
     from app.services.sync_service import SyncService
-    from app.models import SyncState
     
     # Usar o app context do scheduler
     with scheduler.app.app_context():
-        # Proteção contra concorrência
-        state = SyncState.query.get(1)
-        if state and state.in_progress:
-            logger.info("⚠️ Sync já em progresso. Pulando agendamento.")
-            return
-
-        logger.info("🚀 Iniciando SYNC VITAL agendado...")
-        sync_service = SyncService()
-        try:
-            for _ in sync_service.run_sync_stream(force_full=False, vital_only=True):
-                pass
-            logger.info("✅ SYNC VITAL agendado finalizado.")
-        except Exception as e:
-            logger.error(f"Erro no SYNC VITAL agendado: {e}")
+        # Proteção contra concorrência: um unico sync do ClickUp por vez entre instancias.
+        # Espera um pouco: webhooks e jobs manuais seguram o lease por pouco tempo.
+        with LeaseService.hold(LeaseService.CLICKUP_SYNC, wait_seconds=JobService.CLICKUP_LOCK_WAIT_SECONDS) as acquired:
+            if not acquired:
+                logger.info("⚠️ Sync já em progresso. Pulando agendamento.")
+                return
+
+            logger.info("🚀 Iniciando SYNC VITAL agendado...")
+            sync_service = SyncService()
+            try:
+                for _ in sync_service.run_sync_stream(force_full=False, vital_only=True):
+                    pass
+                logger.info("✅ SYNC VITAL agendado finalizado.")
+            except Exception as e:
+                logger.error(f"Erro no SYNC VITAL agendado: {e}")
 
 @scheduler.task('cron', id='sync_deep_job', hour=3, minute=0)
+@exclusive('sync_deep_job', hold_seconds=CRON_HOLD_SECONDS)
 def scheduled_deep_sync():
     """Job para sincronismo profundo (pesado) na madrugada."""
-    from app.services.sync_service import SyncService
-    from app.models import SyncState
+    from app.services.job_service import JobService
+    from app.services.lease_service import LeaseService
+    from app.services.sync_service import SyncService
     
     with scheduler.app.app_context():
-        # Proteção contra concorrência
-        state = SyncState.query.get(1)
-        if state and state.in_progress:
-            logger.info("⚠️ Sync já em progresso. Pulando agendamento.")
-            return
+        # Proteção contra concorrência: um unico sync do ClickUp por vez entre instancias.
+        # Espera um pouco: webhooks e jobs manuais seguram o lease por pouco tempo.
+        with LeaseService.hold(LeaseService.CLICKUP_SYNC, wait_seconds=JobService.CLICKUP_LOCK_WAIT_SECONDS) as acquired:
+            if not acquired:
+                logger.info("⚠️ Sync já em progresso. Pulando agendamento.")
+                return
+
+            logger.info("🚀 Iniciando SYNC DEEP agendado...")
+            sync_service = SyncService()
+            try:
+                for _ in sync_service.run_sync_stream(force_full=False, vital_only=False):
+                    pass
+                logger.info("✅ SYNC DEEP agendado finalizado.")
+            except Exception as e:
+                logger.error(f"Erro no SYNC DEEP agendado: {e}")
 
-        logger.info("🚀 Iniciando SYNC DEEP agendado...")
-        sync_service = SyncService()
+
+@scheduler.task('cron', id='store_risk_sweep_job', hour=0, minute=30)
+@exclusive('store_risk_sweep_job', hold_seconds=CRON_HOLD_SECONDS)
+def scheduled_store_risk_sweep():
+    """Job noturno que recalcula o score de risco de todas as lojas (decaimento por tempo)."""
+    with scheduler.app.app_context():
         try:
-            for _ in sync_service.run_sync_stream(force_full=False, vital_only=False):
-                pass
-            logger.info("✅ SYNC DEEP agendado finalizado.")
+            from app.services.risk_service import StoreRiskService
+
+            result = StoreRiskService().sweep()
+            logger.info(f"Varredura de risco executada: {result} lojas")
         except Exception as e:
-            logger.error(f"Erro no SYNC DEEP agendado: {e}")
+            logger.error(f"Erro na varredura de risco: {e}")
+
+
+@scheduler.task('interval', id='clickup_webhook_apply_job', seconds=Config.CLICKUP_WEBHOOK_APPLY_SECONDS, max_instances=1, coalesce=True)
+@exclusive('clickup_webhook_apply_job')
+def scheduled_clickup_webhook_apply():
+    """Job que aplica os webhooks pendentes do ClickUp (sync incremental por push)."""
+    from app.models import ClickUpWebhookEvent
+    from app.services.lease_service import LeaseService
+
+    with scheduler.app.app_context():
+        try:
+            if not ClickUpWebhookEvent.query.filter_by(processed_at=None).first():
+                return
+            # Um unico escritor: durante o polling os eventos aguardam na fila.
+            with LeaseService.hold(LeaseService.CLICKUP_SYNC) as acquired:
+                if not acquired:
+                    return
+
+                from app.services.clickup_webhook_service import ClickUpWebhookService
+                result = ClickUpWebhookService().process_pending()
+                logger.info(f"Webhooks ClickUp aplicados: {result}")
+        except Exception as e:
+            logger.error(f"Erro ao aplicar webhooks ClickUp: {e}")
+
+
+@scheduler.task('interval', id='zenvia_events_job', seconds=Config.ZENVIA_EVENTS_PROCESS_SECONDS, max_instances=1, coalesce=True)
+@exclusive('zenvia_events_job')
+def scheduled_zenvia_events():
+    """Job que processa os webhooks pendentes da Zenvia (dashboard de suporte quase em tempo real)."""
+    from app.models import ZenviaWebhookEvent
+
+    with scheduler.app.app_context():
+        try:
+            if not ZenviaWebhookEvent.query.filter_by(processed_at=None).first():
+                return
+
+            from app.services.event_processor_service import process_pending_zenvia_events
+            result = process_pending_zenvia_events()
+            logger.info(f"Eventos Zenvia processados: {result}")
+        except Exception as e:
+            logger.error(f"Erro ao processar eventos Zenvia: {e}")
+
+
+@scheduler.task('interval', id='background_jobs_job', seconds=Config.JOB_POLL_SECONDS, max_instances=1, coalesce=True)
+@exclusive('background_jobs_job')
+def scheduled_background_jobs():
+    """Job que assume jobs parados na fila e encerra os que perderam o heartbeat."""
+    with scheduler.app.app_context():
+        try:
+            from app.services.job_service import JobService
+
+            result = JobService.recover()
+            if any(result.values()):
+                logger.info(f"Jobs em segundo plano: {result}")
+        except Exception as e:
+            logger.error(f"Erro na varredura de jobs em segundo plano: {e}")
 
 
 @scheduler.task('cron', id='notification_sla_alerts_job', hour='9,15', minute=15)
+@exclusive('notification_sla_alerts_job', hold_seconds=CRON_HOLD_SECONDS)
 def scheduled_sla_notifications():
     """Job para alertas Slack de lojas em risco ou acima do SLA."""
     with scheduler.app.app_context():
@@ -108,6 +213,7 @@ def scheduled_sla_notifications():
 
 
 @scheduler.task('cron', id='notification_weekly_summary_job', day_of_week='mon', hour=9, minute=30)
+@exclusive('notification_weekly_summary_job', hold_seconds=CRON_HOLD_SECONDS)
 def scheduled_weekly_summary_notification():
     """Job para resumo semanal Slack."""
     with scheduler.app.app_context():
@@ -121,6 +227,7 @@ def scheduled_weekly_summary_notification():
 
 
 @scheduler.task('cron', id='notification_goal_check_job', hour=18, minute=30)
+@exclusive('notification_goal_check_job', hold_seconds=CRON_HOLD_SECONDS)
 def scheduled_goal_notification():
     """Job para avisar quando metas mensais forem batidas."""
     with scheduler.app.app_context():
@@ -134,19 +241,16 @@ def scheduled_goal_notification():
 
 
 @scheduler.task('cron', id='notification_clickup_docs_job', hour=10, minute=30)
+@exclusive('notification_clickup_docs_job', hold_seconds=CRON_HOLD_SECONDS)
 def scheduled_clickup_docs_notification():
     """Job para lembrar atualizacao da documentacao no card principal."""
     with scheduler.app.app_context():
         try:
-            from app.models import SystemConfig
+            from app.services.config_service import ConfigService
             from app.services.notification_service import send_clickup_docs_reminder
             from app.services.sync_service import SyncService
 
-            cfg = SystemConfig.query.filter_by(key='clickup_docs_check_limit').first()
-            try:
-                limit = int(cfg.value) if cfg and cfg.value else 50
-            except (TypeError, ValueError):
-                limit = 50
+            limit = ConfigService.get_int('clickup_docs_check_limit', 50)
 
             sync_result = SyncService().sync_parent_card_documentation(limit=limit)
             alert_result = send_clickup_docs_reminder(force=False)
@@ -172,27 +172,43 @@ class OperationalAIService:
             
             def fetch_comments_for_step(step_obj):
                 try:
-                    c = self.clickup.get_task_comments(step_obj.clickup_task_id)
-                    return (step_obj.step_name, c)
+                    # Sem app context na thread: o cache e lido/gravado pela thread principal.
+                    response = self.clickup._get(f"task/{step_obj.clickup_task_id}/comment")
+                    return (step_obj, response)
                 except Exception as e:
                     logger.error(f"[Gemini] Erro comments subtask {step_obj.step_name}: {e}")
-                    return (step_obj.step_name, None)
+                    return (step_obj, None)
                     
             # Vamos puxar comentários das ativas ou estratégicas para não jogar a API no limite
             relevant_steps = [st for st in all_steps if st.status not in ['closed', 'concluido', 'done'] or st.idle_days > 3 or 'integração' in st.step_name.lower()]
+            relevant_steps = [st for st in relevant_steps if st.clickup_task_id]
             
+            # Cache persistente: so vai ao ClickUp para etapas alteradas desde a ultima busca.
+            cached = self.clickup.response_cache.get_many([st.clickup_task_id for st in relevant_steps], 'comments')
+            step_results = [(st, cached[st.clickup_task_id]) for st in relevant_steps if st.clickup_task_id in cached]
+            missing = [st for st in relevant_steps if st.clickup_task_id not in cached]
+            
+            fetched = {}
             with concurrent.futures.ThreadPoolExecutor(max_workers=8) as executor:
-                future_to_step = {executor.submit(fetch_comments_for_step, st): st for st in relevant_steps}
+                future_to_step = {executor.submit(fetch_comments_for_step, st): st for st in missing}
                 for future in concurrent.futures.as_completed(future_to_step):
-                    step_name, step_comments = future.result()
-                    if step_comments:
-                        # Filtrar bots (ignora usuários automáticos)
-                        real_comments = [c for c in step_comments if 'ClickUp' not in c.get('user', {}).get('username', '')]
-                        for c in real_comments[:3]: # Mantém os 3 mais recentes por etapa
-                            text = c.get('comment_text', '').replace('\n', ' ')
-                            user = c.get('user', {}).get('username', 'Equipe')
-                            date_str = datetime.fromtimestamp(int(c.get('date', 0))/1000).strftime('%d/%m') if c.get('date') else ''
-                            store_info["comments_ocean"].append(f"[{date_str}] Na etapa '{step_name}', {user} disse: {text}")
+                    step_obj, response = future.result()
+                    if response is not None:
+                        fetched[step_obj.clickup_task_id] = response
+                        step_results.append((step_obj, response))
+            self.clickup.response_cache.put_many('comments', fetched)
+            
+            for step_obj, response in step_results:
+                step_name = step_obj.step_name
+                step_comments = (response or {}).get('comments', [])
+                if step_comments:
+                    # Filtrar bots (ignora usuários automáticos)
+                    real_comments = [c for c in step_comments if 'ClickUp' not in c.get('user', {}).get('username', '')]
+                    for c in real_comments[:3]: # Mantém os 3 mais recentes por etapa
+                        text = c.get('comment_text', '').replace('\n', ' ')
+                        user = c.get('user', {}).get('username', 'Equipe')
+                        date_str = datetime.fromtimestamp(int(c.get('date', 0))/1000).strftime('%d/%m') if c.get('date') else ''
+                        store_info["comments_ocean"].append(f"[{date_str}] Na etapa '{step_name}', {user} disse: {text}")
 
             # Comentários do Card Pai (Loja Principal)
             try:
@@ -208,6 +224,13 @@ class OperationalAIService:
                 logger.error(f"[Gemini] Erro ao ler comments da loja matriz: {e}")
                 
             data.append(store_info)
+
+        # Persiste as respostas novas no cache de comentarios do ClickUp.
+        try:
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.warning(f"[Gemini] Falha ao gravar cache de comentarios: {e}")
         return data
 
     def _get_team_performance_summary(self):
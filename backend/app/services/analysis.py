@@ -1,78 +1,28 @@
-from app.models import db, TaskStep, Store
+from app.models import Store
+from app.services.step_stats_service import StepStatsService
 from config import Config
-from datetime import datetime
 from datetime import datetime, timedelta
-import statistics
-import numpy as np # Se nao tiver numpy, fazemos manual com statistics.quantiles
 
 class AnalysisService:
     def __init__(self):
         self.step_stats = {} # { 'TREINAMENTO': { 'avg': 5.0, 'std': 1.2 } }
+        self.stats_loaded = False
         self.ensure_stats_loaded()
 
     def ensure_stats_loaded(self):
         """
-        Carrega dados históricos, remove outliers e calcula estatísticas ajustadas.
+        Carrega as estatisticas por lista de etapas ja calculadas (StepStatsService).
+        O recalculo vetorizado acontece apos o sync, nao na requisicao.
         """
-        # We only look at closed steps for training
-        steps = TaskStep.query.filter(TaskStep.total_time_days > 0).all()
-        
-        # Group by list name
-        grouped = {}
-        for s in steps:
-            if not s.step_list_name: continue
-            if s.step_list_name not in grouped: grouped[s.step_list_name] = []
-            grouped[s.step_list_name].append(s.total_time_days)
-            
-        # Calcular estatísticas
-        for name, values in grouped.items():
-            if len(values) < 5:
-                # Dados insuficientes, fallback seguro
-                avg = sum(values)/len(values) if values else 5.0
-                std = 0.0
-                p50, p75 = avg, avg * 1.2
-            else:
-                # 1. Filtro de Outliers (IQR Method ou 2*STD)
-                # Vamos usar corte simples: remover quem for > 2x a média inicial se a média for alta
-                # Ou usar quantiles
-                try:
-                    quantiles = statistics.quantiles(values, n=4)
-                    q1 = quantiles[0]
-                    q3 = quantiles[2]
-                    iqr = q3 - q1
-                    upper_bound = q3 + (1.5 * iqr)
-                    
-                    # Filtered values
-                    clean_values = [v for v in values if v <= upper_bound]
-                    if not clean_values: clean_values = values # Fallback
-                    
-                    avg = statistics.mean(clean_values)
-                    std = statistics.stdev(clean_values) if len(clean_values) > 1 else 0
-                    
-                    # Recalcular quantiles nos dados limpos para P50/P75
-                    clean_quantiles = statistics.quantiles(clean_values, n=4)
-                    p50 = clean_quantiles[1] # Median
-                    p75 = clean_quantiles[2]
-                except:
-                   # Fallback se statistics.quantiles falhar (py < 3.8) ou erro math
-                   avg = statistics.mean(values)
-                   std = statistics.stdev(values) if len(values) > 1 else 0
-                   p50 = avg
-                   p75 = avg + std
-                
-            self.step_stats[name] = {
-                'avg': avg,
-                'std': std,
-                'p50': p50,
-                'p75': p75,
-                'count': len(values)
-            }
+        self.step_stats = StepStatsService.get_stats()
+        self.stats_loaded = True
 
-    def predict_store_completion(self, store_id):
+    def predict_store_completion(self, store_id, store=None):
         """
         Prevê a data de conclusão e o perfil de risco para uma loja.
+        `store` evita a releitura quando o chamador ja carregou a loja (com etapas).
         """
-        store = Store.query.get(store_id)
+        store = store if store is not None else Store.query.get(store_id)
         if not store: return None
         if store.effective_finished_at: 
             return {
@@ -83,7 +33,8 @@ class AnalysisService:
             }
 
         # Refresh stats just in case (or rely on cached self.step_stats)
-        if not self.step_stats: self.ensure_stats_loaded()
+        # Sem historico o dict fica vazio: o flag evita recarregar a cada loja.
+        if not self.stats_loaded: self.ensure_stats_loaded()
 
         remaining_days = 0
         details = []
@@ -1,4 +1,5 @@
-from app.models import db, Store, SystemConfig
+from app.models import db, Store
+from app.services.config_service import ConfigService
 from sqlalchemy import func, or_
 from datetime import datetime, timedelta
 import json
@@ -12,13 +13,7 @@ class AnalystsReportService:
 
     @staticmethod
     def _get_goal_metrics():
-        annual_mrr = 180000.0
-        config_mrr = SystemConfig.query.filter_by(key='annual_mrr_target').first()
-        if config_mrr:
-            try:
-                annual_mrr = float(config_mrr.value)
-            except ValueError:
-                pass
+        annual_mrr = ConfigService.get_float('annual_mrr_target', 180000.0)
         meta_semestral_mrr = annual_mrr / 2.0
 
         implantadores_query = db.session.query(Store.implantador).distinct().filter(
@@ -474,12 +469,9 @@ class AnalystsReportService:
                      projected_mrr += (s.valor_mensalidade or 0.0)
 
         # Buscar Limit/Meta
-        c_target = SystemConfig.query.filter_by(key="annual_mrr_target").first()
-        cs_target = SystemConfig.query.filter_by(key="monthly_cs_churn_limit").first()
-        
-        net_mrr_target = float(c_target.value) / 2 if c_target else 100000.0 # Ex: Semestral 100k
+        net_mrr_target = ConfigService.get_float('annual_mrr_target', 200000.0) / 2 # Ex: Semestral 100k
         
-        cs_churn_monthly_limit = float(cs_target.value) if cs_target else 5000.0
+        cs_churn_monthly_limit = ConfigService.get_float('monthly_cs_churn_limit', 5000.0)
         # Adaptar churn target pelo período. (Se mensal, assume cs_churn_monthly_limit.)
         # Por simplificação, passamos o base e o frontend calcula ou ajustamos por dt.
         months_in_period = 1
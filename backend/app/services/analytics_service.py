@@ -1,8 +1,11 @@
-from app.models import db, Store, TaskStep, MetricsSnapshot, MetricsSnapshotDaily, SystemConfig
+from app.models import db, Store, TaskStep, MetricsSnapshot, MetricsSnapshotDaily
 from sqlalchemy import func, case, desc, and_, or_
 from datetime import datetime, timedelta, date
 import collections
 from app.services.scoring_service import ScoringService
+from app.services.risk_service import StoreRiskService
+from app.services.rollup_service import MonthlyRollupService
+from app.services.config_service import ConfigService
 
 # Filtro global: só considerar lojas concluídas a partir de 2026
 DATA_CUTOFF = datetime(2026, 1, 1)
@@ -117,17 +120,17 @@ class AnalyticsService:
             Store.status_norm == 'IN_PROGRESS',
             Store.manual_finished_at.is_(None)
         ).all()
-        # 7. Risco Médio (Calculado via ScoringService)
+        # 7. Risco Médio (score materializado em store_risk)
         in_progress_stores = query.filter(
             Store.status_norm == 'IN_PROGRESS',
             Store.manual_finished_at.is_(None)
         ).all()
         avg_risk = 0
         if in_progress_stores:
+            risk_by_store = StoreRiskService().get_many(in_progress_stores)
             total_risk = 0
             for s in in_progress_stores:
-                risk_data = ScoringService.calculate_risk_score(s)
-                total_risk += risk_data['total']
+                total_risk += risk_by_store[s.id]['total']
             avg_risk = round(total_risk / len(in_progress_stores), 1)
 
         # 8. Contagem Matriz vs Filial (WIP)
@@ -144,14 +147,7 @@ class AnalyticsService:
         ).count()
 
         # 9. Cálculo de Pontos (Entregues vs WIP)
-        w_matriz = 1.0
-        w_filial = 0.7
-        try:
-            cfg_m = SystemConfig.query.filter_by(key='weight_matriz').first()
-            cfg_f = SystemConfig.query.filter_by(key='weight_filial').first()
-            if cfg_m: w_matriz = float(cfg_m.value)
-            if cfg_f: w_filial = float(cfg_f.value)
-        except: pass
+        w_matriz, w_filial = ConfigService.get_weights()
 
         total_points_done = 0
         done_types = throughput_query.with_entities(Store.tipo_loja).all()
@@ -163,17 +159,8 @@ class AnalyticsService:
         for s in wip_types:
             total_points_wip += w_matriz if s.tipo_loja == 'Matriz' else w_filial
 
-        meta_mrr_anual = 180000.0
-        meta_lojas_anual = 180
-        try:
-            cfg_meta_mrr = SystemConfig.query.filter_by(key="annual_mrr_target").first()
-            cfg_meta_lojas = SystemConfig.query.filter_by(key="annual_stores_target").first()
-            if cfg_meta_mrr:
-                meta_mrr_anual = float(cfg_meta_mrr.value)
-            if cfg_meta_lojas:
-                meta_lojas_anual = int(float(cfg_meta_lojas.value))
-        except (TypeError, ValueError):
-            pass
+        meta_mrr_anual = ConfigService.get_float('annual_mrr_target', 180000.0)
+        meta_lojas_anual = ConfigService.get_int('annual_stores_target', 180)
 
         ano_atual = datetime.now().year
         inicio_ano = datetime(ano_atual, 1, 1)
@@ -258,81 +245,38 @@ class AnalyticsService:
         inicio_ano_atual = datetime(datetime.now().year, 1, 1)
         query_start_date_meta = min(query_start_date, inicio_ano_atual)
         
-        # 2. Buscar lojas concluídas desde a data de corte
-        finished_stores = db.session.query(Store).filter(
-            or_(Store.status_norm == 'DONE', Store.manual_finished_at.isnot(None))
-        )
-
-        if implantador:
-            finished_stores = finished_stores.filter(Store.implantador == implantador)
-        
-        finished_stores = finished_stores.filter(
-            or_(
-                and_(Store.manual_finished_at.isnot(None), Store.manual_finished_at >= query_start_date_meta),
-                and_(Store.manual_finished_at.is_(None), Store.status_norm == 'DONE', Store.finished_at >= query_start_date_meta)
-            )
-        ).with_entities(
-            Store.finished_at,
-            Store.manual_finished_at,
-            Store.end_real_at,
-            Store.start_real_at,
-            Store.created_at,
-            Store.tempo_contrato,
-            Store.tipo_loja,
-            Store.valor_mensalidade
-        ).all()
+        # 2. Entregas pre-agregadas por mes (monthly_delivery_rollup) desde a data de corte
+        rollup_rows = MonthlyRollupService.read(start_month=query_start_date_meta.date(), implantador=implantador)
         
         # 3. Buscar Pesos
-        w_matriz = 1.0
-        w_filial = 0.7
-        meta_mrr_anual = 180000.0
-        meta_lojas_anual = 180
-        try:
-            cfg_m = SystemConfig.query.filter_by(key='weight_matriz').first()
-            cfg_f = SystemConfig.query.filter_by(key='weight_filial').first()
-            cfg_meta_mrr = SystemConfig.query.filter_by(key="annual_mrr_target").first()
-            cfg_meta_lojas = SystemConfig.query.filter_by(key="annual_stores_target").first()
-            if cfg_m: w_matriz = float(cfg_m.value)
-            if cfg_f: w_filial = float(cfg_f.value)
-            if cfg_meta_mrr: meta_mrr_anual = float(cfg_meta_mrr.value)
-            if cfg_meta_lojas: meta_lojas_anual = int(float(cfg_meta_lojas.value))
-        except (TypeError, ValueError):
-            pass
+        w_matriz, w_filial = ConfigService.get_weights()
+        meta_mrr_anual = ConfigService.get_float('annual_mrr_target', 180000.0)
+        meta_lojas_anual = ConfigService.get_int('annual_stores_target', 180)
 
         # 4. Popular dados
         entregas_antes_da_janela = 0
         mrr_antes_da_janela = 0.0
-        for s in finished_stores:
-            end = s.manual_finished_at or s.end_real_at or s.finished_at
-            if not end: continue
-            
-            month_key = end.strftime('%Y-%m')
+        for r in rollup_rows:
+            month_key = r.month.strftime('%Y-%m')
 
-            if end < query_start_date:
-                if end.year == datetime.now().year:
-                    entregas_antes_da_janela += 1
-                    mrr_antes_da_janela += float(s.valor_mensalidade or 0)
+            if r.month < query_start_date.date():
+                if r.month.year == datetime.now().year:
+                    entregas_antes_da_janela += r.delivered_count
+                    mrr_antes_da_janela += float(r.mrr or 0)
                 continue
             
-            # Se a loja caiu num mês que está no nosso range, contabiliza
+            # Se o mes esta no nosso range, contabiliza
             if month_key in trends:
-                trends[month_key]['count'] += 1
-                trends[month_key]['total_mrr'] += float(s.valor_mensalidade or 0)
+                trends[month_key]['count'] += r.delivered_count
+                trends[month_key]['total_mrr'] += float(r.mrr or 0)
                 
                 # Pontos
-                weight = w_matriz if s.tipo_loja == 'Matriz' else w_filial
-                trends[month_key]['total_points'] += weight
+                weight = w_matriz if r.tipo_loja == 'Matriz' else w_filial
+                trends[month_key]['total_points'] += weight * r.delivered_count
                 
-                # Cycle Time
-                start = s.start_real_at or s.created_at
-                if start:
-                    days = (end - start).days
-                    trends[month_key]['total_days'] += max(0, days)
-                    
-                    # OTD
-                    contract = s.tempo_contrato or 90
-                    if days <= contract:
-                        trends[month_key]['on_time'] += 1
+                # Cycle Time e OTD
+                trends[month_key]['total_days'] += r.cycle_days_sum or 0
+                trends[month_key]['on_time'] += r.on_time_count or 0
 
         # 5. Formatar para lista final
         result = []
@@ -372,8 +316,8 @@ class AnalyticsService:
         if not year:
             year = datetime.now().year
             
-        mrr_target = float(SystemConfig.query.filter_by(key="annual_mrr_target").first().value if SystemConfig.query.filter_by(key="annual_mrr_target").first() else 180000)
-        stores_target = int(SystemConfig.query.filter_by(key="annual_stores_target").first().value if SystemConfig.query.filter_by(key="annual_stores_target").first() else 180)
+        mrr_target = ConfigService.get_float('annual_mrr_target', 180000.0)
+        stores_target = ConfigService.get_int('annual_stores_target', 180)
 
         # Iniciar dicionário para todos os 12 meses
         trends = collections.OrderedDict()
@@ -386,38 +330,13 @@ class AnalyticsService:
                 'total_days': 0
             }
 
-        # Lojas finalizadas no ano
-        start_date = datetime(year, 1, 1)
-        end_date = datetime(year, 12, 31, 23, 59, 59)
-        
-        finished_stores = db.session.query(Store).filter(
-            or_(
-                and_(Store.manual_finished_at.isnot(None), Store.manual_finished_at >= start_date, Store.manual_finished_at <= end_date),
-                and_(Store.manual_finished_at.is_(None), Store.status_norm == 'DONE', Store.finished_at >= start_date, Store.finished_at <= end_date)
-            )
-        ).with_entities(
-            Store.finished_at,
-            Store.manual_finished_at,
-            Store.end_real_at,
-            Store.start_real_at,
-            Store.created_at,
-            Store.valor_mensalidade
-        ).all()
-
-        for s in finished_stores:
-            end = s.manual_finished_at or s.end_real_at or s.finished_at
-            if not end: continue
-            
-            month_key = end.strftime('%Y-%m')
-            
+        # Entregas do ano pre-agregadas por mes
+        for r in MonthlyRollupService.read(start_month=date(year, 1, 1), end_month=date(year, 12, 1)):
+            month_key = r.month.strftime('%Y-%m')
             if month_key in trends:
-                trends[month_key]['stores_completed'] += 1
-                trends[month_key]['mrr_added'] += float(s.valor_mensalidade or 0)
-                
-                start = s.start_real_at or s.created_at
-                if start:
-                    days = (end - start).days
-                    trends[month_key]['total_days'] += max(0, days)
+                trends[month_key]['stores_completed'] += r.delivered_count
+                trends[month_key]['mrr_added'] += float(r.mrr or 0)
+                trends[month_key]['total_days'] += r.cycle_days_sum or 0
 
         # Montar resultado cumulativo
         result = []
@@ -497,14 +416,7 @@ class AnalyticsService:
         stores = query.all()
         
         # Buscar Pesos
-        w_matriz = 1.0
-        w_filial = 0.7
-        try:
-            cfg_m = SystemConfig.query.filter_by(key='weight_matriz').first()
-            cfg_f = SystemConfig.query.filter_by(key='weight_filial').first()
-            if cfg_m: w_matriz = float(cfg_m.value)
-            if cfg_f: w_filial = float(cfg_f.value)
-        except: pass
+        w_matriz, w_filial = ConfigService.get_weights()
 
         ranking = collections.defaultdict(lambda: {
             'wip': 0, 'done': 0, 'total_days': 0, 'on_time': 0, 
@@ -647,15 +559,7 @@ class AnalyticsService:
         stores = Store.query.filter_by(implantador=implantador_name).all()
         
         # Buscar Pesos
-        w_matriz = 1.0
-        w_filial = 0.7
-        try:
-            from app.models import SystemConfig
-            cfg_m = SystemConfig.query.filter_by(key='weight_matriz').first()
-            cfg_f = SystemConfig.query.filter_by(key='weight_filial').first()
-            if cfg_m: w_matriz = float(cfg_m.value)
-            if cfg_f: w_filial = float(cfg_f.value)
-        except: pass
+        w_matriz, w_filial = ConfigService.get_weights()
 
         # Calcular Métricas Agregadas para o Score
         stats = {
@@ -841,18 +745,8 @@ class AnalyticsService:
         - Redes = agrupamento por rede.
         """
         # Configuracoes de capacidade.
-        w_matriz = 1.0
-        w_filial = 0.7
-        max_points = 30.0 # Valor padrao.
-        
-        try:
-            cfg_m = SystemConfig.query.filter_by(key='weight_matriz').first()
-            cfg_f = SystemConfig.query.filter_by(key='weight_filial').first()
-            cfg_max = SystemConfig.query.filter_by(key='default_max_capacity_points').first()
-            if cfg_m: w_matriz = float(cfg_m.value)
-            if cfg_f: w_filial = float(cfg_f.value)
-            if cfg_max: max_points = float(cfg_max.value)
-        except: pass
+        w_matriz, w_filial = ConfigService.get_weights()
+        max_points = ConfigService.get_float('default_max_capacity_points', 30.0)
 
         # 1. Buscar WIP (Lojas em andamento)
         wip_stores = db.session.query(Store).filter(
@@ -972,22 +866,11 @@ class AnalyticsService:
             forecast_map[key] = {'realized': 0.0, 'projected': 0.0}
             curr += relativedelta(months=1)
             
-        # 3. Preencher REALIZADO (Histórico, a partir de 2026)
-        # Buscar todas lojas concluídas no range
-        done_stores = db.session.query(Store).filter(
-            or_(Store.status_norm == 'DONE', Store.manual_finished_at.isnot(None)),
-            or_(
-                and_(Store.manual_finished_at.isnot(None), Store.manual_finished_at >= DATA_CUTOFF),
-                and_(Store.manual_finished_at.is_(None), Store.finished_at >= DATA_CUTOFF)
-            )
-        ).all()
-        
-        for s in done_stores:
-            end = s.manual_finished_at or s.finished_at
-            if not end: continue
-            key = end.strftime('%Y-%m')
+        # 3. Preencher REALIZADO (Histórico, a partir de 2026) com o rollup mensal
+        for r in MonthlyRollupService.read(start_month=max(start_range, DATA_CUTOFF).date(), end_month=end_range.date()):
+            key = r.month.strftime('%Y-%m')
             if key in forecast_map:
-                forecast_map[key]['realized'] += float(s.valor_mensalidade or 0)
+                forecast_map[key]['realized'] += float(r.mrr or 0)
                 
         # 4. Preencher PROJETADO (Futuro)
         wip_stores = db.session.query(Store).filter(
@@ -1085,15 +968,9 @@ class AnalyticsService:
         stores = query.all()
         
         # Buscar Pesos
-        w_matriz = 1.0
-        w_filial = 0.7
-        try:
-            cfg_m = SystemConfig.query.filter_by(key='weight_matriz').first()
-            cfg_f = SystemConfig.query.filter_by(key='weight_filial').first()
-            if cfg_m: w_matriz = float(cfg_m.value)
-            if cfg_f: w_filial = float(cfg_f.value)
-        except: pass
+        w_matriz, w_filial = ConfigService.get_weights()
 
+        risk_by_store = StoreRiskService().get_many(stores)
         detailed_data = []
         for s in stores:
             end = s.manual_finished_at or s.end_real_at or s.finished_at
@@ -1117,8 +994,8 @@ class AnalyticsService:
             if is_done:
                 points = w_matriz if s.tipo_loja == 'Matriz' else w_filial
 
-            # Risk Score (ScoringService)
-            risk_data = ScoringService.calculate_risk_score(s)
+            # Risk Score (materializado em store_risk)
+            risk_data = risk_by_store[s.id]
             risk = risk_data['total']
             # Breakdown não cabe bem no excel simples, mantemos só o total ou adicionamos colunas?
             # Vamos adicionar colunas de sub-score
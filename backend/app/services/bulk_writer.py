@@ -0,0 +1,99 @@
+import logging
+from app.models import db
+
+logger = logging.getLogger(__name__)
+
+# Limite de linhas por INSERT multi-valores (Postgres aceita ate 65535 parametros).
+UPSERT_CHUNK_SIZE = 500
+
+
+def dialect_name():
+    return db.session.get_bind().dialect.name
+
+
+def column_defaults(model, columns):
+    """Defaults escalares das colunas, usados para montar linhas novas homogeneas."""
+    defaults = {}
+    for name in columns:
+        default = model.__table__.columns[name].default
+        defaults[name] = default.arg if default is not None and default.is_scalar else None
+    return defaults
+
+
+def upsert_rows(model, rows, conflict_columns, update_columns=None):
+    """
+    Grava `rows` (lista de dicts com as mesmas chaves) com um unico
+    INSERT ... ON CONFLICT DO UPDATE por lote.
+    Postgres e SQLite usam o upsert nativo; outros bancos caem no merge do ORM.
+    Retorna a quantidade de linhas enviadas.
+    """
+    if not rows:
+        return 0
+
+    table = model.__table__
+    keys = list(rows[0].keys())
+    if update_columns is None:
+        update_columns = [k for k in keys if k not in conflict_columns]
+
+    # Alteracoes pendentes no ORM precisam chegar ao banco antes do SQL direto.
+    db.session.flush()
+
+    dialect = dialect_name()
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        logger.info(f"[BulkWriter] Dialeto {dialect} sem upsert nativo; usando merge do ORM.")
+        for row in rows:
+            existing = model.query.filter_by(**{c: row[c] for c in conflict_columns}).first()
+            if existing:
+                for col in update_columns:
+                    setattr(existing, col, row[col])
+            else:
+                db.session.add(model(**row))
+        db.session.flush()
+        return len(rows)
+
+    # Um unico comando executado em lote (executemany): compilado uma vez, sem
+    # remontar o VALUES a cada chunk; o driver agrupa as linhas por ida ao banco.
+    stmt = insert(table)
+    if update_columns:
+        stmt = stmt.on_conflict_do_update(
+            index_elements=conflict_columns,
+            set_={col: stmt.excluded[col] for col in update_columns},
+        )
+    else:
+        stmt = stmt.on_conflict_do_nothing(index_elements=conflict_columns)
+    for start in range(0, len(rows), UPSERT_CHUNK_SIZE):
+        db.session.execute(stmt, rows[start:start + UPSERT_CHUNK_SIZE])
+    return len(rows)
+
+
+def insert_missing_rows(model, rows, conflict_columns):
+    """
+    INSERT ... ON CONFLICT DO NOTHING em lote, como upsert_rows sem colunas a atualizar,
+    mas retorna quantas linhas foram de fato inseridas (RETURNING da chave primaria):
+    linhas ja gravadas por outro processo nao entram na conta.
+    """
+    if not rows:
+        return 0
+
+    dialect = dialect_name()
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        # Sem RETURNING com ON CONFLICT: diferenca na contagem da tabela.
+        before = model.query.count()
+        upsert_rows(model, rows, conflict_columns, [])
+        return model.query.count() - before
+
+    db.session.flush()
+    table = model.__table__
+    stmt = insert(table).on_conflict_do_nothing(index_elements=conflict_columns).returning(*table.primary_key.columns)
+    inserted = 0
+    for start in range(0, len(rows), UPSERT_CHUNK_SIZE):
+        inserted += len(db.session.execute(stmt, rows[start:start + UPSERT_CHUNK_SIZE]).all())
+    return inserted
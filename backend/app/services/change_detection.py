@@ -0,0 +1,135 @@
+import hashlib
+import json
+import logging
+from datetime import datetime
+from sqlalchemy import BigInteger, Numeric, cast, func, literal, select
+from app.models import db, TaskStep, ClickUpTaskFingerprint
+from app.services.bulk_writer import dialect_name, upsert_rows
+
+logger = logging.getLogger(__name__)
+
+
+class TaskFingerprintService:
+    """
+    Deteccao de mudancas por tarefa do ClickUp (date_updated + hash dos campos mapeados).
+    Tarefas sem mudanca nao passam pelo MetricsService; apenas os campos
+    derivados do relogio (idle_days, total_time_days) sao renovados em SQL.
+    """
+    # Incrementar quando o mapeamento do MetricsService mudar, para forcar reprocessamento.
+    FINGERPRINT_VERSION = 1
+    CHUNK_SIZE = 500
+
+    def compute_hash(self, task_data):
+        status = task_data.get('status') or {}
+        projection = {
+            'v': self.FINGERPRINT_VERSION,
+            'name': task_data.get('name'),
+            'url': task_data.get('url'),
+            'custom_id': task_data.get('custom_id'),
+            'status': status.get('status') if isinstance(status, dict) else status,
+            'date_created': task_data.get('date_created'),
+            'date_started': task_data.get('date_started'),
+            'date_closed': task_data.get('date_closed'),
+            'date_done': task_data.get('date_done'),
+            'assignees': [
+                [a.get('id'), a.get('username'), a.get('profilePicture'), a.get('initials')]
+                for a in task_data.get('assignees', [])
+            ],
+            'custom_fields': sorted(
+                [[f.get('id'), f.get('name'), f.get('value')] for f in task_data.get('custom_fields', [])],
+                key=lambda f: str(f[0]),
+            ),
+            'description': task_data.get('description'),
+            'step_type_name': task_data.get('step_type_name'),
+        }
+        raw = json.dumps(projection, sort_keys=True, default=str)
+        return hashlib.md5(raw.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def _date_updated(task_data):
+        try:
+            return int(task_data['date_updated']) if task_data.get('date_updated') else None
+        except (TypeError, ValueError):
+            return None
+
+    def split_changed(self, tasks):
+        """Separa (alteradas, inalteradas) com uma query IN (...) por bloco."""
+        if not tasks:
+            return [], []
+        ids = [t['id'] for t in tasks]
+        stored = {}
+        for start in range(0, len(ids), self.CHUNK_SIZE):
+            chunk = ids[start:start + self.CHUNK_SIZE]
+            for task_id, date_updated, content_hash in db.session.query(
+                ClickUpTaskFingerprint.clickup_task_id,
+                ClickUpTaskFingerprint.date_updated,
+                ClickUpTaskFingerprint.content_hash,
+            ).filter(ClickUpTaskFingerprint.clickup_task_id.in_(chunk)):
+                stored[task_id] = (date_updated, content_hash)
+
+        changed, unchanged = [], []
+        for task in tasks:
+            previous = stored.get(task['id'])
+            if previous and previous == (self._date_updated(task), self.compute_hash(task)):
+                unchanged.append(task)
+            else:
+                changed.append(task)
+        return changed, unchanged
+
+    def record(self, tasks, entity_type):
+        """Grava as impressoes digitais das tarefas ja persistidas com sucesso."""
+        now = datetime.now()
+        rows = list({t['id']: {
+            'clickup_task_id': t['id'],
+            'entity_type': entity_type,
+            'date_updated': self._date_updated(t),
+            'content_hash': self.compute_hash(t),
+            'synced_at': now,
+        } for t in tasks}.values())
+        upsert_rows(ClickUpTaskFingerprint, rows, ['clickup_task_id'])
+
+    def forget(self, clickup_task_ids):
+        """Invalida impressoes digitais (ex.: edicao manual que precisa ser reconciliada)."""
+        if clickup_task_ids:
+            ClickUpTaskFingerprint.query.filter(
+                ClickUpTaskFingerprint.clickup_task_id.in_(list(clickup_task_ids))
+            ).delete(synchronize_session=False)
+
+    @staticmethod
+    def _days_since(column, now):
+        if dialect_name() == 'postgresql':
+            return func.extract('epoch', literal(now) - column) / 86400.0
+        return func.julianday(literal(now)) - func.julianday(column)
+
+    def refresh_derived_fields(self, model, clickup_task_ids):
+        """
+        Renova em SQL os campos que dependem apenas do relogio para as tarefas puladas:
+        idle_days (a partir do date_updated guardado) e, em etapas abertas, total_time_days.
+        """
+        ids = list(clickup_task_ids)
+        if not ids:
+            return 0
+        now = datetime.now()
+        now_ms = int(now.timestamp() * 1000)
+        date_updated = select(ClickUpTaskFingerprint.date_updated).where(
+            ClickUpTaskFingerprint.clickup_task_id == model.clickup_task_id
+        ).scalar_subquery()
+        idle_days = (literal(now_ms, BigInteger) - date_updated) // 86400000
+
+        touched = 0
+        for start in range(0, len(ids), self.CHUNK_SIZE):
+            chunk = ids[start:start + self.CHUNK_SIZE]
+            result = model.query.filter(
+                model.clickup_task_id.in_(chunk),
+                date_updated.isnot(None),
+            ).update({model.idle_days: idle_days}, synchronize_session=False)
+            touched += result
+            if model is TaskStep:
+                model.query.filter(
+                    model.clickup_task_id.in_(chunk),
+                    model.start_real_at.isnot(None),
+                    model.end_real_at.is_(None),
+                ).update({
+                    model.total_time_days: func.round(cast(self._days_since(model.start_real_at, now), Numeric), 2)
+                }, synchronize_session=False)
+        return touched
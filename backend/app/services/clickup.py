@@ -1,33 +1,229 @@
 import requests
 import time
 import logging
+import threading
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from flask import has_app_context
+from requests.adapters import HTTPAdapter
+from app.services.clickup_cache import ClickUpResponseCacheService
 from config import Config
 
+
+class ClickUpRateLimiter:
+    """
+    Token bucket compartilhado por todas as threads do processo.
+    A capacidade e o saldo sao ajustados pelos headers X-RateLimit-* do ClickUp,
+    assim os pools do SyncService e da IA consomem o mesmo orcamento.
+    """
+
+    def __init__(self, capacity, period_seconds=60.0):
+        self._lock = threading.Lock()
+        self._capacity = float(capacity)
+        self._rate = self._capacity / period_seconds
+        self._tokens = self._capacity
+        self._updated_at = time.monotonic()
+        self._blocked_until = 0.0
+
+    def _refill(self, now):
+        elapsed = now - self._updated_at
+        if elapsed > 0:
+            self._tokens = min(self._capacity, self._tokens + elapsed * self._rate)
+            self._updated_at = now
+
+    def acquire(self):
+        """Bloqueia ate haver um token disponivel para a proxima chamada."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if now < self._blocked_until:
+                    wait = self._blocked_until - now
+                else:
+                    self._refill(now)
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        return
+                    wait = (1 - self._tokens) / self._rate
+            time.sleep(min(wait, 5.0))
+
+    def update_from_headers(self, headers):
+        """Sincroniza o bucket com o saldo informado pelo ClickUp."""
+        try:
+            limit = headers.get('X-RateLimit-Limit')
+            remaining = headers.get('X-RateLimit-Remaining')
+            reset = headers.get('X-RateLimit-Reset')
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if limit and float(limit) > 0 and float(limit) != self._capacity:
+                    self._rate = self._rate * float(limit) / self._capacity
+                    self._capacity = float(limit)
+                if remaining is not None:
+                    self._tokens = min(self._tokens, float(remaining))
+                    if float(remaining) <= 0 and reset:
+                        self._blocked_until = max(self._blocked_until, now + max(0.0, float(reset) - time.time()))
+        except (TypeError, ValueError):
+            pass
+
+    def block_for(self, seconds):
+        """Suspende todas as threads apos um 429 sem headers de reset."""
+        with self._lock:
+            self._tokens = 0.0
+            self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+
+
+class ClickUpClientStats:
+    """Contadores de chamadas, retries, 429 e latencia por endpoint."""
+
+    def __init__(self, sample_size=200):
+        self._lock = threading.Lock()
+        self._sample_size = sample_size
+        self._reset()
+
+    def _reset(self):
+        self.counters = defaultdict(lambda: {"calls": 0, "retries": 0, "rate_limited": 0, "errors": 0})
+        self.latencies = defaultdict(lambda: deque(maxlen=self._sample_size))
+
+    @staticmethod
+    def endpoint_key(method, endpoint):
+        # Normaliza IDs (segmentos impares) para agrupar: task/{id}/comment.
+        parts = endpoint.split('/')
+        return f"{method} " + '/'.join(p if i % 2 == 0 else '{id}' for i, p in enumerate(parts))
+
+    def record(self, key, field, duration=None):
+        with self._lock:
+            self.counters[key][field] += 1
+            if duration is not None:
+                self.latencies[key].append(duration)
+
+    def snapshot(self):
+        with self._lock:
+            result = {}
+            for key, counter in self.counters.items():
+                samples = sorted(self.latencies[key])
+                p95 = samples[min(len(samples) - 1, int(0.95 * len(samples)))] if samples else 0.0
+                result[key] = {**counter, "p95_latency_sec": round(p95, 3)}
+            return result
+
+
+class ClickUpPager:
+    """
+    Paginador com prefetch para endpoints list/{id}/task.
+    Mantem ate `prefetch` paginas em voo por passada enquanto o consumidor
+    processa a pagina atual; varias passadas (ex.: abertas + atualizadas desde
+    o corte) compartilham a mesma janela e correm em paralelo.
+    """
+    PAGE_SIZE = 100
+
+    def __init__(self, fetch_page, prefetch=None):
+        self.fetch_page = fetch_page
+        self.prefetch = max(1, prefetch or Config.CLICKUP_PAGE_PREFETCH)
+
+    def iter_pages(self, endpoint, passes):
+        """Gera (indice_da_passada, tarefas) na ordem de pagina de cada passada."""
+        next_page = [0] * len(passes)
+        done = [False] * len(passes)
+        pending = deque()
+        executor = ThreadPoolExecutor(max_workers=self.prefetch * len(passes))
+        try:
+            while True:
+                for idx, params in enumerate(passes):
+                    in_flight = sum(1 for p_idx, _ in pending if p_idx == idx)
+                    while not done[idx] and in_flight < self.prefetch:
+                        page_params = dict(params, page=next_page[idx])
+                        pending.append((idx, executor.submit(self.fetch_page, endpoint, page_params)))
+                        next_page[idx] += 1
+                        in_flight += 1
+                if not pending:
+                    break
+
+                idx, future = pending.popleft()
+                if done[idx]:
+                    continue
+                data = future.result()
+                batch = (data or {}).get('tasks') or []
+                if len(batch) < self.PAGE_SIZE:
+                    # Pagina curta encerra a passada; paginas especulativas sao descartadas.
+                    done[idx] = True
+                    for p_idx, p_future in pending:
+                        if p_idx == idx:
+                            p_future.cancel()
+                if batch:
+                    yield idx, batch
+        finally:
+            for _, p_future in pending:
+                p_future.cancel()
+            executor.shutdown(wait=False)
+
+
+_session = None
+_session_lock = threading.Lock()
+rate_limiter = ClickUpRateLimiter(Config.CLICKUP_RATE_LIMIT_PER_MIN)
+client_stats = ClickUpClientStats()
+
+
+def get_session():
+    """Session HTTP unica do processo, com keep-alive e limite de conexoes por host."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(
+                    pool_connections=1,
+                    pool_maxsize=Config.CLICKUP_POOL_MAXSIZE,
+                    pool_block=True,
+                    max_retries=0,
+                )
+                session.mount("https://", adapter)
+                _session = session
+    return _session
+
+
 class ClickUpService:
     BASE_URL = "https://api.clickup.com/api/v2"
     HEADERS = {"Authorization": Config.CLICKUP_API_KEY}
     
     def __init__(self):
         self.logger = logging.getLogger(__name__)
+        self.response_cache = ClickUpResponseCacheService()
 
-    def _get(self, endpoint, params=None):
+    @staticmethod
+    def get_client_stats():
+        return client_stats.snapshot()
+
+    def _request(self, method, endpoint, params=None, payload=None, ok_statuses=(200,), retry_on_error=False):
+        """
+        Executa a chamada pela session compartilhada respeitando o token bucket.
+        Em 429 aguarda o reset informado pelo ClickUp em vez de um sleep fixo.
+        """
         url = f"{self.BASE_URL}/{endpoint}"
+        key = ClickUpClientStats.endpoint_key(method, endpoint)
+        session = get_session()
         retries = 3
         for i in range(retries):
+            if i > 0:
+                client_stats.record(key, "retries")
             try:
+                rate_limiter.acquire()
                 start_time = time.time()
-                response = requests.get(url, headers=self.HEADERS, params=params, timeout=60)
+                response = session.request(method, url, headers=self.HEADERS, params=params, json=payload, timeout=60)
                 duration = time.time() - start_time
+                client_stats.record(key, "calls", duration)
+                rate_limiter.update_from_headers(response.headers)
                 
                 if response.status_code == 429: # Rate Limit
-                    self.logger.warning(f"ClickUp Rate Limit (429). Tentativa {i+1}/{retries}. Aguardando 10s...")
-                    time.sleep(10)
+                    client_stats.record(key, "rate_limited")
+                    if not response.headers.get('X-RateLimit-Reset'):
+                        rate_limiter.block_for(10)
+                    self.logger.warning(f"ClickUp Rate Limit (429) {method} {endpoint}. Tentativa {i+1}/{retries}. Aguardando reset...")
                     continue
                 
-                if response.status_code != 200:
-                    self.logger.error(f"Erro ClickUp {response.status_code} em {endpoint}: {response.text}")
-                    if i < retries - 1:
+                if response.status_code not in ok_statuses:
+                    client_stats.record(key, "errors")
+                    self.logger.error(f"Erro ClickUp {response.status_code} {method} {endpoint}: {response.text}")
+                    if retry_on_error and i < retries - 1:
                         time.sleep(2)
                         continue
                     return None
@@ -38,50 +234,23 @@ class ClickUpService:
                     
                 return response.json()
             except requests.exceptions.Timeout:
+                client_stats.record(key, "errors")
                 self.logger.error(f"Timeout (60s) na chamada para {endpoint}. Tentativa {i+1}/{retries}...")
                 time.sleep(3)
             except requests.exceptions.RequestException as e:
-                self.logger.error(f"Exceção ClickUp em {endpoint}: {str(e)}")
+                client_stats.record(key, "errors")
+                self.logger.error(f"Exceção ClickUp {method} {endpoint}: {str(e)}")
                 time.sleep(2)
         return None
 
+    def _get(self, endpoint, params=None):
+        return self._request("GET", endpoint, params=params, retry_on_error=True)
+
     def _post(self, endpoint, payload=None):
-        url = f"{self.BASE_URL}/{endpoint}"
-        retries = 3
-        for i in range(retries):
-            try:
-                response = requests.post(url, headers=self.HEADERS, json=payload, timeout=60)
-                if response.status_code == 429:
-                    self.logger.warning(f"ClickUp Rate Limit (429) POST. Tentativa {i+1}/{retries}. Aguardando 10s...")
-                    time.sleep(10)
-                    continue
-                if response.status_code not in (200, 201):
-                    self.logger.error(f"Erro ClickUp {response.status_code} POST {endpoint}: {response.text}")
-                    return None
-                return response.json()
-            except requests.exceptions.RequestException as e:
-                self.logger.error(f"Exceção ClickUp POST {endpoint}: {str(e)}")
-                time.sleep(2)
-        return None
+        return self._request("POST", endpoint, payload=payload, ok_statuses=(200, 201))
 
     def _put(self, endpoint, payload=None):
-        url = f"{self.BASE_URL}/{endpoint}"
-        retries = 3
-        for i in range(retries):
-            try:
-                response = requests.put(url, headers=self.HEADERS, json=payload, timeout=60)
-                if response.status_code == 429:
-                    self.logger.warning(f"ClickUp Rate Limit (429) PUT. Tentativa {i+1}/{retries}. Aguardando 10s...")
-                    time.sleep(10)
-                    continue
-                if response.status_code not in (200, 201):
-                    self.logger.error(f"Erro ClickUp {response.status_code} PUT {endpoint}: {response.text}")
-                    return None
-                return response.json()
-            except requests.exceptions.RequestException as e:
-                self.logger.error(f"Exceção ClickUp PUT {endpoint}: {str(e)}")
-                time.sleep(2)
-        return None
+        return self._request("PUT", endpoint, payload=payload, ok_statuses=(200, 201))
 
     def adicionar_dependencia(self, task_id, task_depende_de_id):
         """
@@ -93,36 +262,32 @@ class ClickUpService:
         }
         return self._post(f"task/{task_id}/dependency", payload=payload)
 
+    @staticmethod
+    def _task_list_params(include_closed=True, date_updated_gt=None, with_limit=True):
+        params = {
+            "subtasks": "true",
+            "include_closed": "true" if include_closed else "false",
+            "archived": "false",
+        }
+        if with_limit:
+            params["limit"] = ClickUpPager.PAGE_SIZE
+        if date_updated_gt:
+            params["date_updated_gt"] = date_updated_gt
+        return params
+
+    def _sync_passes(self, date_updated_gt, with_limit=True):
+        """Passadas do sync: tudo em aberto + tudo atualizado desde o corte."""
+        return [
+            self._task_list_params(include_closed=False, with_limit=with_limit),
+            self._task_list_params(include_closed=True, date_updated_gt=date_updated_gt, with_limit=with_limit),
+        ]
+
     def fetch_parent_tasks(self, date_updated_gt=None, include_closed=True):
         """Busca tarefas da Lista Principal (Lojas). Pagina por todas."""
-        status_msg = "INCLUINDO CONCLUÍDAS" if include_closed else "APENAS EM ABERTO"
-        self.logger.info(f"[ClickUp] Buscando lojas ({status_msg}) na lista {Config.LIST_ID_PRINCIPAL}...")
         tasks = []
-        page = 0
-        while True:
-            self.logger.info(f"[ClickUp] Buscando página {page} de Lojas...")
-            
-            params = {
-                "page": page, 
-                "subtasks": "true", 
-                "include_closed": "true" if include_closed else "false",
-                "archived": "false"
-            }
-            if date_updated_gt:
-                params["date_updated_gt"] = date_updated_gt
-
-            data = self._get(f"list/{Config.LIST_ID_PRINCIPAL}/task", params=params)
-            
-            if not data or not data.get('tasks'):
-                break
-                
-            batch = data['tasks']
+        for batch in self.fetch_parent_tasks_generator(date_updated_gt=date_updated_gt, include_closed=include_closed):
             tasks.extend(batch)
-            self.logger.info(f"[ClickUp] Página {page}: {len(batch)} tarefas.")
-            page += 1
-            
-            if len(batch) < 100: # Página do ClickUp geralmente tem 100
-                break
+            self.logger.info(f"[ClickUp] Página de lojas: {len(batch)} tarefas.")
         
         self.logger.info(f"[ClickUp] Total de {len(tasks)} lojas encontradas.")
         return tasks
@@ -131,28 +296,16 @@ class ClickUpService:
         """Busca tarefas da Lista Principal (Lojas) e retorna por página."""
         status_msg = "INCLUINDO CONCLUÍDAS" if include_closed else "APENAS EM ABERTO"
         self.logger.info(f"[ClickUp] Buscando lojas ({status_msg}) na lista {Config.LIST_ID_PRINCIPAL} (Generator)...")
-        page = 0
-        while True:
-            params = {
-                "page": page, 
-                "subtasks": "true", 
-                "include_closed": "true" if include_closed else "false",
-                "archived": "false"
-            }
-            if date_updated_gt:
-                params["date_updated_gt"] = date_updated_gt
-
-            data = self._get(f"list/{Config.LIST_ID_PRINCIPAL}/task", params=params)
-            
-            if not data or not data.get('tasks'):
-                break
-                
-            batch = data['tasks']
+        params = self._task_list_params(include_closed, date_updated_gt, with_limit=False)
+        for _, batch in ClickUpPager(self._get).iter_pages(f"list/{Config.LIST_ID_PRINCIPAL}/task", [params]):
+            yield batch
+
+    def fetch_parent_sync_generator(self, date_updated_gt):
+        """Lojas em aberto + lojas atualizadas desde o corte, com as duas passadas em paralelo."""
+        self.logger.info(f"[ClickUp] Buscando lojas (EM ABERTO + ATUALIZADAS) na lista {Config.LIST_ID_PRINCIPAL}...")
+        passes = self._sync_passes(date_updated_gt, with_limit=False)
+        for _, batch in ClickUpPager(self._get).iter_pages(f"list/{Config.LIST_ID_PRINCIPAL}/task", passes):
             yield batch
-            page += 1
-            
-            if len(batch) < 100:
-                break
 
     def get_father_field_id(self):
         """Encontra o UUID do campo personalizado _father_task_id."""
@@ -169,59 +322,41 @@ class ClickUpService:
     def fetch_tasks_from_list(self, list_id, date_updated_gt=None):
         """Busca todas as tarefas de uma lista específica (inclui paginação)."""
         tasks = []
-        page = 0
-        while True:
-            params = {
-                "page": page,
-                "subtasks": "true",
-                "include_closed": "true",
-                "archived": "false",
-                "limit": 100 # Explict limit
-            }
-            if date_updated_gt:
-                params["date_updated_gt"] = date_updated_gt
-                
-            data = self._get(f"list/{list_id}/task", params=params)
-            if not data or not data.get('tasks'):
-                break
-            
-            batch = data['tasks']
+        for batch in self.fetch_tasks_from_list_generator(list_id, date_updated_gt=date_updated_gt):
             tasks.extend(batch)
-            page += 1
-            if len(batch) < 100:
-                break
         return tasks
     
     def fetch_tasks_from_list_generator(self, list_id, date_updated_gt=None, include_closed=True):
         """Busca todas as tarefas de uma lista específica iterando em blocos."""
-        page = 0
-        while True:
-            params = {
-                "page": page,
-                "subtasks": "true",
-                "include_closed": "true" if include_closed else "false",
-                "archived": "false",
-                "limit": 100
-            }
-            if date_updated_gt:
-                params["date_updated_gt"] = date_updated_gt
-                
-            data = self._get(f"list/{list_id}/task", params=params)
-            if not data or not data.get('tasks'):
-                break
-            
-            batch = data['tasks']
+        params = self._task_list_params(include_closed, date_updated_gt)
+        for _, batch in ClickUpPager(self._get).iter_pages(f"list/{list_id}/task", [params]):
+            yield batch
+
+    def fetch_list_sync_generator(self, list_id, date_updated_gt):
+        """Etapas em aberto + etapas atualizadas desde o corte de uma lista, por página."""
+        for _, batch in ClickUpPager(self._get).iter_pages(f"list/{list_id}/task", self._sync_passes(date_updated_gt)):
             yield batch
-            page += 1
-            if len(batch) < 100:
-                break
     
-    def get_task_history(self, task_id):
+    def get_task(self, task_id):
+        """
+        Busca uma tarefa individual (com custom fields e lista de origem).
+        """
+        return self._get(f"task/{task_id}")
+
+    def _get_task_resource(self, task_id, kind, endpoint, date_updated=None, use_cache=True):
+        """
+        GET por tarefa passando pelo cache persistente (invalidado pelo date_updated).
+        Fora de app context (threads de fan-out) a chamada vai direto a API.
+        """
+        if use_cache and has_app_context():
+            return self.response_cache.fetch(task_id, kind, lambda: self._get(endpoint), date_updated)
+        return self._get(endpoint)
+
+    def get_task_history(self, task_id, date_updated=None, use_cache=True):
         """
         Busca histórico de status para uma tarefa.
         """
-        data = self._get(f"task/{task_id}/time_in_status")
-        return data
+        return self._get_task_resource(task_id, 'time_in_status', f"task/{task_id}/time_in_status", date_updated, use_cache)
 
     def parse_integration_dates(self, task_id):
         """
@@ -301,20 +436,20 @@ class ClickUpService:
         self.logger.info(f"[ClickUp] Datas integração task {task_id}: início={start_date}, fim={end_date}")
         return {'start_date': start_date, 'end_date': end_date}
 
-    def get_task_comments(self, task_id):
+    def get_task_comments(self, task_id, date_updated=None, use_cache=True):
         """
         Busca comentários de uma tarefa.
         """
-        data = self._get(f"task/{task_id}/comment")
+        data = self._get_task_resource(task_id, 'comments', f"task/{task_id}/comment", date_updated, use_cache)
         if data and 'comments' in data:
             return data['comments']
         return []
 
-    def get_task_time_tracking(self, task_id):
+    def get_task_time_tracking(self, task_id, date_updated=None, use_cache=True):
         """
         Busca o tempo total registrado em uma tarefa.
         """
-        data = self._get(f"task/{task_id}/time")
+        data = self._get_task_resource(task_id, 'time_tracking', f"task/{task_id}/time", date_updated, use_cache)
         if data and 'data' in data:
             return data['data']
         return []
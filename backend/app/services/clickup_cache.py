@@ -0,0 +1,117 @@
+import json
+import logging
+from datetime import datetime, timedelta
+from app.models import db, ClickUpResponseCache, ClickUpTaskFingerprint
+from app.services.bulk_writer import upsert_rows
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class ClickUpResponseCacheService:
+    """
+    Cache no banco das respostas por tarefa do ClickUp, compartilhado por deep sync,
+    IA e lembrete de documentacao. Uma entrada vale enquanto o date_updated da tarefa
+    (informado pelo chamador ou o ultimo visto pelo sync) nao passar do guardado e o
+    TTL nao expirar. Usa a sessao do chamador: o commit fica com quem chamou.
+    """
+    CHUNK_SIZE = 500
+    PRUNE_EVERY = 200
+    _puts_since_prune = 0
+
+    @staticmethod
+    def _known_versions(task_ids):
+        versions = {}
+        for start in range(0, len(task_ids), ClickUpResponseCacheService.CHUNK_SIZE):
+            chunk = task_ids[start:start + ClickUpResponseCacheService.CHUNK_SIZE]
+            versions.update(db.session.query(
+                ClickUpTaskFingerprint.clickup_task_id, ClickUpTaskFingerprint.date_updated
+            ).filter(ClickUpTaskFingerprint.clickup_task_id.in_(chunk)).all())
+        return versions
+
+    @staticmethod
+    def _as_version(date_updated):
+        try:
+            return int(date_updated) if date_updated else None
+        except (TypeError, ValueError):
+            return None
+
+    def get_many(self, task_ids, kind, date_updated_by_task=None):
+        """Devolve {task_id: payload} apenas para as entradas validas."""
+        task_ids = [t for t in dict.fromkeys(task_ids) if t]
+        if not task_ids:
+            return {}
+        known = self._known_versions(task_ids)
+        for task_id, date_updated in (date_updated_by_task or {}).items():
+            if self._as_version(date_updated) is not None:
+                known[task_id] = self._as_version(date_updated)
+
+        min_fetched_at = datetime.now() - timedelta(hours=Config.CLICKUP_CACHE_TTL_HOURS)
+        hits = {}
+        for start in range(0, len(task_ids), self.CHUNK_SIZE):
+            chunk = task_ids[start:start + self.CHUNK_SIZE]
+            for entry in ClickUpResponseCache.query.filter(
+                ClickUpResponseCache.kind == kind,
+                ClickUpResponseCache.task_id.in_(chunk),
+                ClickUpResponseCache.fetched_at >= min_fetched_at,
+            ):
+                version = known.get(entry.task_id)
+                if version is not None and (entry.date_updated is None or entry.date_updated < version):
+                    continue
+                try:
+                    hits[entry.task_id] = json.loads(entry.payload)
+                except (TypeError, ValueError):
+                    continue
+        return hits
+
+    def put_many(self, kind, payload_by_task, date_updated_by_task=None):
+        """Grava as respostas recebidas; a versao padrao e o ultimo date_updated conhecido."""
+        if not payload_by_task:
+            return
+        known = self._known_versions(list(payload_by_task))
+        now = datetime.now()
+        rows = []
+        for task_id, payload in payload_by_task.items():
+            version = self._as_version((date_updated_by_task or {}).get(task_id)) or known.get(task_id)
+            rows.append({
+                'task_id': task_id,
+                'kind': kind,
+                'date_updated': version,
+                'payload': json.dumps(payload),
+                'fetched_at': now,
+            })
+        upsert_rows(ClickUpResponseCache, rows, ['task_id', 'kind'], ['date_updated', 'payload', 'fetched_at'])
+
+        ClickUpResponseCacheService._puts_since_prune += len(rows)
+        if ClickUpResponseCacheService._puts_since_prune >= self.PRUNE_EVERY:
+            ClickUpResponseCacheService._puts_since_prune = 0
+            self.prune()
+
+    def fetch(self, task_id, kind, fetcher, date_updated=None):
+        """Leitura com cache: so chama `fetcher` (que devolve None em falha) em caso de miss."""
+        versions = {task_id: date_updated} if date_updated else None
+        hits = self.get_many([task_id], kind, versions)
+        if task_id in hits:
+            return hits[task_id]
+        payload = fetcher()
+        if payload is not None:
+            self.put_many(kind, {task_id: payload}, versions)
+        return payload
+
+    def prune(self):
+        """Remove entradas expiradas e as mais antigas acima de CLICKUP_CACHE_MAX_ROWS."""
+        min_fetched_at = datetime.now() - timedelta(hours=Config.CLICKUP_CACHE_TTL_HOURS)
+        removed = ClickUpResponseCache.query.filter(
+            ClickUpResponseCache.fetched_at < min_fetched_at
+        ).delete(synchronize_session=False)
+
+        cutoff = db.session.query(ClickUpResponseCache.fetched_at).order_by(
+            ClickUpResponseCache.fetched_at.desc()
+        ).offset(Config.CLICKUP_CACHE_MAX_ROWS).limit(1).scalar()
+        if cutoff is not None:
+            removed += ClickUpResponseCache.query.filter(
+                ClickUpResponseCache.fetched_at <= cutoff
+            ).delete(synchronize_session=False)
+        if removed:
+            logger.info(f"[ClickUp Cache] {removed} entradas removidas.")
+        return removed
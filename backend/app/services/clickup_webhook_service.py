@@ -0,0 +1,128 @@
+import hashlib
+import hmac
+import logging
+from datetime import datetime
+from app.models import db, Store, ClickUpWebhookEvent
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class ClickUpWebhookService:
+    """
+    Sync incremental por push: aplica os eventos de webhook pendentes reprocessando
+    apenas as tarefas citadas, com a mesma logica do MetricsService usada no polling.
+    """
+    SUPPORTED_EVENTS = {'taskUpdated', 'taskStatusUpdated', 'taskCommentPosted'}
+    BATCH_SIZE = 200
+
+    def __init__(self):
+        from app.services.sync_service import SyncService
+        self.sync = SyncService()
+        self.clickup = self.sync.clickup
+        self.metrics = self.sync.metrics
+        self.fingerprints = self.sync.fingerprints
+        self._father_field_id = None
+        self._touched_step_lists = set()
+
+    @staticmethod
+    def verify_signature(raw_body, signature, secret):
+        """Valida o cabecalho X-Signature (HMAC-SHA256 do corpo com o segredo do webhook)."""
+        if not signature:
+            return False
+        expected = hmac.new(secret.encode('utf-8'), raw_body, hashlib.sha256).hexdigest()
+        return hmac.compare_digest(expected, signature)
+
+    @staticmethod
+    def event_key(payload, raw_body):
+        """Chave de idempotencia: o ClickUp reenvia os mesmos history_items em novas tentativas."""
+        history_ids = sorted(str(h.get('id')) for h in payload.get('history_items') or [] if h.get('id'))
+        if history_ids:
+            key = f"{payload.get('webhook_id') or ''}:{payload.get('event')}:{','.join(history_ids)}"
+            if len(key) <= 200:
+                return key
+        return hashlib.sha256(raw_body).hexdigest()
+
+    def _father_field(self):
+        if self._father_field_id is None:
+            self._father_field_id = self.clickup.get_father_field_id() or ''
+        return self._father_field_id
+
+    def _apply_task(self, task_id, with_comments):
+        """Busca a tarefa atual no ClickUp e grava como loja ou etapa conforme a lista."""
+        task = self.clickup.get_task(task_id)
+        if not task:
+            raise ValueError("Tarefa nao encontrada no ClickUp")
+
+        list_id = str((task.get('list') or {}).get('id') or '')
+        if list_id == Config.LIST_ID_PRINCIPAL:
+            if with_comments:
+                self.sync._sync_verbal_context(task)
+            self.metrics.process_store_batch([task])
+            self.fingerprints.record([task], 'store')
+            return 'store'
+
+        step_lists = {v: k for k, v in Config.LIST_IDS_STEPS.items()}
+        list_name = step_lists.get(list_id)
+        if not list_name:
+            return 'ignored'
+
+        task['step_type_name'] = list_name
+        custom_id = None
+        for cf in task.get('custom_fields', []):
+            if cf.get('id') == self._father_field():
+                custom_id = cf.get('value')
+                break
+        store_db = Store.query.filter_by(custom_store_id=custom_id).first() if custom_id else None
+        if not store_db:
+            # Loja ainda nao sincronizada: o proximo polling trata a etapa.
+            return 'ignored'
+
+        self.metrics.process_step_batch([(store_db, task)])
+        self.metrics.apply_training_completion_rule(store_db)
+        self.fingerprints.record([task], 'step')
+        self._touched_step_lists.add(list_name)
+        return 'step'
+
+    def process_pending(self, limit=None):
+        """Aplica os eventos pendentes agrupados por tarefa (uma busca no ClickUp por tarefa)."""
+        events = ClickUpWebhookEvent.query.filter_by(processed_at=None).order_by(
+            ClickUpWebhookEvent.id.asc()
+        ).limit(limit or self.BATCH_SIZE).all()
+        if not events:
+            return {"events": 0, "tasks": 0, "failed": 0}
+
+        by_task = {}
+        for event in events:
+            by_task.setdefault(event.task_id, []).append(event)
+
+        applied, failed = 0, 0
+        self._touched_step_lists = set()
+        for task_id, task_events in by_task.items():
+            with_comments = any(e.event_type == 'taskCommentPosted' for e in task_events)
+            try:
+                result = self._apply_task(task_id, with_comments)
+                db.session.commit()
+                now = datetime.utcnow()
+                for event in task_events:
+                    event.processed_at = now
+                    event.last_error = None if result != 'ignored' else "Tarefa fora das listas sincronizadas"
+                applied += 1
+            except Exception as e:
+                db.session.rollback()
+                failed += 1
+                logger.error(f"[ClickUp Webhook] Erro ao aplicar tarefa {task_id}: {e}")
+                for event in task_events:
+                    event.attempts = (event.attempts or 0) + 1
+                    event.last_error = str(e)
+                    if event.attempts >= Config.CLICKUP_WEBHOOK_MAX_ATTEMPTS:
+                        # Desiste do evento: o polling de seguranca reconcilia a tarefa.
+                        event.processed_at = datetime.utcnow()
+            db.session.commit()
+
+        if self._touched_step_lists:
+            self.sync._refresh_step_stats(self._touched_step_lists)
+        self.sync._refresh_store_aggregates()
+
+        logger.info(f"[ClickUp Webhook] {len(events)} eventos aplicados em {applied} tarefas ({failed} falhas).")
+        return {"events": len(events), "tasks": applied, "failed": failed}
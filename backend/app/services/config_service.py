@@ -0,0 +1,93 @@
+import threading
+from flask import g, has_request_context
+from sqlalchemy import func
+from app.models import db, SystemConfig
+
+
+class ConfigService:
+    """
+    Leitura tipada de SystemConfig com cache em memoria no processo.
+    A versao e (quantidade de chaves, maior updated_at): qualquer escrita muda a
+    versao e os demais workers recarregam na proxima verificacao. Dentro de um
+    request a versao e conferida uma unica vez; as leituras seguintes sao dict.
+    """
+    _lock = threading.Lock()
+    _cache_version = None
+    _cache_values = {}
+
+    @staticmethod
+    def _current_version():
+        return tuple(db.session.query(
+            func.count(SystemConfig.id), func.max(SystemConfig.updated_at)
+        ).one())
+
+    @classmethod
+    def values(cls):
+        """Mapa key -> value (str) vigente."""
+        if has_request_context() and '_system_config' in g:
+            return g._system_config
+
+        version = cls._current_version()
+        with cls._lock:
+            if version != cls._cache_version:
+                cls._cache_values = {
+                    key: value for key, value in db.session.query(SystemConfig.key, SystemConfig.value)
+                }
+                cls._cache_version = version
+            values = cls._cache_values
+
+        if has_request_context():
+            g._system_config = values
+        return values
+
+    @classmethod
+    def invalidate(cls):
+        """Descarta o cache local apos uma escrita (os outros workers percebem pela versao)."""
+        with cls._lock:
+            cls._cache_version = None
+            cls._cache_values = {}
+        if has_request_context():
+            g.pop('_system_config', None)
+
+    @classmethod
+    def get(cls, key, default=None):
+        value = cls.values().get(key)
+        return value if value is not None else default
+
+    @classmethod
+    def get_float(cls, key, default=0.0):
+        try:
+            return float(cls.values()[key])
+        except (KeyError, TypeError, ValueError):
+            return default
+
+    @classmethod
+    def get_int(cls, key, default=0):
+        try:
+            return int(float(cls.values()[key]))
+        except (KeyError, TypeError, ValueError):
+            return default
+
+    @classmethod
+    def get_weights(cls):
+        """Pesos de pontuacao (matriz, filial)."""
+        return cls.get_float('weight_matriz', 1.0), cls.get_float('weight_filial', 0.7)
+
+    @classmethod
+    def set(cls, key, value, description=None, category=None):
+        """
+        Grava (ou cria) a chave e invalida o cache. Em chaves existentes, descricao e
+        categoria so preenchem campos vazios. O commit fica com o chamador.
+        """
+        cfg = SystemConfig.query.filter_by(key=key).first()
+        if not cfg:
+            cfg = SystemConfig(key=key, description=description or key, category=category or 'general')
+            db.session.add(cfg)
+        else:
+            if description and not cfg.description:
+                cfg.description = description
+            if category and not cfg.category:
+                cfg.category = category
+        cfg.value = str(value)
+        cls.invalidate()
+        return cfg
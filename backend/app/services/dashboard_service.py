@@ -0,0 +1,207 @@
+from datetime import datetime
+from sqlalchemy import case, extract, func, literal
+from sqlalchemy.orm import selectinload
+from app.models import db, Store, StoreRisk
+from app.services.bulk_writer import dialect_name
+
+
+class DashboardService:
+    """
+    Agregacoes do GET /api/dashboard em consultas agrupadas sobre as colunas
+    materializadas de Store (effective_start_at, effective_end_at, paused_days)
+    e sobre o score pre-calculado em store_risk. Nenhuma loja e carregada no
+    ORM alem das que aparecem no top de risco.
+    """
+    # Entregas contabilizadas somente a partir de 2026.
+    DELIVERIES_SINCE = datetime(2026, 1, 1)
+    EVOLUTION_MONTHS = 6
+    TOP_RISK_LIMIT = 10
+    IMPL_CHART_LIMIT = 15
+
+    def __init__(self, w_matriz=1.0, w_filial=0.7, now=None):
+        self.w_matriz = w_matriz
+        self.w_filial = w_filial
+        self.now = now or datetime.now()
+
+    # --- Clausulas ---
+
+    def _active_clause(self):
+        return Store.active_clause(self.now)
+
+    def _concluded_clause(self):
+        return Store.effective_end_at >= self.DELIVERIES_SINCE
+
+    def _scope_clause(self, status_filter):
+        if status_filter == 'active':
+            return self._active_clause()
+        if status_filter == 'concluded':
+            return self._concluded_clause()
+        return None # all preservado como contrato da API
+
+    @staticmethod
+    def _days_between(start, end):
+        if dialect_name() == 'postgresql':
+            return func.extract('epoch', end - start) / 86400.0
+        return func.julianday(end) - func.julianday(start)
+
+    def _on_time_clause(self):
+        """
+        SQL de `dias_totais_implantacao <= (tempo_contrato or 90)` para lojas concluidas.
+        Com dias = floor(delta) - paused_days, a comparacao equivale a delta < limite + paused_days + 1.
+        Lojas sem inicio ou com inicio futuro tem 0 dias e estao no prazo.
+        """
+        limit = func.coalesce(func.nullif(Store.tempo_contrato, 0), 90)
+        return db.or_(
+            Store.effective_start_at.is_(None),
+            Store.scheduled_clause(self.now),
+            self._days_between(Store.effective_start_at, Store.effective_end_at)
+            < limit + func.coalesce(Store.paused_days, 0) + 1,
+        )
+
+    def _points(self):
+        return case((Store.tipo_loja == 'Matriz', literal(self.w_matriz)), else_=literal(self.w_filial))
+
+    # --- Blocos ---
+
+    def get_kpis(self, status_filter):
+        count_wip, points_wip, mrr_implantacao = db.session.query(
+            func.count(Store.id),
+            func.coalesce(func.sum(self._points()), 0),
+            func.coalesce(func.sum(case(
+                (db.or_(Store.status_norm.is_(None), Store.status_norm != 'DONE'), Store.valor_mensalidade),
+                else_=0,
+            )), 0),
+        ).filter(self._active_clause()).one()
+
+        year_start = datetime(self.now.year, 1, 1)
+        next_year = datetime(self.now.year + 1, 1, 1)
+        count_done, points_done, on_time, mrr_concluidas_ano = db.session.query(
+            func.count(Store.id),
+            func.coalesce(func.sum(self._points()), 0),
+            func.coalesce(func.sum(case((self._on_time_clause(), 1), else_=0)), 0),
+            func.coalesce(func.sum(case(
+                (db.and_(Store.effective_end_at >= year_start, Store.effective_end_at < next_year), Store.valor_mensalidade),
+                else_=0,
+            )), 0),
+        ).filter(self._concluded_clause()).one()
+
+        mrr_ja_pagando = db.session.query(func.coalesce(func.sum(Store.valor_mensalidade), 0)).filter(
+            Store.financeiro_status.in_(['Pago', 'Em dia'])
+        ).scalar()
+
+        devendo = db.session.query(func.coalesce(func.sum(Store.valor_mensalidade), 0)).filter(
+            Store.financeiro_status == 'Devendo'
+        )
+        scope = self._scope_clause(status_filter)
+        if scope is not None:
+            devendo = devendo.filter(scope)
+
+        # Percentual no prazo considera apenas lojas concluidas.
+        pct_prazo = (on_time / count_done * 100) if count_done > 0 else 0
+        return {
+            "wip": count_wip,
+            "done_total": count_done,
+            "pct_prazo": round(pct_prazo, 1),
+            "mrr_implantacao": mrr_implantacao,
+            "mrr_pagando": mrr_ja_pagando,
+            "mrr_devendo": devendo.scalar(),
+            "mrr_concluidas_ano": mrr_concluidas_ano,
+            "points_wip": round(float(points_wip), 1),
+            "points_done": round(float(points_done), 1)
+        }
+
+    def get_rankings(self):
+        """Ranking por implantador com pelo menos uma loja ativa (entregas 2026+)."""
+        wip_by_imp = dict(db.session.query(Store.implantador, func.count(Store.id)).filter(
+            self._active_clause(), Store.implantador.isnot(None), Store.implantador != ''
+        ).group_by(Store.implantador).all())
+        if not wip_by_imp:
+            return []
+
+        done_by_imp = {
+            imp: (done, on_time or 0)
+            for imp, done, on_time in db.session.query(
+                Store.implantador,
+                func.count(Store.id),
+                func.sum(case((self._on_time_clause(), 1), else_=0)),
+            ).filter(
+                self._concluded_clause(), Store.implantador.in_(list(wip_by_imp))
+            ).group_by(Store.implantador).all()
+        }
+
+        rankings = []
+        for imp in sorted(wip_by_imp):
+            done, on_time = done_by_imp.get(imp, (0, 0))
+            pct = (on_time / done * 100) if done > 0 else 0
+            rankings.append({
+                "implantador": imp,
+                "wip": wip_by_imp[imp],
+                "done": done,
+                "pct_prazo": round(pct, 1)
+            })
+        rankings.sort(key=lambda x: x['done'], reverse=True)
+        return rankings
+
+    def get_evolution(self):
+        """Entregas por mes nos ultimos seis meses com entrega."""
+        year = extract('year', Store.effective_end_at)
+        month = extract('month', Store.effective_end_at)
+        rows = db.session.query(year, month, func.count(Store.id)).filter(
+            self._concluded_clause()
+        ).group_by(year, month).order_by(year.desc(), month.desc()).limit(self.EVOLUTION_MONTHS).all()
+        rows = list(reversed(rows))
+        return (
+            [f"{int(m):02d}/{int(y)}" for y, m, _ in rows],
+            [count for _, _, count in rows],
+        )
+
+    def get_top_risk(self, status_filter):
+        """Top de risco pelo score materializado; so as lojas exibidas sao carregadas."""
+        query = db.session.query(Store, StoreRisk).join(StoreRisk, StoreRisk.store_id == Store.id).options(
+            selectinload(Store.steps), selectinload(Store.pauses)
+        )
+        scope = self._scope_clause(status_filter)
+        if scope is not None:
+            query = query.filter(scope)
+        rows = query.order_by(StoreRisk.total.desc(), Store.id.asc()).limit(self.TOP_RISK_LIMIT).all()
+
+        risk_list = []
+        for s, risk in rows:
+            # Identifica a etapa ativa para mostrar gargalo operacional.
+            active_step_name = "N/A"
+            for step in s.steps:
+                if step.start_real_at and not step.end_real_at:
+                    active_step_name = step.step_name
+                    break
+
+            risk_list.append({
+                "id": s.id,
+                "name": s.store_name,
+                "implantador": s.implantador,
+                "status": s.status,
+                "etapa_parada": active_step_name,
+                "score": risk.total,
+                "breakdown": risk.to_dict()['breakdown'],
+                "dias": s.dias_em_progresso,
+                "idle": s.idle_days,
+                "financeiro": s.financeiro_status
+            })
+        return risk_list
+
+    def get_data(self, status_filter='active'):
+        # KPIs de topo permanecem globais para dar contexto executivo.
+        # Listas analiticas abaixo respeitam o filtro selecionado.
+        rankings = self.get_rankings()
+        by_wip = sorted(rankings, key=lambda x: x['wip'], reverse=True)[:self.IMPL_CHART_LIMIT]
+        evo_labels, evo_values = self.get_evolution()
+        return {
+            "kpis": self.get_kpis(status_filter),
+            "charts": {
+                "impl_labels": [r['implantador'] for r in by_wip],
+                "impl_values": [r['wip'] for r in by_wip],
+                "evo_labels": evo_labels,
+                "evo_values": evo_values
+            },
+            "rankings": rankings,
+            "risk_stores": self.get_top_risk(status_filter)
+        }
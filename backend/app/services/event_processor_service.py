@@ -2,38 +2,133 @@ from datetime import datetime
 import json
 import logging
 from app.models import db, ZenviaWebhookEvent, SupportConversation, SupportMessage, SupportContact
+from config import Config
 
 logger = logging.getLogger(__name__)
 
-def process_pending_zenvia_events():
+MESSAGE_EVENT_TYPES = ('MESSAGE', 'CONVERSATION_MESSAGE')
+
+def process_pending_zenvia_events(chunk_size=None, max_chunks=None):
     """
     Processa webhooks brutos da Zenvia e popula tabelas relacionais.
+    Le os pendentes em lotes por id (keyset), resolve contatos/conversas/mensagens
+    do lote em tres consultas IN e faz um unico commit por lote.
     """
-    events = ZenviaWebhookEvent.query.filter_by(processed_at=None).all()
+    chunk_size = chunk_size or Config.ZENVIA_EVENTS_CHUNK_SIZE
+    stats = {"processed_count": 0, "new_conversations_count": 0, "errors_count": 0}
+    last_id = 0
+    chunks = 0
+
+    while max_chunks is None or chunks < max_chunks:
+        events = (
+            ZenviaWebhookEvent.query
+            .filter(ZenviaWebhookEvent.processed_at.is_(None), ZenviaWebhookEvent.id > last_id)
+            .order_by(ZenviaWebhookEvent.id)
+            .limit(chunk_size)
+            .all()
+        )
+        if not events:
+            break
+        last_id = events[-1].id
+        chunks += 1
+
+        event_ids = [event.id for event in events]
+        try:
+            chunk_stats = _process_chunk(events)
+            db.session.commit()
+        except Exception as e:
+            # Conflito no commit (ex.: outro processo gravou a mesma mensagem): refaz evento a evento.
+            db.session.rollback()
+            logger.warning(f"Lote de eventos Zenvia {event_ids[0]}-{event_ids[-1]} falhou ({e}); reprocessando um a um.")
+            chunk_stats = _process_one_by_one(event_ids)
+
+        for key, value in chunk_stats.items():
+            stats[key] += value
+        db.session.expunge_all()
+
+        if len(events) < chunk_size:
+            break
+
+    return stats
+
+def _process_one_by_one(event_ids):
     stats = {"processed_count": 0, "new_conversations_count": 0, "errors_count": 0}
-    
+    events = (
+        ZenviaWebhookEvent.query
+        .filter(ZenviaWebhookEvent.id.in_(event_ids), ZenviaWebhookEvent.processed_at.is_(None))
+        .order_by(ZenviaWebhookEvent.id)
+        .all()
+    )
+    for event in events:
+        event_id = event.id
+        try:
+            event_stats = _process_chunk([event])
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            event_stats = {"processed_count": 0, "new_conversations_count": 0, "errors_count": 1}
+            logger.error(f"Erro ao processar evento Zenvia {event_id}: {str(e)}")
+        for key, value in event_stats.items():
+            stats[key] += value
+    return stats
+
+def _process_chunk(events):
+    """Aplica um lote em memoria (sem commit); erros de um evento nao param os demais."""
+    stats = {"processed_count": 0, "new_conversations_count": 0, "errors_count": 0}
+    parsed = []
     for event in events:
         try:
-            payload = json.loads(event.raw_payload)
-            if event.event_type in ['MESSAGE', 'CONVERSATION_MESSAGE']:
-                created = _process_message(payload, event.channel, event.timestamp)
+            parsed.append((event, json.loads(event.raw_payload)))
+        except (TypeError, ValueError) as e:
+            stats["errors_count"] += 1
+            logger.error(f"Erro ao processar evento Zenvia {event.id}: payload invalido ({e})")
+
+    refs = _load_chunk_refs(parsed)
+    for event, payload in parsed:
+        try:
+            if event.event_type in MESSAGE_EVENT_TYPES:
+                created = _process_message(payload, event.channel, refs, event.timestamp)
                 if created:
                     stats["new_conversations_count"] += 1
             elif event.event_type == 'MESSAGE_STATUS':
-                _process_message_status(payload)
+                _process_message_status(payload, refs)
             elif event.event_type == 'CONVERSATION_STATUS':
-                _process_conversation_status(payload, event.channel)
-            
+                _process_conversation_status(payload, event.channel, refs)
+
             event.processed_at = datetime.utcnow()
-            db.session.commit()
             stats["processed_count"] += 1
         except Exception as e:
-            db.session.rollback()
             stats["errors_count"] += 1
             logger.error(f"Erro ao processar evento Zenvia {event.id}: {str(e)}")
-            
     return stats
 
+def _load_chunk_refs(parsed):
+    """Contatos por telefone, conversas e mensagens por id Zenvia referenciados no lote."""
+    phones, conversation_ids, message_ids = set(), set(), set()
+    for event, payload in parsed:
+        if event.event_type in MESSAGE_EVENT_TYPES:
+            keys = _message_keys(payload)
+            if keys['contact_phone'] and keys['msg_id']:
+                phones.add(keys['contact_phone'])
+                conversation_ids.add(keys['conv_id_str'])
+                message_ids.add(keys['msg_id'])
+        elif event.event_type == 'MESSAGE_STATUS' and payload.get('messageId'):
+            message_ids.add(payload['messageId'])
+        elif event.event_type == 'CONVERSATION_STATUS' and payload.get('conversationId'):
+            conversation_ids.add(payload['conversationId'])
+
+    refs = {"contacts": {}, "conversations": {}, "messages": {}}
+    if phones:
+        for contact in SupportContact.query.filter(SupportContact.phone.in_(phones)).order_by(SupportContact.id):
+            refs["contacts"].setdefault(contact.phone, contact)
+    if conversation_ids:
+        for conversation in SupportConversation.query.filter(SupportConversation.zenvia_conversation_id.in_(conversation_ids)):
+            refs["conversations"][conversation.zenvia_conversation_id] = conversation
+    if message_ids:
+        for msg in SupportMessage.query.filter(SupportMessage.zenvia_message_id.in_(message_ids)):
+            refs["messages"][msg.zenvia_message_id] = msg
+    return refs
+
 def _parse_payload_datetime(*values):
     for value in values:
         if not value:
@@ -45,42 +140,59 @@ def _parse_payload_datetime(*values):
                 pass
     return datetime.utcnow()
 
-def _process_message(payload, channel, event_timestamp=None):
+def _message_keys(payload):
     # No evento MESSAGE, os dados estao dentro de payload['message']
     msg_data = payload.get('message', {})
-    msg_id = msg_data.get('id') or payload.get('messageId')
     direction = msg_data.get('direction', 'IN')
-    
-    # Extrair contato
     from_num = msg_data.get('from')
     to_num = msg_data.get('to')
     contact_phone = from_num if direction == 'IN' else to_num
-    
+    # Usa o ID de conversa do payload quando existir; senao cria uma chave estavel.
+    conv_data = payload.get('conversation', {})
+    return {
+        "msg_data": msg_data,
+        "msg_id": msg_data.get('id') or payload.get('messageId'),
+        "direction": direction,
+        "from_num": from_num,
+        "to_num": to_num,
+        "contact_phone": contact_phone,
+        "conv_id_str": conv_data.get('id') or payload.get('conversationId') or f"conv_{contact_phone}",
+    }
+
+def _process_message(payload, channel, refs, event_timestamp=None):
+    keys = _message_keys(payload)
+    msg_data = keys["msg_data"]
+    msg_id = keys["msg_id"]
+    direction = keys["direction"]
+    from_num = keys["from_num"]
+    to_num = keys["to_num"]
+    contact_phone = keys["contact_phone"]
+    conv_id_str = keys["conv_id_str"]
+
     if not contact_phone or not msg_id:
         return False # Nao processa se nao houver telefone/id de mensagem
 
     visitor = msg_data.get('visitor', {})
     visitor_name = visitor.get('name') or f"{visitor.get('firstName', '')} {visitor.get('lastName', '')}".strip() or "Desconhecido"
-    
-    contact = SupportContact.query.filter_by(phone=contact_phone).first()
+    message_ts = _parse_payload_datetime(msg_data.get('timestamp'), payload.get('timestamp'), event_timestamp)
+    contents = msg_data.get('contents') or [{}]
+    content_type = contents[0].get('type', 'text')
+    text = contents[0].get('text', '')
+
+    contact = refs["contacts"].get(contact_phone)
     if not contact:
         contact = SupportContact(zenvia_contact_id=contact_phone, phone=contact_phone, name=visitor_name)
         db.session.add(contact)
-        db.session.flush()
+        refs["contacts"][contact_phone] = contact
     elif contact.name == "Desconhecido" and visitor_name != "Desconhecido":
         contact.name = visitor_name
 
-    # Usa o ID de conversa do payload quando existir; senao cria uma chave estavel.
-    conv_data = payload.get('conversation', {})
-    conv_id_str = conv_data.get('id') or payload.get('conversationId') or f"conv_{contact_phone}"
-    message_ts = _parse_payload_datetime(msg_data.get('timestamp'), payload.get('timestamp'), event_timestamp)
-    
-    conversation = SupportConversation.query.filter_by(zenvia_conversation_id=conv_id_str).first()
+    conversation = refs["conversations"].get(conv_id_str)
     created_conversation = False
     if not conversation:
         conversation = SupportConversation(
             zenvia_conversation_id=conv_id_str,
-            contact_id=contact.id,
+            contact=contact,
             channel=channel,
             from_number=from_num,
             to_number=to_num,
@@ -89,7 +201,7 @@ def _process_message(payload, channel, event_timestamp=None):
             last_message_at=message_ts
         )
         db.session.add(conversation)
-        db.session.flush()
+        refs["conversations"][conv_id_str] = conversation
         created_conversation = True
     else:
         if not conversation.created_at_zenvia:
@@ -98,14 +210,10 @@ def _process_message(payload, channel, event_timestamp=None):
         conversation.from_number = conversation.from_number or from_num
         conversation.to_number = conversation.to_number or to_num
 
-    msg = SupportMessage.query.filter_by(zenvia_message_id=msg_id).first()
-    if not msg:
-        contents = msg_data.get('contents', [{}])
-        content_type = contents[0].get('type', 'text')
-        text = contents[0].get('text', '')
+    if msg_id not in refs["messages"]:
         msg = SupportMessage(
             zenvia_message_id=msg_id,
-            conversation_id=conversation.id,
+            conversation=conversation,
             direction=direction,
             channel=channel,
             content_type=content_type,
@@ -114,25 +222,28 @@ def _process_message(payload, channel, event_timestamp=None):
             timestamp=message_ts
         )
         db.session.add(msg)
+        refs["messages"][msg_id] = msg
     return created_conversation
 
-def _process_message_status(payload):
+def _process_message_status(payload, refs):
     msg_id = payload.get('messageId')
     status_code = payload.get('messageStatus', {}).get('code')
     if msg_id:
-        msg = SupportMessage.query.filter_by(zenvia_message_id=msg_id).first()
+        msg = refs["messages"].get(msg_id)
         if msg:
             msg.status = status_code
 
-def _process_conversation_status(payload, channel):
+def _process_conversation_status(payload, channel, refs):
     conv_id_str = payload.get('conversationId')
     status = payload.get('status')
     status_ts = _parse_payload_datetime(payload.get('timestamp'))
     if conv_id_str:
-        conversation = SupportConversation.query.filter_by(zenvia_conversation_id=conv_id_str).first()
+        conversation = refs["conversations"].get(conv_id_str)
         if conversation:
+            resolution_time_seconds = conversation.resolution_time_seconds
+            if status == "CLOSED" and conversation.created_at_zenvia:
+                resolution_time_seconds = int((status_ts - conversation.created_at_zenvia).total_seconds())
             conversation.status = status
             if status == "CLOSED":
                 conversation.closed_at = status_ts
-                if conversation.created_at_zenvia:
-                    conversation.resolution_time_seconds = int((status_ts - conversation.created_at_zenvia).total_seconds())
+                conversation.resolution_time_seconds = resolution_time_seconds
@@ -22,6 +22,7 @@ from app.services.forecast_service import ForecastService
 from app.services.integration_analytics_service import IntegrationAnalyticsService
 from app.services.llm_service import LLMService
 from app.services.scoring_service import ScoringService
+from app.services.risk_service import StoreRiskService
 
 logger = logging.getLogger(__name__)
 
@@ -484,15 +485,16 @@ class JarvisService:
     def _get_critical_stores(self, route):
         limit = route.get("entities", {}).get("limit") or 10
         stores = Store.query.filter(Store.status_norm.notin_(["DONE", "CANCELED"])).all()
-        ranked = sorted(stores, key=self._store_risk_score, reverse=True)[:limit]
+        risk_scores = self._risk_scores(stores)
+        ranked = sorted(stores, key=lambda store: risk_scores[store.id], reverse=True)[:limit]
         return {
             "tool": "get_critical_stores",
             "status": "ok",
             "period": self._public_period(route["period"]),
             "metrics": {"total_critical_candidates": len(stores), "returned": len(ranked)},
-            "records": [self._store_record(store) for store in ranked],
+            "records": [self._store_record(store, risk_scores) for store in ranked],
             "alerts": [{"type": "critical_stores", "message": f"{len(ranked)} lojas priorizadas por risco composto."}],
-            "limitations": ["Ranking heurístico: combina idle, SLA, status, MRR e flags de integração."],
+            "limitations": ["Ranking pelo score de risco oficial (prazo, idle, financeiro e qualidade)."],
         }
 
     def _get_sla_risks(self, route):
@@ -505,7 +507,8 @@ class JarvisService:
             if days > sla_limit or idle > 7 or store.status_norm == "BLOCKED":
                 risk_stores.append(store)
 
-        risk_stores = sorted(risk_stores, key=self._store_risk_score, reverse=True)[:15]
+        risk_scores = self._risk_scores(risk_stores)
+        risk_stores = sorted(risk_stores, key=lambda store: risk_scores[store.id], reverse=True)[:15]
         return {
             "tool": "get_sla_risks",
             "status": "ok",
@@ -516,7 +519,7 @@ class JarvisService:
                 "idle_over_7_count": sum(1 for store in risk_stores if (store.idle_days or 0) > 7),
                 "blocked_count": sum(1 for store in risk_stores if store.status_norm == "BLOCKED"),
             },
-            "records": [self._store_record(store) for store in risk_stores],
+            "records": [self._store_record(store, risk_scores) for store in risk_stores],
             "alerts": self._sla_alerts(risk_stores),
             "limitations": ["SLA em lojas ativas usa tempo de contrato e dias em progresso disponíveis."],
         }
@@ -536,6 +539,7 @@ class JarvisService:
             )
         delivered = delivered_query.all()
         blocked = [store for store in active if store.status_norm == "BLOCKED" or (store.idle_days or 0) > 7]
+        risk_scores = self._risk_scores(blocked)
         return {
             "tool": "get_mrr_summary",
             "status": "ok",
@@ -548,7 +552,10 @@ class JarvisService:
                 "active_count": len(active),
                 "blocked_or_idle_count": len(blocked),
             },
-            "records": [self._store_record(store) for store in sorted(blocked, key=self._store_risk_score, reverse=True)[:10]],
+            "records": [
+                self._store_record(store, risk_scores)
+                for store in sorted(blocked, key=lambda store: risk_scores[store.id], reverse=True)[:10]
+            ],
             "alerts": [{"type": "mrr_at_risk", "message": "MRR travado considera lojas bloqueadas ou com idle acima de 7 dias."}],
             "limitations": ["Não separa inadimplência financeira sem campo operacional dedicado por vencimento."],
         }
@@ -601,6 +608,7 @@ class JarvisService:
         if end:
             query = query.filter(or_(Store.manual_finished_at <= end, Store.end_real_at <= end, Store.finished_at <= end))
         stores = query.all()
+        risk_scores = self._risk_scores(stores[:30])
         return {
             "tool": "get_monthly_delivery_summary",
             "status": "ok",
@@ -609,7 +617,7 @@ class JarvisService:
                 "delivered_count": len(stores),
                 "delivered_mrr": round(sum(store.valor_mensalidade or 0 for store in stores), 2),
             },
-            "records": [self._store_record(store) for store in stores[:30]],
+            "records": [self._store_record(store, risk_scores) for store in stores[:30]],
             "alerts": [],
             "limitations": [],
         }
@@ -1113,7 +1121,7 @@ Regras:
                 return name
         return None
 
-    def _store_record(self, store):
+    def _store_record(self, store, risk_scores):
         metric = (store.integration_metrics or [None])[-1] if hasattr(store, "integration_metrics") else None
         return {
             "id": store.id,
@@ -1125,25 +1133,14 @@ Regras:
             "dias_em_progresso": getattr(store, "dias_em_progresso", None),
             "tempo_contrato": store.tempo_contrato,
             "mrr": store.valor_mensalidade,
-            "risk_score": self._store_risk_score(store),
+            "risk_score": risk_scores.get(store.id, 0),
             "churn_risk": bool(metric.churn_risk) if metric else False,
             "blocking_issue": bool(metric.has_blocking_issue) if metric else False,
         }
 
-    def _store_risk_score(self, store):
-        idle = store.idle_days or 0
-        mrr = store.valor_mensalidade or 0
-        days = getattr(store, "dias_em_progresso", None) or store.total_time_days or 0
-        sla = store.tempo_contrato or 90
-        score = min(idle * 4, 40) + min((mrr / 1000) * 5, 25)
-        if days > sla:
-            score += 25
-        if store.status_norm == "BLOCKED":
-            score += 20
-        metric = (store.integration_metrics or [None])[-1] if hasattr(store, "integration_metrics") else None
-        if metric and (metric.churn_risk or metric.has_blocking_issue):
-            score += 20
-        return round(score, 1)
+    def _risk_scores(self, stores):
+        """Score oficial materializado em store_risk: {store_id: total}."""
+        return {store_id: risk["total"] for store_id, risk in StoreRiskService().get_many(stores).items()}
 
     def _store_alerts(self, store, metric=None):
         alerts = []
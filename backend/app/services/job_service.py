@@ -0,0 +1,337 @@
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import select
+from app.models import db, BackgroundJob, BackgroundJobEvent
+from app.services.lease_service import LeaseService
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_STATUSES = ('QUEUED', 'RUNNING')
+HEARTBEAT_SECONDS = 15
+
+
+class JobConflictError(Exception):
+    """Ja existe um job ativo exclusivo do mesmo tipo, mas com outros parametros."""
+
+    def __init__(self, job):
+        super().__init__(f"Ja existe um job {job.job_type} ativo (#{job.id}) com outros parametros. Aguarde o termino.")
+        self.job = job
+
+
+def _sync_stream(params, emit):
+    """Sync completo/vital: repassa as mensagens do gerador SSE original para o log do job."""
+    from app.services.sync_service import SyncService
+
+    for chunk in SyncService().run_sync_stream(
+        force_full=bool(params.get('full')), vital_only=bool(params.get('vital_only'))
+    ):
+        message = chunk.strip()
+        if message.startswith('data:'):
+            message = message[len('data:'):].strip()
+        if not message or message == '[DONE]':
+            continue
+        if message.startswith('❌ Erro Fatal'):
+            raise RuntimeError(message.split(':', 1)[-1].strip())
+        emit(message)
+    return None
+
+
+def _deep_sync(params, emit):
+    from app.services.sync_service import SyncService
+
+    store_id = int(params['store_id'])
+    emit(f"Deep sync da loja {store_id}...")
+    result = SyncService().run_deep_sync(store_id)
+    if 'error' in result:
+        raise RuntimeError(result['error'])
+    return result
+
+
+def _integration_sync(params, emit):
+    from app.services.sync_service import SyncService
+
+    emit("Sincronizando lista de Integracao...")
+    return SyncService().run_integration_sync()
+
+
+def _implantacao_sync(params, emit):
+    from app.services.sync_service import SyncService
+
+    emit("Sincronizando listas de Implantacao...")
+    return SyncService().run_implantacao_sync()
+
+
+class JobService:
+    """
+    Fila de jobs longos persistida em background_jobs. O request apenas enfileira;
+    a execucao roda num pool de threads do processo, com heartbeat e log de progresso
+    em background_job_events (lido pelo SSE). A varredura do scheduler assume jobs
+    que ficaram na fila e encerra os que perderam o heartbeat (worker reciclado).
+    """
+    HANDLERS = {
+        'sync': _sync_stream,
+        'deep_sync': _deep_sync,
+        'integration_sync': _integration_sync,
+        'implantacao_sync': _implantacao_sync,
+    }
+    # Tipos com no maximo um job ativo, independente dos parametros (outro pedido diferente recebe conflito).
+    EXCLUSIVE_TYPES = {'sync', 'integration_sync', 'implantacao_sync'}
+    # Tipos que escrevem a partir do ClickUp: serializados com os syncs agendados e os webhooks.
+    CLICKUP_TYPES = {'sync', 'deep_sync', 'integration_sync', 'implantacao_sync'}
+    CLICKUP_LOCK_WAIT_SECONDS = 120
+
+    _executor = None
+    _executor_lock = threading.Lock()
+    # Jobs ja entregues ao pool deste processo (na fila local ou rodando).
+    _submitted = set()
+    _submitted_lock = threading.Lock()
+
+    @classmethod
+    def _pool(cls):
+        with cls._executor_lock:
+            if cls._executor is None:
+                cls._executor = ThreadPoolExecutor(max_workers=Config.JOB_WORKERS, thread_name_prefix='job')
+            return cls._executor
+
+    @staticmethod
+    def _worker_name():
+        return f"{socket.gethostname()}:{os.getpid()}"[:100]
+
+    @classmethod
+    def find_active(cls, job_type, params=None):
+        """Job ainda na fila ou rodando do mesmo tipo (e mesmos parametros, se nao exclusivo)."""
+        query = BackgroundJob.query.filter(
+            BackgroundJob.job_type == job_type, BackgroundJob.status.in_(ACTIVE_STATUSES)
+        )
+        if job_type not in cls.EXCLUSIVE_TYPES:
+            query = query.filter(BackgroundJob.params == json.dumps(params or {}, sort_keys=True))
+        return query.order_by(BackgroundJob.id.desc()).first()
+
+    @classmethod
+    def enqueue(cls, job_type, params=None, created_by=None):
+        """
+        Cria o job (ou reaproveita o ativo equivalente) e agenda a execucao neste processo.
+        Levanta JobConflictError se um tipo exclusivo ja estiver ativo com outros parametros.
+        """
+        if job_type not in cls.HANDLERS:
+            raise ValueError(f"Tipo de job desconhecido: {job_type}")
+
+        encoded_params = json.dumps(params or {}, sort_keys=True)
+        active = cls.find_active(job_type, params)
+        if active:
+            if json.loads(active.params or '{}') != json.loads(encoded_params):
+                raise JobConflictError(active)
+            return active
+
+        job = BackgroundJob(
+            job_type=job_type,
+            params=encoded_params,
+            created_by=str(created_by) if created_by is not None else None,
+        )
+        db.session.add(job)
+        db.session.commit()
+        cls.submit(job.id)
+        return job
+
+    @classmethod
+    def submit(cls, job_id):
+        """Agenda o job no pool; False se este processo ja o agendou e ele nao terminou."""
+        with cls._submitted_lock:
+            if job_id in cls._submitted:
+                return False
+            cls._submitted.add(job_id)
+        try:
+            future = cls._pool().submit(cls._execute, current_app._get_current_object(), job_id)
+        except Exception:
+            with cls._submitted_lock:
+                cls._submitted.discard(job_id)
+            raise
+        future.add_done_callback(lambda _: cls._forget_submitted(job_id))
+        return True
+
+    @classmethod
+    def _forget_submitted(cls, job_id):
+        with cls._submitted_lock:
+            cls._submitted.discard(job_id)
+
+    @classmethod
+    def _claim(cls, job_id):
+        """Passa o job de QUEUED para RUNNING de forma atomica (um unico executor por job)."""
+        now = datetime.now()
+        claimed = BackgroundJob.query.filter_by(id=job_id, status='QUEUED').update({
+            'status': 'RUNNING',
+            'started_at': now,
+            'heartbeat_at': now,
+            'worker': cls._worker_name(),
+        }, synchronize_session=False)
+        db.session.commit()
+        return claimed == 1
+
+    @classmethod
+    def _execute(cls, app, job_id):
+        with app.app_context():
+            try:
+                if not cls._claim(job_id):
+                    return
+                job = db.session.get(BackgroundJob, job_id)
+                job_type = job.job_type
+                params = json.loads(job.params or '{}')
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"[Jobs] Falha ao iniciar job {job_id}: {e}")
+                return
+
+            engine = db.engine
+            stop_event = threading.Event()
+            threading.Thread(
+                target=cls._heartbeat_loop, args=(engine, job_id, stop_event), daemon=True
+            ).start()
+
+            status, result, error = 'SUCCESS', None, None
+            try:
+                logger.info(f"[Jobs] Iniciando job {job_id} ({job_type}).")
+                result = cls._run_handler(job_type, params, lambda message: cls.emit(job_id, message, engine))
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"[Jobs] Job {job_id} ({job_type}) falhou: {e}")
+                status, error = 'ERROR', str(e)
+                cls.emit(job_id, f"❌ Erro: {e}", engine)
+            finally:
+                stop_event.set()
+                cls._finish(engine, job_id, status, result, error)
+                db.session.remove()
+
+    @classmethod
+    def _run_handler(cls, job_type, params, emit):
+        handler = cls.HANDLERS[job_type]
+        if job_type not in cls.CLICKUP_TYPES:
+            return handler(params, emit)
+
+        with LeaseService.hold(LeaseService.CLICKUP_SYNC, wait_seconds=cls.CLICKUP_LOCK_WAIT_SECONDS) as acquired:
+            if not acquired:
+                raise RuntimeError("Outro sync do ClickUp esta em andamento. Tente novamente em instantes.")
+            return handler(params, emit)
+
+    @staticmethod
+    def emit(job_id, message, engine=None):
+        """Anexa uma mensagem ao log do job em conexao propria (nao comita a sessao do handler)."""
+        now = datetime.now()
+        with (engine or db.engine).begin() as conn:
+            conn.execute(BackgroundJobEvent.__table__.insert().values(
+                job_id=job_id, message=' '.join(str(message).split()), created_at=now
+            ))
+            conn.execute(BackgroundJob.__table__.update().where(
+                BackgroundJob.__table__.c.id == job_id
+            ).values(heartbeat_at=now))
+
+    @staticmethod
+    def _heartbeat_loop(engine, job_id, stop_event):
+        table = BackgroundJob.__table__
+        while not stop_event.wait(HEARTBEAT_SECONDS):
+            try:
+                with engine.begin() as conn:
+                    conn.execute(table.update().where(table.c.id == job_id).values(heartbeat_at=datetime.now()))
+            except Exception as e:
+                logger.warning(f"[Jobs] Falha no heartbeat do job {job_id}: {e}")
+
+    @staticmethod
+    def _finish(engine, job_id, status, result, error):
+        table = BackgroundJob.__table__
+        now = datetime.now()
+        with engine.begin() as conn:
+            conn.execute(table.update().where(table.c.id == job_id).values(
+                status=status,
+                result=json.dumps(result, default=str) if result is not None else None,
+                error=error,
+                heartbeat_at=now,
+                finished_at=now,
+            ))
+
+    @staticmethod
+    def events_since(job_id, after_id=0, limit=500):
+        return BackgroundJobEvent.query.filter(
+            BackgroundJobEvent.job_id == job_id, BackgroundJobEvent.id > after_id
+        ).order_by(BackgroundJobEvent.id).limit(limit).all()
+
+    @staticmethod
+    def stream(job_id, after_id=0, poll_seconds=1.0, keepalive_seconds=15):
+        """
+        Gerador SSE que acompanha o log do job. Cada evento leva o id como cursor, entao
+        uma reconexao (Last-Event-ID) retoma de onde parou; o job segue rodando se o
+        cliente cair. Termina com [DONE] quando o job sai da fila/execucao.
+        """
+        jobs = BackgroundJob.__table__
+        events = BackgroundJobEvent.__table__
+        engine = db.engine
+        last_id = after_id or 0
+        idle = 0.0
+        while True:
+            with engine.connect() as conn:
+                # Status antes dos eventos: se ja terminou, todos os eventos estao gravados.
+                status = conn.execute(select(jobs.c.status).where(jobs.c.id == job_id)).scalar()
+                rows = conn.execute(
+                    select(events.c.id, events.c.message)
+                    .where(events.c.job_id == job_id, events.c.id > last_id)
+                    .order_by(events.c.id).limit(500)
+                ).all()
+
+            for row in rows:
+                last_id = row.id
+                yield f"id: {row.id}\ndata: {row.message}\n\n"
+
+            if rows:
+                idle = 0.0
+                continue
+            if status not in ACTIVE_STATUSES:
+                yield "data: [DONE]\n\n"
+                return
+
+            time.sleep(poll_seconds)
+            idle += poll_seconds
+            if idle >= keepalive_seconds:
+                # Comentario SSE: mantem proxies e o navegador com a conexao aberta.
+                yield ": keepalive\n\n"
+                idle = 0.0
+
+    @classmethod
+    def recover(cls):
+        """
+        Varredura periodica: assume jobs que ficaram na fila, encerra os que perderam o
+        heartbeat (processo reciclado no meio) e remove o historico antigo. Jobs que ja
+        aguardam no pool deste processo nao sao reagendados (submit os ignora).
+        """
+        now = datetime.now()
+        stale_before = now - timedelta(seconds=Config.JOB_STALE_SECONDS)
+
+        stale = BackgroundJob.query.filter(
+            BackgroundJob.status == 'RUNNING', BackgroundJob.heartbeat_at < stale_before
+        ).update({
+            'status': 'ERROR',
+            'error': 'Job interrompido: processo sem heartbeat.',
+            'finished_at': now,
+        }, synchronize_session=False)
+
+        old_jobs = BackgroundJob.query.filter(
+            BackgroundJob.finished_at < now - timedelta(days=Config.JOB_RETENTION_DAYS)
+        ).with_entities(BackgroundJob.id)
+        BackgroundJobEvent.query.filter(BackgroundJobEvent.job_id.in_(old_jobs.scalar_subquery())).delete(synchronize_session=False)
+        purged = BackgroundJob.query.filter(
+            BackgroundJob.finished_at < now - timedelta(days=Config.JOB_RETENTION_DAYS)
+        ).delete(synchronize_session=False)
+        db.session.commit()
+
+        queued = [job_id for (job_id,) in BackgroundJob.query.filter(
+            BackgroundJob.status == 'QUEUED',
+            BackgroundJob.created_at < now - timedelta(seconds=Config.JOB_POLL_SECONDS),
+        ).with_entities(BackgroundJob.id).all()]
+        resumed = sum(1 for job_id in queued if cls.submit(job_id))
+
+        return {"stale": stale, "purged": purged, "resumed": resumed}
@@ -0,0 +1,122 @@
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from sqlalchemy.exc import IntegrityError
+from app.models import db, SchedulerLease
+
+logger = logging.getLogger(__name__)
+
+
+class LeaseService:
+    """
+    Lock distribuido por lease: uma linha em scheduler_leases com dono e expiracao.
+    Quem detem o lease renova a expiracao em segundo plano; se o processo morrer, o
+    lease expira sozinho e outra instancia assume. Funciona em Postgres e SQLite e usa
+    conexao propria, sem interferir na sessao do job.
+    """
+    # Lease compartilhado por tudo que escreve a partir do ClickUp (syncs e webhooks).
+    CLICKUP_SYNC = 'clickup_sync'
+
+    @staticmethod
+    def _new_owner():
+        return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"[:150]
+
+    @classmethod
+    def acquire(cls, name, ttl_seconds, engine=None):
+        """Tenta obter o lease; devolve o token do dono ou None se outra instancia o detem."""
+        engine = engine or db.engine
+        table = SchedulerLease.__table__
+        owner = cls._new_owner()
+        now = datetime.now()
+        values = {
+            'owner': owner,
+            'acquired_at': now,
+            'heartbeat_at': now,
+            'expires_at': now + timedelta(seconds=ttl_seconds),
+        }
+        with engine.begin() as conn:
+            taken = conn.execute(
+                table.update().where(table.c.name == name, table.c.expires_at < now).values(**values)
+            ).rowcount
+        if taken:
+            return owner
+        try:
+            with engine.begin() as conn:
+                conn.execute(table.insert().values(name=name, **values))
+            return owner
+        except IntegrityError:
+            # Linha ja existe e o lease ainda esta valido.
+            return None
+
+    @staticmethod
+    def renew(name, owner, ttl_seconds, engine=None):
+        """Estende a expiracao; False se o lease foi perdido (expirou e outro assumiu)."""
+        table = SchedulerLease.__table__
+        now = datetime.now()
+        with (engine or db.engine).begin() as conn:
+            return bool(conn.execute(
+                table.update().where(table.c.name == name, table.c.owner == owner).values(
+                    heartbeat_at=now, expires_at=now + timedelta(seconds=ttl_seconds)
+                )
+            ).rowcount)
+
+    @staticmethod
+    def release(name, owner, hold_seconds=0, engine=None):
+        """
+        Libera o lease. hold_seconds mantem o lease por um tempo apos o fim, para que
+        instancias disparadas no mesmo horario (cron) com atraso nao repitam o job.
+        """
+        table = SchedulerLease.__table__
+        with (engine or db.engine).begin() as conn:
+            conn.execute(table.update().where(table.c.name == name, table.c.owner == owner).values(
+                expires_at=datetime.now() + timedelta(seconds=hold_seconds)
+            ))
+
+    @classmethod
+    def _renew_loop(cls, engine, name, owner, ttl_seconds, stop_event):
+        while not stop_event.wait(max(1.0, ttl_seconds / 3)):
+            try:
+                if not cls.renew(name, owner, ttl_seconds, engine):
+                    logger.warning(f"[Lease] Lease '{name}' perdido durante a execucao.")
+                    return
+            except Exception as e:
+                logger.warning(f"[Lease] Falha ao renovar lease '{name}': {e}")
+
+    @classmethod
+    @contextmanager
+    def hold(cls, name, ttl_seconds=300, hold_seconds=0, wait_seconds=0):
+        """
+        Context manager: entrega True se obteve o lease (renovado enquanto o bloco roda)
+        ou False se outra instancia o detem apos esperar ate wait_seconds.
+        """
+        engine = db.engine
+        deadline = time.monotonic() + wait_seconds
+        owner = cls.acquire(name, ttl_seconds, engine)
+        while not owner and time.monotonic() < deadline:
+            time.sleep(min(5.0, max(0.1, deadline - time.monotonic())))
+            owner = cls.acquire(name, ttl_seconds, engine)
+
+        if not owner:
+            yield False
+            return
+
+        stop_event = threading.Event()
+        renewer = threading.Thread(
+            target=cls._renew_loop, args=(engine, name, owner, ttl_seconds, stop_event), daemon=True
+        )
+        renewer.start()
+        try:
+            yield True
+        finally:
+            stop_event.set()
+            # Uma renovacao em andamento poderia gravar depois da liberacao e estender o lease.
+            renewer.join()
+            try:
+                cls.release(name, owner, hold_seconds, engine)
+            except Exception as e:
+                logger.warning(f"[Lease] Falha ao liberar lease '{name}': {e}")
@@ -1,11 +1,17 @@
 from datetime import datetime
 import json
+from sqlalchemy.orm import selectinload
 from app.models import db, Store, TaskStep, StoreSyncLog
 from app.services.status_normalizer import StatusNormalizer
+from app.services.bulk_writer import column_defaults, upsert_rows
 
 class MetricsService:
     """Centraliza a atualizacao dos modelos a partir dos dados do ClickUp."""
 
+    def __init__(self):
+        # Lojas alteradas desde o ultimo recalculo de risco (consumido pelo SyncService).
+        self.touched_store_ids = set()
+
     def log_change(self, store, field_name, old_value, new_value, source='sync', timestamp=None):
         if str(old_value) != str(new_value):
             log = StoreSyncLog(
@@ -18,9 +24,28 @@ class MetricsService:
             )
             db.session.add(log)
 
-    def process_store_data(self, task_data):
-        clickup_id = task_data['id']
-        store_name = task_data['name']
+    # Colunas de Store/TaskStep escritas pelo sync (usadas no diff e no upsert em lote).
+    STORE_SYNC_COLUMNS = [
+        'store_name', 'custom_store_id', 'clickup_url', 'status', 'status_raw', 'status_norm',
+        'created_at', 'start_real_at', 'finished_at', 'assignees_json', 'implantador',
+        'implantador_atual', 'implantador_original', 'valor_mensalidade', 'valor_implantacao',
+        'erp', 'cnpj', 'crm', 'idle_days', 'description', 'last_comments', 'total_time_tracked',
+    ]
+    STEP_SYNC_COLUMNS = [
+        'store_id', 'step_name', 'step_list_name', 'status', 'created_at', 'closed_at',
+        'start_real_at', 'end_real_at', 'total_time_days', 'idle_days', 'description', 'last_comments',
+    ]
+
+    @staticmethod
+    def _ts(value):
+        return datetime.fromtimestamp(int(value) / 1000)
+
+    def _map_store_task(self, task_data, row, is_new):
+        """
+        Aplica os dados do ClickUp sobre `row` (dict com STORE_SYNC_COLUMNS).
+        Retorna as alteracoes rastreadas como [(campo, antigo, novo, timestamp)].
+        """
+        changes = []
         
         # Identifica o codigo interno da loja nos campos customizados do ClickUp.
         custom_id = task_data.get('custom_id')
@@ -34,56 +59,45 @@ class MetricsService:
         if not custom_id: 
             custom_id = "N/A"
 
-        store = Store.query.filter_by(clickup_task_id=clickup_id).first()
-        is_new = False
-        if not store:
-            store = Store(clickup_task_id=clickup_id)
-            store.store_name = store_name
-            store.custom_store_id = custom_id
-            is_new = True
-            db.session.add(store)
-            db.session.flush() # Necessario para logs que dependem do ID.
+        # Captura valores antigos para registrar alteracoes relevantes.
+        old_status = row['status']
+        old_implantador = row['implantador']
+        old_mrr = row['valor_mensalidade']
+        old_impl = row['valor_implantacao']
         
-        if not is_new:
-            # Captura valores antigos para registrar alteracoes relevantes.
-            old_status = store.status
-            old_implantador = store.implantador
-            old_mrr = store.valor_mensalidade
-            old_impl = store.valor_implantacao
-        
-        store.store_name = store_name
-        store.custom_store_id = custom_id
-        store.clickup_url = task_data.get('url')
+        row['store_name'] = task_data['name']
+        row['custom_store_id'] = custom_id
+        row['clickup_url'] = task_data.get('url')
         
         # Usa date_updated do ClickUp como referencia temporal do log, quando disponivel.
         updated_at_ts = None
         if task_data.get('date_updated'):
-             updated_at_ts = datetime.fromtimestamp(int(task_data['date_updated']) / 1000)
+             updated_at_ts = self._ts(task_data['date_updated'])
 
         # Normaliza status externo para os estados internos usados pelo sistema.
         raw_status = task_data.get('status', {}).get('status', 'unknown')
-        store.status = raw_status 
-        store.status_raw = raw_status
-        store.status_norm = StatusNormalizer.normalize(raw_status)
+        row['status'] = raw_status 
+        row['status_raw'] = raw_status
+        row['status_norm'] = StatusNormalizer.normalize(raw_status)
         
         # Registra mudanca de status somente em lojas existentes.
         if not is_new:
-            self.log_change(store, 'status', old_status, raw_status, timestamp=updated_at_ts)
+            changes.append(('status', old_status, raw_status, updated_at_ts))
 
         # Datas principais vindas do ClickUp.
         if task_data.get('date_created'):
-            store.created_at = datetime.fromtimestamp(int(task_data['date_created']) / 1000)
+            row['created_at'] = self._ts(task_data['date_created'])
         
         # Data inicial efetiva: ClickUp date_started ou data de criacao.
         if task_data.get('date_started'):
-             store.start_real_at = datetime.fromtimestamp(int(task_data['date_started']) / 1000)
+             row['start_real_at'] = self._ts(task_data['date_started'])
         else:
-             store.start_real_at = store.created_at
+             row['start_real_at'] = row['created_at']
 
         if task_data.get('date_closed'):
-            store.finished_at = datetime.fromtimestamp(int(task_data['date_closed']) / 1000)
+            row['finished_at'] = self._ts(task_data['date_closed'])
         elif task_data.get('date_done'):
-             store.finished_at = datetime.fromtimestamp(int(task_data['date_done']) / 1000)
+             row['finished_at'] = self._ts(task_data['date_done'])
             
         # Responsavel atual e snapshot completo dos assignees.
         assignees = task_data.get('assignees', [])
@@ -91,22 +105,22 @@ class MetricsService:
         if assignees:
             current_assignee = assignees[0]['username']
             # Salvar JSON completo (V6)
-            store.assignees_json = json.dumps([{
+            row['assignees_json'] = json.dumps([{
                 'id': a.get('id'),
                 'username': a.get('username'),
                 'avatar': a.get('profilePicture'),
                 'initials': a.get('initials')
             } for a in assignees])
             
-        store.implantador = current_assignee
-        store.implantador_atual = current_assignee
+        row['implantador'] = current_assignee
+        row['implantador_atual'] = current_assignee
         
         # O responsavel original e definido na primeira vez em que houver assignee.
-        if not store.implantador_original and current_assignee:
-            store.implantador_original = current_assignee
+        if not row['implantador_original'] and current_assignee:
+            row['implantador_original'] = current_assignee
         
         if not is_new:
-            self.log_change(store, 'implantador', old_implantador, current_assignee, timestamp=updated_at_ts)
+            changes.append(('implantador', old_implantador, current_assignee, updated_at_ts))
 
         # Mapeia campos customizados comerciais sem alterar nomes externos.
         for field in task_data.get('custom_fields', []):
@@ -121,55 +135,52 @@ class MetricsService:
                 try: 
                     new_val = float(val_str)
                     if not is_new:
-                        self.log_change(store, 'valor_mensalidade', old_mrr, new_val, timestamp=updated_at_ts)
-                    store.valor_mensalidade = new_val
+                        changes.append(('valor_mensalidade', old_mrr, new_val, updated_at_ts))
+                    row['valor_mensalidade'] = new_val
                 except (ValueError, TypeError): 
                     pass
             elif 'implantação' in fname:
                 try: 
                     new_val = float(val_str)
                     if not is_new:
-                        self.log_change(store, 'valor_implantacao', old_impl, new_val, timestamp=updated_at_ts)
-                    store.valor_implantacao = new_val
+                        changes.append(('valor_implantacao', old_impl, new_val, updated_at_ts))
+                    row['valor_implantacao'] = new_val
                 except (ValueError, TypeError): 
                     pass
             elif 'erp' in fname:
-                store.erp = val_str[:500] if len(val_str) > 500 else val_str
+                row['erp'] = val_str[:500] if len(val_str) > 500 else val_str
             elif 'cnpj' in fname:
-                store.cnpj = val_str[:200] if len(val_str) > 200 else val_str
+                row['cnpj'] = val_str[:200] if len(val_str) > 200 else val_str
             elif 'crm' in fname:
-                store.crm = val_str[:200] if len(val_str) > 200 else val_str
+                row['crm'] = val_str[:200] if len(val_str) > 200 else val_str
         
         # Dias sem atualizacao desde o ultimo date_updated recebido.
         if updated_at_ts:
              delta = datetime.now() - updated_at_ts
-             store.idle_days = delta.days
+             row['idle_days'] = delta.days
         
         # Contexto textual usado pelos modulos de IA/diagnostico.
         if task_data.get('description'):
-            store.description = task_data.get('description')
+            row['description'] = task_data.get('description')
         if task_data.get('comments_text'): # Passado pelo SyncService
-            store.last_comments = task_data.get('comments_text')
-        
-        db.session.add(store)
-        return store
+            row['last_comments'] = task_data.get('comments_text')
+        if task_data.get('total_time_tracked') is not None: # Time Tracking (V6)
+            row['total_time_tracked'] = task_data['total_time_tracked']
 
-    def process_step_data(self, store_db, task_data, manual_flags=None):
-        clickup_id = task_data['id']
-        step = TaskStep.query.filter_by(clickup_task_id=clickup_id).first()
-        if not step:
-            step = TaskStep(clickup_task_id=clickup_id)
-            step.store_id = store_db.id
-            db.session.add(step)
-            db.session.flush() # Necessario para checar flags manuais pelo ID.
-            
-        step.store_id = store_db.id
-        step.step_name = task_data['name']
-        step.step_list_name = task_data.get('step_type_name', 'UNKNOWN')
-        step.status = task_data.get('status', {}).get('status')
+        return [c for c in changes if str(c[1]) != str(c[2])]
+
+    def _map_step_task(self, task_data, row, step_id, store_id, manual_flags, last_finished_lookup):
+        """
+        Aplica os dados do ClickUp sobre `row` (dict com STEP_SYNC_COLUMNS).
+        `last_finished_lookup(limit_date)` devolve o fim da ultima etapa concluida da loja.
+        """
+        row['store_id'] = store_id
+        row['step_name'] = task_data['name']
+        row['step_list_name'] = task_data.get('step_type_name', 'UNKNOWN')
+        row['status'] = task_data.get('status', {}).get('status')
         
         if task_data.get('date_created'):
-            step.created_at = datetime.fromtimestamp(int(task_data['date_created']) / 1000)
+            row['created_at'] = self._ts(task_data['date_created'])
             
         # Determinar se a data foi editada manualmente (Hierarquia Max) - OTIMIZADO via cache
         has_manual_start = False
@@ -177,63 +188,248 @@ class MetricsService:
         
         if manual_flags is not None:
             # Usa cache de flags manuais para evitar milhares de queries.
-            has_manual_start = f'step_start_{step.id}' in manual_flags.get(store_db.id, set())
-            has_manual_end = f'step_end_{step.id}' in manual_flags.get(store_db.id, set())
-        elif step.id:
+            has_manual_start = f'step_start_{step_id}' in manual_flags.get(store_id, set())
+            has_manual_end = f'step_end_{step_id}' in manual_flags.get(store_id, set())
+        elif step_id:
             # Fallback legado para chamadas unitarias.
-            has_manual_start = StoreSyncLog.query.filter_by(store_id=store_db.id, field_name=f'step_start_{step.id}', source='manual').first() is not None
-            has_manual_end = StoreSyncLog.query.filter_by(store_id=store_db.id, field_name=f'step_end_{step.id}', source='manual').first() is not None
+            has_manual_start = StoreSyncLog.query.filter_by(store_id=store_id, field_name=f'step_start_{step_id}', source='manual').first() is not None
+            has_manual_end = StoreSyncLog.query.filter_by(store_id=store_id, field_name=f'step_end_{step_id}', source='manual').first() is not None
 
         if not has_manual_start:
             if task_data.get('date_started'):
-                step.start_real_at = datetime.fromtimestamp(int(task_data['date_started']) / 1000)
+                row['start_real_at'] = self._ts(task_data['date_started'])
             else:
                 # Fallback: usa o fim da etapa concluida imediatamente anterior.
-                limit_date = step.end_real_at or datetime.now()
-                # Otimizacao: apenas uma query nesse caminho raro.
-                last_finished_step = TaskStep.query.filter(
-                    TaskStep.store_id == store_db.id, 
-                    TaskStep.id != step.id, 
-                    TaskStep.end_real_at.isnot(None),
-                    TaskStep.end_real_at <= limit_date
-                ).order_by(TaskStep.end_real_at.desc()).first()
-                if last_finished_step:
-                    step.start_real_at = last_finished_step.end_real_at
+                limit_date = row['end_real_at'] or datetime.now()
+                last_finished_end = last_finished_lookup(limit_date)
+                if last_finished_end:
+                    row['start_real_at'] = last_finished_end
                 else:
-                    step.start_real_at = step.created_at
+                    row['start_real_at'] = row['created_at']
             
         if not has_manual_end:
             if task_data.get('date_closed'):
-                step.end_real_at = datetime.fromtimestamp(int(task_data['date_closed']) / 1000)
-                step.closed_at = step.end_real_at
+                row['end_real_at'] = self._ts(task_data['date_closed'])
+                row['closed_at'] = row['end_real_at']
 
         # Trava de seguranca: inicio nao pode ser maior que fim.
-        if step.start_real_at and step.end_real_at and step.start_real_at > step.end_real_at:
-             step.start_real_at = step.created_at or step.end_real_at
+        if row['start_real_at'] and row['end_real_at'] and row['start_real_at'] > row['end_real_at']:
+             row['start_real_at'] = row['created_at'] or row['end_real_at']
 
         if task_data.get('date_updated'):
-             updated_at = datetime.fromtimestamp(int(task_data['date_updated']) / 1000)
+             updated_at = self._ts(task_data['date_updated'])
              delta = datetime.now() - updated_at
-             step.idle_days = delta.days
+             row['idle_days'] = delta.days
         
-        if step.start_real_at and step.end_real_at:
-            delta = step.end_real_at - step.start_real_at
-            step.total_time_days = round(max(0.0, delta.total_seconds() / 86400), 2)
-        elif step.start_real_at and not step.end_real_at:
-            delta = datetime.now() - step.start_real_at
-            step.total_time_days = round(max(0.0, delta.total_seconds() / 86400), 2)
+        if row['start_real_at'] and row['end_real_at']:
+            delta = row['end_real_at'] - row['start_real_at']
+            row['total_time_days'] = round(max(0.0, delta.total_seconds() / 86400), 2)
+        elif row['start_real_at'] and not row['end_real_at']:
+            delta = datetime.now() - row['start_real_at']
+            row['total_time_days'] = round(max(0.0, delta.total_seconds() / 86400), 2)
         else:
-            step.total_time_days = 0.0
+            row['total_time_days'] = 0.0
             
         # Contexto textual usado pelos modulos de IA/diagnostico.
         if task_data.get('description'):
-            step.description = task_data.get('description')
+            row['description'] = task_data.get('description')
         if task_data.get('comments_text'):
-            step.last_comments = task_data.get('comments_text')
+            row['last_comments'] = task_data.get('comments_text')
+
+    def process_store_data(self, task_data):
+        clickup_id = task_data['id']
+
+        store = Store.query.filter_by(clickup_task_id=clickup_id).first()
+        is_new = False
+        if not store:
+            store = Store(clickup_task_id=clickup_id)
+            store.store_name = task_data['name']
+            is_new = True
+            db.session.add(store)
+        
+        if is_new:
+            row = column_defaults(Store, self.STORE_SYNC_COLUMNS)
+        else:
+            row = {col: getattr(store, col) for col in self.STORE_SYNC_COLUMNS}
+        changes = self._map_store_task(task_data, row, is_new)
+        for col, value in row.items():
+            setattr(store, col, value)
+        if is_new:
+            db.session.flush() # Necessario para logs que dependem do ID.
+
+        for field_name, old_value, new_value, changed_at in changes:
+            self.log_change(store, field_name, old_value, new_value, timestamp=changed_at)
+        
+        db.session.add(store)
+        store.refresh_effective_dates()
+        if store.id:
+            self.touched_store_ids.add(store.id)
+        return store
+
+    def process_store_batch(self, tasks):
+        """
+        Versao em lote do process_store_data para uma pagina do ClickUp.
+        Pre-carrega as lojas com um IN (...), calcula os diffs em memoria e grava
+        tudo com um unico upsert; os StoreSyncLog saem dos mesmos diffs.
+        Retorna {clickup_task_id: Store}.
+        """
+        tasks_by_id = {t['id']: t for t in tasks}
+        if not tasks_by_id:
+            return {}
+
+        existing = {
+            s.clickup_task_id: s
+            for s in Store.query.filter(Store.clickup_task_id.in_(list(tasks_by_id))).all()
+        }
+        defaults = column_defaults(Store, self.STORE_SYNC_COLUMNS)
+
+        rows = []
+        pending_logs = []
+        for clickup_id, task_data in tasks_by_id.items():
+            store = existing.get(clickup_id)
+            if store:
+                current = {col: getattr(store, col) for col in self.STORE_SYNC_COLUMNS}
+            else:
+                current = dict(defaults)
+            row = dict(current)
+            changes = self._map_store_task(task_data, row, is_new=store is None)
+            if store is not None and row == current:
+                continue # Nada mudou: nenhuma escrita para esta loja.
+            rows.append({'clickup_task_id': clickup_id, **row})
+            pending_logs.extend((clickup_id, *change) for change in changes)
+
+        upsert_rows(Store, rows, ['clickup_task_id'], self.STORE_SYNC_COLUMNS)
+        for store in existing.values():
+            db.session.expire(store)
+
+        stores = {
+            s.clickup_task_id: s
+            for s in Store.query.options(selectinload(Store.pauses)).filter(
+                Store.clickup_task_id.in_(list(tasks_by_id))
+            ).all()
+        }
+        for store in stores.values():
+            store.refresh_effective_dates()
+            self.touched_store_ids.add(store.id)
+        log_rows = [{
+            'store_id': stores[clickup_id].id,
+            'field_name': field_name,
+            'old_value': str(old_value) if old_value is not None else None,
+            'new_value': str(new_value) if new_value is not None else None,
+            'source': 'sync',
+            'changed_at': changed_at or datetime.now(),
+        } for clickup_id, field_name, old_value, new_value, changed_at in pending_logs if clickup_id in stores]
+        if log_rows:
+            db.session.execute(StoreSyncLog.__table__.insert(), log_rows)
+        return stores
+
+    def process_step_data(self, store_db, task_data, manual_flags=None):
+        clickup_id = task_data['id']
+        step = TaskStep.query.filter_by(clickup_task_id=clickup_id).first()
+        is_new = step is None
+        if is_new:
+            step = TaskStep(clickup_task_id=clickup_id)
+            step.store_id = store_db.id
+            db.session.add(step)
+            db.session.flush() # Necessario para checar flags manuais pelo ID.
+
+        def last_finished_lookup(limit_date):
+            # Otimizacao: apenas uma query nesse caminho raro.
+            last_finished_step = TaskStep.query.filter(
+                TaskStep.store_id == store_db.id, 
+                TaskStep.id != step.id, 
+                TaskStep.end_real_at.isnot(None),
+                TaskStep.end_real_at <= limit_date
+            ).order_by(TaskStep.end_real_at.desc()).first()
+            return last_finished_step.end_real_at if last_finished_step else None
+
+        if is_new:
+            row = column_defaults(TaskStep, self.STEP_SYNC_COLUMNS)
+        else:
+            row = {col: getattr(step, col) for col in self.STEP_SYNC_COLUMNS}
+        self._map_step_task(task_data, row, step.id, store_db.id, manual_flags, last_finished_lookup)
+        for col, value in row.items():
+            setattr(step, col, value)
 
         db.session.add(step)
         return step
 
+    def load_manual_step_flags(self):
+        """Mapa {store_id: {'step_start_<id>', 'step_end_<id>'}} das datas editadas manualmente."""
+        manual_flags = {}
+        all_manual = db.session.query(StoreSyncLog.store_id, StoreSyncLog.field_name).filter(
+            StoreSyncLog.source == 'manual',
+            StoreSyncLog.field_name.like('step_%')
+        ).all()
+        for store_id, field_name in all_manual:
+            manual_flags.setdefault(store_id, set()).add(field_name)
+        return manual_flags
+
+    def process_step_batch(self, items, manual_flags=None):
+        """
+        Versao em lote do process_step_data. `items` e uma lista de (store_db, task_data).
+        Uma query carrega as etapas existentes e outra (sob demanda) os fins de
+        etapa por loja; a escrita e um unico upsert por lote.
+        Retorna a quantidade de etapas gravadas.
+        """
+        items_by_id = {task['id']: (store_db, task) for store_db, task in items}
+        if not items_by_id:
+            return 0
+
+        existing = {
+            s.clickup_task_id: s
+            for s in TaskStep.query.filter(TaskStep.clickup_task_id.in_(list(items_by_id))).all()
+        }
+        defaults = column_defaults(TaskStep, self.STEP_SYNC_COLUMNS)
+
+        # Fins de etapa por loja, carregados apenas se alguma etapa precisar do fallback.
+        finished_by_store = None
+
+        def load_finished():
+            store_ids = {store_db.id for store_db, _ in items_by_id.values()}
+            finished = {}
+            for store_id, step_id, end_real_at in db.session.query(
+                TaskStep.store_id, TaskStep.id, TaskStep.end_real_at
+            ).filter(TaskStep.store_id.in_(list(store_ids)), TaskStep.end_real_at.isnot(None)):
+                finished.setdefault(store_id, {})[step_id] = end_real_at
+            return finished
+
+        rows = []
+        for clickup_id, (store_db, task_data) in items_by_id.items():
+            step = existing.get(clickup_id)
+            step_id = step.id if step else None
+            current = {col: getattr(step, col) for col in self.STEP_SYNC_COLUMNS} if step else dict(defaults)
+            row = dict(current)
+
+            def last_finished_lookup(limit_date, store_id=store_db.id, step_key=step_id or clickup_id):
+                nonlocal finished_by_store
+                if finished_by_store is None:
+                    finished_by_store = load_finished()
+                ends = [
+                    end for key, end in finished_by_store.get(store_id, {}).items()
+                    if key != step_key and end <= limit_date
+                ]
+                return max(ends) if ends else None
+
+            self._map_step_task(task_data, row, step_id, store_db.id, manual_flags, last_finished_lookup)
+
+            # Mantem o mapa de fins coerente para as proximas etapas do mesmo lote.
+            if finished_by_store is not None:
+                store_ends = finished_by_store.setdefault(store_db.id, {})
+                if row['end_real_at']:
+                    store_ends[step_id or clickup_id] = row['end_real_at']
+                else:
+                    store_ends.pop(step_id or clickup_id, None)
+
+            if step is not None and row == current:
+                continue
+            rows.append({'clickup_task_id': clickup_id, **row})
+
+        upsert_rows(TaskStep, rows, ['clickup_task_id'], self.STEP_SYNC_COLUMNS)
+        for step in existing.values():
+            db.session.expire(step)
+        return len(rows)
+
     def apply_training_completion_rule(self, store_db):
         """
         Aplica a regra de conclusao operacional da loja.
@@ -284,5 +480,9 @@ class MetricsService:
                  delta = store_db.finished_at - start
                  store_db.total_time_days = round(delta.total_seconds() / 86400, 2)
 
+        # 4. Datas efetivas materializadas (a conclusao pode ter mudado acima).
+        store_db.refresh_effective_dates()
+        self.touched_store_ids.add(store_db.id)
+
     def commit(self):
         db.session.commit()
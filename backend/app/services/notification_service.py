@@ -10,31 +10,18 @@ import json
 import re
 
 import requests
+from sqlalchemy.orm import selectinload
 
-from app.models import db, SystemConfig, Store
+from app.models import db, Store
+from app.services.config_service import ConfigService
 
 
 def get_config_value(key, default=""):
-    cfg = SystemConfig.query.filter_by(key=key).first()
-    return cfg.value if cfg and cfg.value is not None else default
+    return ConfigService.get(key, default)
 
 
 def set_config_value(key, value, description=None, category="notifications"):
-    cfg = SystemConfig.query.filter_by(key=key).first()
-    if not cfg:
-        cfg = SystemConfig(
-            key=key,
-            value=str(value),
-            description=description or key,
-            category=category,
-        )
-        db.session.add(cfg)
-    else:
-        cfg.value = str(value)
-        if description and not cfg.description:
-            cfg.description = description
-        if not cfg.category:
-            cfg.category = category
+    ConfigService.set(key, value, description, category)
     db.session.commit()
 
 
@@ -193,7 +180,7 @@ def _store_line(store, sla_days):
 
 
 def _wip_stores():
-    return Store.query.filter(
+    return Store.query.options(selectinload(Store.pauses)).filter(
         Store.status_norm == "IN_PROGRESS",
         Store.manual_finished_at.is_(None),
     ).all()
@@ -266,12 +253,14 @@ def send_weekly_summary(force=False):
     if not force and get_config_value("notify_weekly_summary_last_sent_week") == week_key:
         return {"ok": True, "sent": False, "reason": "already_sent_this_week"}
 
-    all_stores = Store.query.all()
-    wip = [store for store in all_stores if store.status_norm == "IN_PROGRESS" and not store.manual_finished_at]
-    finished_year = [
-        store for store in all_stores
-        if store.effective_finished_at and store.effective_finished_at.year == now.year
-    ]
+    wip = Store.query.options(selectinload(Store.pauses)).filter(
+        Store.status_norm == "IN_PROGRESS",
+        Store.manual_finished_at.is_(None),
+    ).all()
+    finished_year = Store.query.filter(
+        Store.effective_end_at >= datetime(now.year, 1, 1),
+        Store.effective_end_at < datetime(now.year + 1, 1, 1),
+    ).all()
     finished_month = [
         store for store in finished_year
         if store.effective_finished_at and store.effective_finished_at.strftime("%Y-%m") == now.strftime("%Y-%m")
@@ -328,11 +317,12 @@ def check_goal_achievement(month_str=None, force=False):
     if not force and get_config_value("notify_goal_last_sent_month") == month_str:
         return {"ok": True, "sent": False, "reason": "already_sent_this_month"}
 
-    all_stores = Store.query.all()
-    finished_month = [
-        store for store in all_stores
-        if store.effective_finished_at and store.effective_finished_at.strftime("%Y-%m") == month_str
-    ]
+    month_start = datetime.strptime(month_str, "%Y-%m")
+    month_end = (month_start + timedelta(days=32)).replace(day=1)
+    finished_month = Store.query.filter(
+        Store.effective_end_at >= month_start,
+        Store.effective_end_at < month_end,
+    ).all()
 
     mrr_target = safe_float("annual_mrr_target", 180000) / 12
     stores_target = safe_int("annual_stores_target", 180) / 12
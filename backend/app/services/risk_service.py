@@ -0,0 +1,101 @@
+import json
+import logging
+from datetime import datetime
+from sqlalchemy.orm import selectinload
+from app.models import db, Store, StoreRisk
+from app.services.bulk_writer import upsert_rows
+from app.services.scoring_service import ScoringService
+
+logger = logging.getLogger(__name__)
+
+
+class StoreRiskService:
+    """
+    Materializacao do score de risco por loja (tabela store_risk).
+    O calculo continua no ScoringService; aqui ficam o recalculo em lote e a
+    renovacao diaria (o score envelhece com dias em progresso e idle).
+    """
+    CHUNK_SIZE = 500
+
+    @staticmethod
+    def _today():
+        return datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+
+    def refresh_stores(self, stores):
+        """Recalcula lojas ja carregadas (ex.: apos edicao manual). O commit fica com o chamador."""
+        now = datetime.now()
+        rows = []
+        for store in stores:
+            risk = ScoringService.calculate_risk_score(store)
+            rows.append({
+                'store_id': store.id,
+                'total': risk['total'],
+                'level': risk['level'],
+                'ai_risk_level': risk['ai_risk_level'],
+                'ai_boost': risk['ai_boost'],
+                'breakdown': json.dumps(risk['breakdown'], ensure_ascii=False),
+                'hints': json.dumps(risk['hints'], ensure_ascii=False),
+                'computed_at': now,
+            })
+        return upsert_rows(StoreRisk, rows, ['store_id'])
+
+    def refresh(self, store_ids=None):
+        """Recalcula as lojas informadas (ou todas). O commit fica com o chamador."""
+        if store_ids is None:
+            ids = [row[0] for row in db.session.query(Store.id).order_by(Store.id).all()]
+        else:
+            ids = [i for i in dict.fromkeys(store_ids) if i]
+
+        refreshed = 0
+        for start in range(0, len(ids), self.CHUNK_SIZE):
+            chunk = ids[start:start + self.CHUNK_SIZE]
+            stores = Store.query.options(
+                selectinload(Store.steps), selectinload(Store.pauses)
+            ).filter(Store.id.in_(chunk)).all()
+            refreshed += self.refresh_stores(stores)
+        return refreshed
+
+    def sweep(self):
+        """Varredura completa (job noturno): aplica o decaimento por tempo em todas as lojas."""
+        refreshed = self.refresh()
+        db.session.commit()
+        logger.info(f"[StoreRisk] Varredura concluida: {refreshed} scores recalculados.")
+        return refreshed
+
+    def refresh_stale(self):
+        """
+        Recalcula lojas sem score ou com score de um dia anterior e faz o commit.
+        Depois da primeira chamada do dia custa uma unica consulta.
+        """
+        stale_ids = [row[0] for row in db.session.query(Store.id).outerjoin(
+            StoreRisk, StoreRisk.store_id == Store.id
+        ).filter(db.or_(StoreRisk.store_id.is_(None), StoreRisk.computed_at < self._today())).all()]
+        if not stale_ids:
+            return 0
+        refreshed = self.refresh(stale_ids)
+        db.session.commit()
+        logger.info(f"[StoreRisk] {refreshed} scores renovados.")
+        return refreshed
+
+    def get_many(self, stores):
+        """
+        Scores materializados das lojas informadas: {store_id: dict no formato do
+        ScoringService.calculate_risk_score}. Somente leitura: lojas ainda sem linha em
+        store_risk sao calculadas em memoria, sem gravar; a persistencia fica com o
+        sync, as edicoes e a varredura noturna.
+        """
+        stores = [s for s in stores if s is not None]
+        found = {}
+        ids = [s.id for s in stores]
+        for start in range(0, len(ids), self.CHUNK_SIZE):
+            chunk = ids[start:start + self.CHUNK_SIZE]
+            for row in StoreRisk.query.filter(StoreRisk.store_id.in_(chunk)).all():
+                found[row.store_id] = row.to_dict()
+
+        for store in stores:
+            if store.id not in found:
+                found[store.id] = ScoringService.calculate_risk_score(store)
+        return found
+
+    def get(self, store):
+        return self.get_many([store]).get(store.id)
@@ -0,0 +1,104 @@
+import logging
+from datetime import datetime, time, timedelta
+from app.models import db, Store, MonthlyDeliveryRollup
+
+logger = logging.getLogger(__name__)
+
+
+class MonthlyRollupService:
+    """
+    Manutencao da tabela monthly_delivery_rollup (mes de conclusao x implantador x tipo).
+    Store.refresh_effective_dates marca na sessao os meses afetados; apply_pending
+    reagrega apenas esses meses. rebuild recalcula todo o historico.
+    """
+    SESSION_KEY = 'rollup_dirty_months'
+    INSERT_CHUNK_SIZE = 500
+
+    @staticmethod
+    def month_of(value):
+        return value.date().replace(day=1) if isinstance(value, datetime) else value.replace(day=1)
+
+    @staticmethod
+    def next_month(month):
+        return (month.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+    @staticmethod
+    def cycle_days(start, end, paused_days, now):
+        """dias_totais_implantacao de uma loja concluida, a partir das colunas materializadas."""
+        if not start or start > now:
+            return 0
+        return max(0, max(0, (end - start).days) - (paused_days or 0))
+
+    @staticmethod
+    def _load(*criteria):
+        return db.session.query(
+            Store.implantador, Store.tipo_loja, Store.valor_mensalidade, Store.tempo_contrato,
+            Store.effective_start_at, Store.effective_end_at, Store.paused_days,
+        ).filter(Store.effective_end_at.isnot(None), *criteria).all()
+
+    @classmethod
+    def _aggregate(cls, stores):
+        now = datetime.now()
+        buckets = {}
+        for s in stores:
+            key = (
+                cls.month_of(s.effective_end_at),
+                s.implantador or '',
+                'Matriz' if s.tipo_loja == 'Matriz' else 'Filial',
+            )
+            bucket = buckets.setdefault(key, {'delivered_count': 0, 'mrr': 0.0, 'on_time_count': 0, 'cycle_days_sum': 0})
+            days = cls.cycle_days(s.effective_start_at, s.effective_end_at, s.paused_days, now)
+            bucket['delivered_count'] += 1
+            bucket['mrr'] += float(s.valor_mensalidade or 0)
+            bucket['cycle_days_sum'] += days
+            if days <= (s.tempo_contrato or 90):
+                bucket['on_time_count'] += 1
+        return [
+            {'month': month, 'implantador': implantador, 'tipo_loja': tipo_loja, **values, 'updated_at': now}
+            for (month, implantador, tipo_loja), values in buckets.items()
+        ]
+
+    @classmethod
+    def _insert(cls, rows):
+        for start in range(0, len(rows), cls.INSERT_CHUNK_SIZE):
+            db.session.execute(MonthlyDeliveryRollup.__table__.insert(), rows[start:start + cls.INSERT_CHUNK_SIZE])
+
+    def refresh_months(self, months):
+        """Reagrega os meses informados (delete + insert por mes). O commit fica com o chamador."""
+        months = sorted({self.month_of(m) for m in months if m})
+        for month in months:
+            start = datetime.combine(month, time.min)
+            end = datetime.combine(self.next_month(month), time.min)
+            rows = self._aggregate(self._load(Store.effective_end_at >= start, Store.effective_end_at < end))
+            MonthlyDeliveryRollup.query.filter(MonthlyDeliveryRollup.month == month).delete(synchronize_session=False)
+            self._insert(rows)
+        return len(months)
+
+    def apply_pending(self):
+        """Reagrega os meses marcados nesta sessao por Store.refresh_effective_dates. Commit com o chamador."""
+        months = db.session.info.pop(self.SESSION_KEY, None)
+        if not months:
+            return 0
+        return self.refresh_months(months)
+
+    def rebuild(self):
+        """Recalcula todo o historico (comando de manutencao / bootstrap) e faz o commit."""
+        db.session.info.pop(self.SESSION_KEY, None)
+        rows = self._aggregate(self._load())
+        MonthlyDeliveryRollup.query.delete(synchronize_session=False)
+        self._insert(rows)
+        db.session.commit()
+        logger.info(f"[MonthlyRollup] Rebuild concluido: {len(rows)} linhas.")
+        return len(rows)
+
+    @staticmethod
+    def read(start_month=None, end_month=None, implantador=None):
+        """Linhas do rollup no intervalo [start_month, end_month], opcionalmente de um implantador."""
+        query = MonthlyDeliveryRollup.query
+        if start_month:
+            query = query.filter(MonthlyDeliveryRollup.month >= start_month)
+        if end_month:
+            query = query.filter(MonthlyDeliveryRollup.month <= end_month)
+        if implantador:
+            query = query.filter(MonthlyDeliveryRollup.implantador == implantador)
+        return query.order_by(MonthlyDeliveryRollup.month).all()
@@ -54,6 +54,20 @@ def repair_database_schema():
         "ALTER TABLE stores ADD COLUMN IF NOT EXISTS retrabalho_tipo VARCHAR(100);",
         "ALTER TABLE stores ADD COLUMN IF NOT EXISTS observacoes TEXT;",
         "ALTER TABLE stores ADD COLUMN IF NOT EXISTS tempo_contrato INTEGER DEFAULT 90;",
+        "ALTER TABLE stores ADD COLUMN IF NOT EXISTS effective_start_at TIMESTAMP WITHOUT TIME ZONE;",
+        "ALTER TABLE stores ADD COLUMN IF NOT EXISTS effective_end_at TIMESTAMP WITHOUT TIME ZONE;",
+        "ALTER TABLE stores ADD COLUMN IF NOT EXISTS paused_days INTEGER DEFAULT 0;",
+        "CREATE INDEX IF NOT EXISTS ix_stores_effective_start_at ON stores(effective_start_at);",
+        "CREATE INDEX IF NOT EXISTS ix_stores_effective_end_at ON stores(effective_end_at);",
+        # Snapshot diario: o upsert por (snapshot_date, store_id) exige a restricao unica.
+        # A limpeza de duplicados so roda uma vez, em bancos que ainda nao tem o indice.
+        """DO $$
+        BEGIN
+            IF to_regclass('uix_snapshot_date_store') IS NULL THEN
+                DELETE FROM metrics_snapshot_daily a USING metrics_snapshot_daily b WHERE a.snapshot_date = b.snapshot_date AND a.store_id = b.store_id AND a.id < b.id;
+                CREATE UNIQUE INDEX uix_snapshot_date_store ON metrics_snapshot_daily(snapshot_date, store_id);
+            END IF;
+        END $$;""",
 
 
         
@@ -158,6 +172,22 @@ def repair_database_schema():
         "ALTER TABLE support_metric_snapshots ADD COLUMN IF NOT EXISTS window_label VARCHAR(120);",
         "CREATE INDEX IF NOT EXISTS idx_support_metric_snapshots_period ON support_metric_snapshots(period);",
         "CREATE INDEX IF NOT EXISTS idx_support_metric_snapshots_type ON support_metric_snapshots(metric_type);",
+        # Upsert dos snapshots de suporte pela chave natural: bancos antigos nao tem a restricao.
+        # Duplicados sao removidos uma unica vez, antes de criar o indice que falta.
+        """DO $$
+        BEGIN
+            IF to_regclass('uix_support_metric_snapshot') IS NULL THEN
+                DELETE FROM support_metric_snapshots a USING support_metric_snapshots b WHERE a.period = b.period AND a.source = b.source AND a.metric_type = b.metric_type AND a.metric_key = b.metric_key AND a.dimension_hash = b.dimension_hash AND a.id < b.id;
+                CREATE UNIQUE INDEX uix_support_metric_snapshot ON support_metric_snapshots(period, source, metric_type, metric_key, dimension_hash);
+            END IF;
+        END $$;""",
+        # Linha do tempo do suporte: agregacao por bucket direto dos indices de data.
+        "CREATE INDEX IF NOT EXISTS ix_support_messages_timestamp ON support_messages(timestamp);",
+        "CREATE INDEX IF NOT EXISTS ix_support_contacts_created_at_zenvia ON support_contacts(created_at_zenvia);",
+        "CREATE INDEX IF NOT EXISTS ix_support_conversations_timeline ON support_conversations(created_at_zenvia) INCLUDE (status, nps_score);",
+
+        # Versao do cache de configuracoes
+        "ALTER TABLE system_config ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP WITHOUT TIME ZONE;",
     ]
     try:
         with db.engine.connect() as conn:
@@ -173,10 +203,46 @@ def repair_database_schema():
             
             # Seeding de Configurações
             seed_database()
+
+            # Preenche as datas efetivas materializadas em bancos anteriores as colunas.
+            backfill_effective_dates()
+
+            # Popula o rollup mensal de entregas em bancos anteriores a tabela.
+            bootstrap_monthly_rollup()
             
     except Exception as e:
         logger.error(f"[SchemaRepair] Erro fatal ao reparar schema: {e}")
 
+def backfill_effective_dates():
+    """Roda o backfill das datas efetivas apenas se houver loja ainda nao calculada."""
+    from app.models import Store
+    from app.services.store_dates_service import StoreDatesService
+
+    try:
+        pending = Store.query.filter(
+            Store.effective_start_at.is_(None),
+            db.or_(Store.created_at.isnot(None), Store.manual_start_date.isnot(None)),
+        ).first()
+        if pending:
+            StoreDatesService().backfill()
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"[SchemaRepair] Erro no backfill das datas efetivas: {e}")
+
+def bootstrap_monthly_rollup():
+    """Reconstroi o rollup mensal apenas se ele estiver vazio e houver loja concluida."""
+    from app.models import Store, MonthlyDeliveryRollup
+    from app.services.rollup_service import MonthlyRollupService
+
+    try:
+        if MonthlyDeliveryRollup.query.first():
+            return
+        if Store.query.filter(Store.effective_end_at.isnot(None)).first():
+            MonthlyRollupService().rebuild()
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"[SchemaRepair] Erro no bootstrap do rollup mensal: {e}")
+
 def seed_database():
     """
     Insere dados iniciais necessários para o funcionamento das métricas e relatórios.
@@ -4,6 +4,7 @@ import pyotp
 import secrets
 import datetime
 import logging
+import time
 from werkzeug.security import generate_password_hash, check_password_hash
 from functools import wraps
 from flask import request, jsonify, current_app
@@ -24,6 +25,10 @@ def get_two_factor_challenge_minutes() -> int:
     """Retorna a duracao do desafio 2FA em minutos."""
     return int(current_app.config.get("TWO_FACTOR_CHALLENGE_MINUTES", 5))
 
+def get_permission_cache_seconds() -> int:
+    """Retorna por quantos segundos as permissoes resolvidas ficam em cache."""
+    return int(current_app.config.get("PERMISSION_CACHE_SECONDS", 60))
+
 def get_totp_valid_window() -> int:
     """Retorna a janela de tolerancia do TOTP em passos de 30 segundos."""
     return int(current_app.config.get("TOTP_VALID_WINDOW", 2))
@@ -185,6 +190,38 @@ def require_auth(f):
         return f(payload, *args, **kwargs)
     return decorated_function
 
+# Permissoes efetivas por usuario: {user_id: (expira_em, permissoes, is_super)}.
+_permission_cache = {}
+
+def resolve_user_permissions(user_id):
+    """
+    Conjunto de permissoes (nomes) e flag de Super Admin do usuario, ou None se ele nao existir.
+    Resolvido uma vez a cada PERMISSION_CACHE_SECONDS por processo; as edicoes de papel
+    em routes_admin invalidam o cache local na hora.
+    """
+    key = str(user_id)
+    cached = _permission_cache.get(key)
+    if cached and cached[0] > time.monotonic():
+        return cached[1], cached[2]
+
+    from app.models import User  # Import local para evitar ciclo no boot.
+
+    user = User.query.get(user_id)
+    if not user:
+        return None
+
+    permissions = frozenset(perm.name for role in user.roles for perm in role.permissions)
+    is_super = any(role.name == "Super Admin" for role in user.roles)
+    _permission_cache[key] = (time.monotonic() + get_permission_cache_seconds(), permissions, is_super)
+    return permissions, is_super
+
+def invalidate_permission_cache(user_id=None):
+    """Descarta as permissoes em cache de um usuario (ou de todos)."""
+    if user_id is None:
+        _permission_cache.clear()
+    else:
+        _permission_cache.pop(str(user_id), None)
+
 def require_permission(permission_name: str):
     """
     Decorator para RBAC. Verifica se o usuario autenticado possui a permissao especificada.
@@ -197,17 +234,14 @@ def require_permission(permission_name: str):
     def decorator(f):
         @wraps(f)
         def decorated_function(payload, *args, **kwargs):
-            from app.models import User  # Import local para evitar ciclo no boot.
-            
-            user = User.query.get(payload['sub'])
-            if not user:
+            resolved = resolve_user_permissions(payload['sub'])
+            if not resolved:
                 return jsonify({"error": "Usuário não encontrado.", "code": "USER_NOT_FOUND"}), 404
                 
             # Super Admin pode tudo; demais usuarios precisam da permissao especifica.
-            has_perm = user.has_permission(permission_name)
-            is_super = any(role.name == "Super Admin" for role in user.roles)
+            permissions, is_super = resolved
             
-            if not has_perm and not is_super:
+            if permission_name not in permissions and not is_super:
                 return jsonify({
                     "error": f"Acesso negado. Necessária permissão: {permission_name}", 
                     "code": "FORBIDDEN"
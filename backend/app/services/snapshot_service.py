@@ -1,74 +1,148 @@
-from datetime import date, datetime
+from collections import defaultdict
+from datetime import date, datetime, timedelta
 import logging
-from app.models import db, Store, MetricsSnapshotDaily, SystemConfig
-from sqlalchemy.exc import IntegrityError
+from app.models import db, Store, StorePause, StoreRisk, MetricsSnapshotDaily
+from app.services.bulk_writer import upsert_rows
+from app.services.risk_service import StoreRiskService
 
 logger = logging.getLogger(__name__)
 
 class SnapshotService:
+    # Colunas regravadas pelo upsert; os campos de IA do snapshot sao preservados.
+    SNAPSHOT_COLUMNS = ['implantador', 'rede', 'status_norm', 'days_in_stage', 'idle_days', 'wip_points', 'mrr', 'risk_score']
+
     @staticmethod
-    def generate_daily_snapshot(target_date=None):
+    def _load_inputs():
         """
-        Gera um snapshot das métricas de TODAS as lojas ativas no dia.
-        Se já existir snapshot para loja/data, atualiza.
+        Tudo o que o snapshot precisa em duas leituras: as colunas das lojas com o
+        score materializado (join em store_risk) e as pausas de todas as lojas.
+        """
+        stores = db.session.query(
+            Store.id, Store.implantador, Store.rede, Store.status_norm, Store.idle_days,
+            Store.tipo_loja, Store.valor_mensalidade, Store.created_at,
+            Store.effective_start_at, Store.effective_end_at, StoreRisk.total,
+        ).outerjoin(StoreRisk, StoreRisk.store_id == Store.id).all()
+
+        pauses = defaultdict(list)
+        for store_id, start_date, end_date in db.session.query(
+            StorePause.store_id, StorePause.start_date, StorePause.end_date
+        ).all():
+            pauses[store_id].append((start_date, end_date))
+        return stores, pauses
+
+    @staticmethod
+    def _days_in_progress(start_date, end_date, status_norm, created_at, pauses, ref_now):
+        """Mesma regra de Store.dias_em_progresso, avaliada no instante `ref_now`."""
+        if not start_date or start_date > ref_now:
+            return 0
+        if status_norm == 'DONE':
+            ref_end = end_date or created_at
+        else:
+            ref_end = end_date or ref_now
+        if not ref_end:
+            return 0
+
+        total_days = max(0, (ref_end - start_date).days)
+        paused_days = 0
+        for p_start, p_end in pauses:
+            if p_start > ref_end:
+                continue
+            p_end = p_end or ref_now
+            if p_end < start_date:
+                continue
+            eff_start = max(p_start, start_date)
+            eff_end = min(p_end, ref_end)
+            if eff_end > eff_start:
+                paused_days += (eff_end - eff_start).days
+        return max(0, total_days - paused_days)
+
+    @classmethod
+    def _build_rows(cls, target_date, stores, pauses, ref_now, is_today):
         """
-        if not target_date:
-            target_date = date.today()
+        Linhas do snapshot de `target_date`. Para datas passadas a conclusao, o status
+        e os dias em progresso sao reconstruidos a partir das datas efetivas; os demais
+        campos (idle, MRR, risco, responsavel) usam o valor atual, unico disponivel.
+        """
+        # Pesos para calculo de pontos (padrao fixo do snapshot).
+        w_matriz = 1.0
+        w_filial = 0.7
 
-        logger.info(f"[Snapshot] Iniciando snapshot para {target_date}.")
-        
-        # 1. Buscar todas as lojas para "fotografar"
-        # Incluímos DONE também? Sim, para ter histórico de quando estava DONE.
-        # Mas o foco principal é o WIP. Vamos pegar todas por segurança e permitir filtro depois.
-        stores = Store.query.all()
-        
-        count_created = 0
-        count_updated = 0
-        
+        rows = []
         for s in stores:
-            # Calcular métricas 'on the fly' para congelar
-            risk_score = (s.dias_em_progresso or 0) + (2 * (s.idle_days or 0))
-            if s.financeiro_status == 'Devendo': risk_score += 15
-            if s.teve_retrabalho: risk_score += 10
-            
-            # Pesos para cálculo de pontos
-            # Poderiamos cachear a configuracao fora do loop; mantido simples nesta rotina.
-            # Se a configuracao falhar, usa valores padrao.
-            w_matriz = 1.0
-            w_filial = 0.7
-            if s.tipo_loja == 'Matriz': points = w_matriz
-            else: points = w_filial # Default Filial
-            
-            # Tentar buscar existente
-            snapshot = MetricsSnapshotDaily.query.filter_by(
-                snapshot_date=target_date, 
-                store_id=s.id
-            ).first()
-            
-            is_new = False
-            if not snapshot:
-                snapshot = MetricsSnapshotDaily(snapshot_date=target_date, store_id=s.id)
-                is_new = True
-            
-            # Popular dados
-            snapshot.implantador = s.implantador
-            snapshot.rede = s.rede
-            snapshot.status_norm = s.status_norm
-            snapshot.days_in_stage = s.dias_em_progresso or 0
-            snapshot.idle_days = s.idle_days
-            snapshot.wip_points = points if s.status_norm == 'IN_PROGRESS' else 0.0
-            snapshot.mrr = s.valor_mensalidade or 0.0
-            snapshot.risk_score = risk_score
-            
-            if is_new:
-                db.session.add(snapshot)
-                count_created += 1
-            else:
-                count_updated += 1
-        
+            end_date = s.effective_end_at
+            status_norm = s.status_norm
+            if not is_today:
+                if s.created_at and s.created_at > ref_now:
+                    continue # Loja ainda nao existia na data.
+                if end_date and end_date > ref_now:
+                    end_date = None
+                    if status_norm == 'DONE':
+                        status_norm = 'IN_PROGRESS'
+                elif end_date:
+                    status_norm = 'DONE'
+
+            points = w_matriz if s.tipo_loja == 'Matriz' else w_filial # Default Filial
+            rows.append({
+                'snapshot_date': target_date,
+                'store_id': s.id,
+                'implantador': s.implantador,
+                'rede': s.rede,
+                'status_norm': status_norm,
+                'days_in_stage': cls._days_in_progress(
+                    s.effective_start_at, end_date, status_norm, s.created_at, pauses.get(s.id, ()), ref_now
+                ),
+                'idle_days': s.idle_days,
+                'wip_points': points if status_norm == 'IN_PROGRESS' else 0.0,
+                'mrr': s.valor_mensalidade or 0.0,
+                'risk_score': s.total if s.total is not None else 0.0,
+            })
+        return rows
+
+    @classmethod
+    def generate_snapshots(cls, start_date, end_date=None, overwrite=False):
+        """
+        Gera os snapshots de todas as lojas para cada dia do intervalo, com uma leitura
+        das lojas e um INSERT ... ON CONFLICT (snapshot_date, store_id) por dia.
+        O dia de hoje e sempre regravado; dias passados so preenchem as lojas sem
+        snapshot, a menos que `overwrite` seja pedido (o historico gravado tem os
+        valores reais de idle, MRR, risco e responsavel da epoca).
+        Retorna {"days": n, "rows": total}.
+        """
+        end_date = end_date or start_date
+        if end_date < start_date:
+            raise ValueError("Data final anterior a data inicial.")
+
+        logger.info(f"[Snapshot] Iniciando snapshots de {start_date} a {end_date}.")
+        # Scores de risco do dia antes de congelar.
+        StoreRiskService().refresh_stale()
+        stores, pauses = cls._load_inputs()
+
+        today = date.today()
+        now = datetime.now()
+        days = 0
+        total_rows = 0
+        current = start_date
+        while current <= end_date:
+            is_today = current >= today
+            ref_now = now if is_today else datetime.combine(current, datetime.max.time())
+            rows = cls._build_rows(current, stores, pauses, ref_now, is_today)
+            update_columns = cls.SNAPSHOT_COLUMNS if is_today or overwrite else []
+            total_rows += upsert_rows(MetricsSnapshotDaily, rows, ['snapshot_date', 'store_id'], update_columns)
+            db.session.commit() # Um commit por dia: falhas no meio do backfill preservam os dias ja gravados.
+            days += 1
+            current += timedelta(days=1)
+
+        logger.info(f"[Snapshot] Sucesso. {days} dia(s), {total_rows} linhas enviadas.")
+        return {"days": days, "rows": total_rows}
+
+    @classmethod
+    def generate_daily_snapshot(cls, target_date=None):
+        """
+        Gera um snapshot das métricas de TODAS as lojas no dia.
+        Se já existir snapshot para loja/data, atualiza.
+        """
         try:
-            db.session.commit()
-            logger.info(f"[Snapshot] Sucesso. Criados: {count_created}, atualizados: {count_updated}.")
+            cls.generate_snapshots(target_date or date.today())
             return True
         except Exception as e:
             db.session.rollback()
@@ -0,0 +1,116 @@
+import logging
+import threading
+from datetime import datetime
+import numpy as np
+from sqlalchemy import func
+from app.models import db, TaskStep, StepDurationStats
+from app.services.bulk_writer import upsert_rows
+
+logger = logging.getLogger(__name__)
+
+
+class StepStatsService:
+    """
+    Estatisticas de duracao por step_list_name (avg, std, p50, p75, count).
+    Calculo vetorizado com NumPy, persistido em StepDurationStats e mantido em
+    cache no processo; a versao e (maior computed_at, quantidade de listas).
+    """
+    MIN_SAMPLES = 5
+    _lock = threading.Lock()
+    _cache_version = None
+    _cache_stats = {}
+
+    @classmethod
+    def compute(cls, values):
+        """Mesma regra do modelo original: corte de outliers por IQR e quartis 'exclusive'."""
+        values = np.asarray(values, dtype=float)
+        count = int(values.size)
+        if count < cls.MIN_SAMPLES:
+            avg = float(values.mean()) if count else 5.0
+            return {'avg': avg, 'std': 0.0, 'p50': avg, 'p75': avg * 1.2, 'count': count}
+
+        # 'weibull' equivale a statistics.quantiles(method='exclusive').
+        q1, q3 = np.quantile(values, [0.25, 0.75], method='weibull')
+        clean = values[values <= q3 + 1.5 * (q3 - q1)]
+        if clean.size == 0:
+            clean = values
+        if clean.size < 2:
+            # Amostra limpa insuficiente para quartis: usa media +- desvio do conjunto completo.
+            avg = float(values.mean())
+            std = float(values.std(ddof=1))
+            return {'avg': avg, 'std': std, 'p50': avg, 'p75': avg + std, 'count': count}
+
+        p50, p75 = np.quantile(clean, [0.5, 0.75], method='weibull')
+        return {
+            'avg': float(clean.mean()),
+            'std': float(clean.std(ddof=1)),
+            'p50': float(p50),
+            'p75': float(p75),
+            'count': count,
+        }
+
+    @classmethod
+    def refresh(cls, list_names=None):
+        """
+        Recalcula as listas informadas (ou todas). O commit fica com o chamador.
+        Retorna a quantidade de listas gravadas.
+        """
+        query = db.session.query(TaskStep.step_list_name, TaskStep.total_time_days).filter(
+            TaskStep.total_time_days > 0,
+            TaskStep.step_list_name.isnot(None),
+        )
+        if list_names is not None:
+            list_names = [n for n in set(list_names) if n]
+            if not list_names:
+                return 0
+            query = query.filter(TaskStep.step_list_name.in_(list_names))
+
+        rows = query.all()
+        now = datetime.now()
+        stats_rows = []
+        if rows:
+            names = np.array([r[0] for r in rows], dtype=object)
+            durations = np.array([r[1] for r in rows], dtype=float)
+            order = np.argsort(names, kind='stable')
+            names, durations = names[order], durations[order]
+            unique_names, starts = np.unique(names, return_index=True)
+            for name, values in zip(unique_names, np.split(durations, starts[1:])):
+                stats_rows.append({'step_list_name': name, **cls.compute(values), 'computed_at': now})
+
+        # Listas sem amostras deixam de ter estatistica (fallback padrao na previsao).
+        computed = {r['step_list_name'] for r in stats_rows}
+        stale = StepDurationStats.query.filter(~StepDurationStats.step_list_name.in_(computed)) if computed else StepDurationStats.query
+        if list_names is not None:
+            stale = stale.filter(StepDurationStats.step_list_name.in_(list_names))
+        stale.delete(synchronize_session=False)
+
+        upsert_rows(StepDurationStats, stats_rows, ['step_list_name'],
+                    ['avg', 'std', 'p50', 'p75', 'count', 'computed_at'])
+        logger.info(f"[StepStats] {len(stats_rows)} listas recalculadas ({len(rows)} etapas).")
+        return len(stats_rows)
+
+    @staticmethod
+    def _current_version():
+        # (ultimo calculo, quantidade de listas): remocoes tambem mudam a versao.
+        return tuple(db.session.query(
+            func.max(StepDurationStats.computed_at), func.count(StepDurationStats.step_list_name)
+        ).one())
+
+    @classmethod
+    def get_stats(cls):
+        """Leitura para handlers: uma consulta de versao e, se mudou, a recarga da tabela."""
+        version = cls._current_version()
+        if version[0] is None:
+            # Primeira execucao: materializa a partir do historico.
+            if cls.refresh():
+                db.session.commit()
+                version = cls._current_version()
+
+        with cls._lock:
+            if version != cls._cache_version:
+                cls._cache_stats = {
+                    s.step_list_name: {'avg': s.avg, 'std': s.std, 'p50': s.p50, 'p75': s.p75, 'count': s.count}
+                    for s in StepDurationStats.query.all()
+                }
+                cls._cache_version = version
+            return cls._cache_stats
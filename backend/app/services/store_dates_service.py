@@ -0,0 +1,38 @@
+import logging
+from sqlalchemy.orm import selectinload
+from app.models import db, Store
+from app.services.rollup_service import MonthlyRollupService
+
+logger = logging.getLogger(__name__)
+
+
+class StoreDatesService:
+    """
+    Manutencao em lote das datas efetivas materializadas em Store
+    (effective_start_at, effective_end_at, paused_days).
+    """
+    CHUNK_SIZE = 500
+
+    def refresh(self, store_ids):
+        """Recalcula as lojas informadas com as pausas pre-carregadas. O commit fica com o chamador."""
+        ids = [i for i in dict.fromkeys(store_ids) if i]
+        changed = 0
+        for start in range(0, len(ids), self.CHUNK_SIZE):
+            chunk = ids[start:start + self.CHUNK_SIZE]
+            stores = Store.query.options(selectinload(Store.pauses)).filter(Store.id.in_(chunk)).all()
+            for store in stores:
+                if store.refresh_effective_dates():
+                    changed += 1
+        return changed
+
+    def backfill(self):
+        """Recalcula todas as lojas (commit por bloco). Usado apos criar as colunas."""
+        ids = [row[0] for row in db.session.query(Store.id).order_by(Store.id).all()]
+        changed = 0
+        for start in range(0, len(ids), self.CHUNK_SIZE):
+            changed += self.refresh(ids[start:start + self.CHUNK_SIZE])
+            db.session.commit()
+        logger.info(f"[StoreDates] Backfill concluido: {changed} de {len(ids)} lojas atualizadas.")
+        # Datas de entrega podem ter mudado em qualquer mes: reconstroi o rollup inteiro.
+        MonthlyRollupService().rebuild()
+        return {"stores": len(ids), "updated": changed}
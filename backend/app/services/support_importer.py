@@ -21,14 +21,27 @@ from app.models import (
     SupportImportBatch,
     SupportMessage,
     SupportMetricSnapshot,
-    SystemConfig,
     db,
 )
+from app.services.bulk_writer import insert_missing_rows, upsert_rows
+from app.services.config_service import ConfigService
 
 logger = logging.getLogger(__name__)
 
 WINDOW_KEY_SIZE = 7
 CONVERSATION_MATCH_GRACE_HOURS = 12
+# Linhas de CSV por lote: uma consulta IN de existentes e um INSERT em massa por lote.
+IMPORT_CHUNK_ROWS = 5000
+EMPTY_MARKERS = {"nan", "none", "null", "-"}
+DATETIME_FORMATS = [
+    "%d/%m/%Y, %H:%M",
+    "%d/%m/%Y %H:%M",
+    "%Y-%m-%dT%H:%M:%S.%fZ",
+    "%Y-%m-%dT%H:%M:%SZ",
+    "%Y-%m-%d %H:%M:%S",
+]
+WHATSAPP_IN_PREFIX = "WhatsApp recebido:"
+WHATSAPP_OUT_PREFIX = "WhatsApp enviado:"
 
 
 def slugify(text: Any) -> str:
@@ -47,7 +60,7 @@ def normalize_empty(value: Any) -> Optional[str]:
     if value is None:
         return None
     text = str(value).strip()
-    if not text or text.lower() in {"nan", "none", "null", "-"}:
+    if not text or text.lower() in EMPTY_MARKERS:
         return None
     return text
 
@@ -100,14 +113,7 @@ def parse_datetime(value: Any) -> Optional[datetime]:
     text = normalize_empty(value)
     if not text:
         return None
-    formats = [
-        "%d/%m/%Y, %H:%M",
-        "%d/%m/%Y %H:%M",
-        "%Y-%m-%dT%H:%M:%S.%fZ",
-        "%Y-%m-%dT%H:%M:%SZ",
-        "%Y-%m-%d %H:%M:%S",
-    ]
-    for fmt in formats:
+    for fmt in DATETIME_FORMATS:
         try:
             return datetime.strptime(text, fmt)
         except Exception:
@@ -121,6 +127,54 @@ def parse_datetime(value: Any) -> Optional[datetime]:
         return None
 
 
+def text_column(df: pd.DataFrame, column: str, fallback: Optional[str] = None) -> pd.Series:
+    """normalize_empty aplicado a coluna inteira; coluna ausente vira None (ou `fallback`)."""
+    if column not in df.columns:
+        if fallback:
+            return text_column(df, fallback)
+        return pd.Series([None] * len(df), index=df.index, dtype=object)
+    raw = df[column]
+    text = raw.astype(str).str.strip().astype(object)
+    empty = raw.isna() | text.isna() | text.eq("") | text.str.lower().isin(EMPTY_MARKERS)
+    return text.where(~empty, None)
+
+
+def datetime_column(df: pd.DataFrame, column: str) -> pd.Series:
+    """parse_datetime aplicado a coluna: formatos conhecidos em lote, o restante valor a valor."""
+    text = text_column(df, column)
+    parsed = pd.Series(pd.NaT, index=df.index, dtype="datetime64[us]")
+    pending = text.notna()
+    for fmt in DATETIME_FORMATS:
+        if not pending.any():
+            break
+        attempt = pd.to_datetime(text[pending], format=fmt, errors="coerce")
+        hits = attempt.index[attempt.notna()]
+        parsed.loc[hits] = attempt.loc[hits]
+        pending.loc[hits] = False
+
+    result = pd.Series([None if pd.isna(v) else v.to_pydatetime() for v in parsed], index=df.index, dtype=object)
+    if pending.any():
+        result.loc[pending] = text[pending].map(parse_datetime)
+    return result
+
+
+def slugify_column(values: pd.Series) -> pd.Series:
+    """slugify aplicado a coluna inteira."""
+    slug = (
+        values.astype(object).where(values.notna(), "").astype(str)
+        .str.strip().str.lower()
+        .str.replace(r"\W+", "_", regex=True)
+        .str.strip("_")
+        .astype(object)
+    )
+    return slug.where(slug.ne(""), "unknown")
+
+
+def column_values(values: pd.Series) -> List[Any]:
+    """Valores da coluna como objetos Python, com None no lugar de NaN."""
+    return values.astype(object).where(values.notna(), None).tolist()
+
+
 def period_from_datetime(value: Optional[datetime], fallback: Optional[str]) -> str:
     if value:
         return value.strftime("%Y-%m")
@@ -297,48 +351,82 @@ def detect_csv_type(filename: str, df: pd.DataFrame, explicit_type: Optional[str
     return "generic_snapshot"
 
 
-def upsert_snapshot(
-    period: str,
-    import_batch_id: Optional[int],
-    range_start: Optional[datetime],
-    range_end: Optional[datetime],
-    granularity: Optional[str],
-    window_label_value: Optional[str],
-    source: str,
-    metric_type: str,
-    metric_key: str,
-    dimensions: Optional[Dict[str, Any]] = None,
-    value_float: Optional[float] = None,
-    value_text: Optional[str] = None,
-) -> None:
-    dimensions = dimensions or {}
-    dimensions_json = json.dumps(dimensions, ensure_ascii=False, sort_keys=True)
-    dimension_hash = get_hash(dimensions_json)
-    snap = SupportMetricSnapshot.query.filter_by(
-        period=period,
-        source=source[:120],
-        metric_type=metric_type[:80],
-        metric_key=metric_key[:160],
-        dimension_hash=dimension_hash,
-    ).first()
-    if not snap:
-        snap = SupportMetricSnapshot(
-            period=period,
-            source=source[:120],
+SNAPSHOT_KEY_COLUMNS = ["period", "source", "metric_type", "metric_key", "dimension_hash"]
+
+
+class SnapshotWriter:
+    """
+    Acumula os snapshots de um arquivo e grava tudo com um upsert pela chave natural
+    (uix_support_metric_snapshot). Linhas repetidas no arquivo: vale a ultima.
+    """
+
+    def __init__(
+        self,
+        period: str,
+        import_batch_id: Optional[int],
+        range_start: Optional[datetime],
+        range_end: Optional[datetime],
+        granularity: Optional[str],
+        window_label_value: Optional[str],
+        source: str,
+    ):
+        self.base = {
+            "period": period,
+            "import_batch_id": import_batch_id,
+            "range_start": range_start,
+            "range_end": range_end,
+            "granularity": granularity,
+            "window_label": window_label_value,
+            "source": source[:120],
+        }
+        self._rows: Dict[Tuple[str, str, str], Dict[str, Any]] = {}
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def add(
+        self,
+        metric_type: str,
+        metric_key: str,
+        dimensions: Optional[Dict[str, Any]] = None,
+        value_float: Optional[float] = None,
+        value_text: Optional[str] = None,
+    ) -> None:
+        dimensions_json = json.dumps(dimensions or {}, ensure_ascii=False, sort_keys=True)
+        row = dict(
+            self.base,
             metric_type=metric_type[:80],
             metric_key=metric_key[:160],
-            dimension_hash=dimension_hash,
+            dimension_hash=get_hash(dimensions_json),
+            dimensions_json=dimensions_json,
+            value_float=value_float,
+            value_text=value_text,
         )
-        db.session.add(snap)
-    snap.import_batch_id = import_batch_id
-    snap.range_start = range_start
-    snap.range_end = range_end
-    snap.granularity = granularity
-    snap.window_label = window_label_value
-    snap.dimensions_json = dimensions_json
-    snap.value_float = value_float
-    snap.value_text = value_text
-    snap.captured_at = datetime.utcnow()
+        self._rows[(row["metric_type"], row["metric_key"], row["dimension_hash"])] = row
+
+    def write(self) -> Dict[str, int]:
+        """Grava os snapshots acumulados; devolve quantos eram novos e quantos ja existiam."""
+        if not self._rows:
+            return {"inserted": 0, "updated": 0}
+        existing = {
+            tuple(key)
+            for key in db.session.query(
+                SupportMetricSnapshot.metric_type,
+                SupportMetricSnapshot.metric_key,
+                SupportMetricSnapshot.dimension_hash,
+            ).filter(
+                SupportMetricSnapshot.period == self.base["period"],
+                SupportMetricSnapshot.source == self.base["source"],
+            )
+        }
+        captured_at = datetime.utcnow()
+        rows = [dict(row, captured_at=captured_at) for row in self._rows.values()]
+        upsert_rows(SupportMetricSnapshot, rows, SNAPSHOT_KEY_COLUMNS)
+
+        updated = len(existing.intersection(self._rows))
+        stats = {"inserted": len(rows) - updated, "updated": updated}
+        self._rows = {}
+        return stats
 
 
 def _extract_nps(extra_raw: Any) -> Tuple[Optional[int], Optional[str]]:
@@ -370,9 +458,7 @@ def _name_tokens(value: Any) -> List[str]:
     return [token for token in normalized.split() if len(token) >= 3]
 
 
-def _names_match(left: Any, right: Any) -> bool:
-    left_tokens = set(_name_tokens(left))
-    right_tokens = set(_name_tokens(right))
+def _token_sets_match(left_tokens: set, right_tokens: set) -> bool:
     if not left_tokens or not right_tokens:
         return False
     if left_tokens == right_tokens:
@@ -381,23 +467,48 @@ def _names_match(left: Any, right: Any) -> bool:
     return bool(overlap) and (len(overlap) >= min(len(left_tokens), len(right_tokens), 2) or overlap == left_tokens or overlap == right_tokens)
 
 
-def _find_contact_by_activity_name(contact_name: str) -> Optional[SupportContact]:
-    exact = SupportContact.query.filter_by(zenvia_contact_id=f"CSV_CONTACT_{slugify(contact_name)}"[:100]).first()
-    if exact:
-        return exact
+class NameTokenIndex:
+    """
+    Indice invertido token -> itens para o casamento aproximado de nomes (_token_sets_match).
+    Candidatos de um nome sao os itens que dividem algum token com ele; em empate vence
+    o item inserido primeiro (carregue ordenado por id para manter a ordem do banco).
+    """
 
-    candidates = SupportContact.query.filter(SupportContact.name.isnot(None)).all()
-    for candidate in candidates:
-        if _names_match(candidate.name, contact_name):
-            return candidate
-    return None
+    def __init__(self, items: Iterable[Any] = (), name_of: Any = None):
+        self._name_of = name_of or (lambda item: item.name)
+        self._items: List[Any] = []
+        self._tokens: List[set] = []
+        self._postings: Dict[str, set] = {}
+        for item in items:
+            self.add(item)
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def add(self, item: Any) -> None:
+        tokens = set(_name_tokens(self._name_of(item)))
+        if not tokens:
+            return
+        position = len(self._items)
+        self._items.append(item)
+        self._tokens.append(tokens)
+        for token in tokens:
+            self._postings.setdefault(token, set()).add(position)
+
+    def find(self, name: Any) -> Optional[Any]:
+        tokens = set(_name_tokens(name))
+        if not tokens:
+            return None
+        candidates = set().union(*(self._postings.get(token, ()) for token in tokens))
+        for position in sorted(candidates):
+            if _token_sets_match(self._tokens[position], tokens):
+                return self._items[position]
+        return None
 
 
-def _load_contact_conversations(contact_id: int) -> List[SupportConversation]:
-    return SupportConversation.query.filter_by(contact_id=contact_id).order_by(
-        SupportConversation.created_at_zenvia.asc(),
-        SupportConversation.id.asc(),
-    ).all()
+def build_contact_name_index() -> NameTokenIndex:
+    """Indice dos contatos com nome; montado uma vez por importacao."""
+    return NameTokenIndex(SupportContact.query.filter(SupportContact.name.isnot(None)).order_by(SupportContact.id))
 
 
 def _find_conversation_for_timestamp(conversations: List[SupportConversation], ts: datetime) -> Optional[SupportConversation]:
@@ -443,6 +554,44 @@ def _ensure_fallback_conversation(
     return conv
 
 
+def _prepare_conversations(df: pd.DataFrame, period: Optional[str]) -> pd.DataFrame:
+    phone = text_column(df, "phone")
+    name = text_column(df, "name").combine_first(phone).fillna("Desconhecido")
+    created_at = datetime_column(df, "created_at")
+    row_period = created_at.map(lambda value: period_from_datetime(value, period))
+    nps = [_extract_nps(extra) if extra else (None, None) for extra in text_column(df, "extra")]
+
+    contact_slug = slugify_column(phone.combine_first(name))
+    stamp = created_at.map(lambda value: value.strftime("%Y%m%d%H%M%S"), na_action="ignore")
+    stamp = stamp.combine_first(row_period.str.replace("-", "", regex=False))
+    conv_key = text_column(df, "id").combine_first(contact_slug.str.slice(0, 58) + "_" + stamp)
+
+    frame = pd.DataFrame({
+        "name": name,
+        "phone": phone,
+        "email": text_column(df, "email"),
+        "created_at": created_at,
+        "row_period": row_period,
+        "nps_score": pd.Series([item[0] for item in nps], index=df.index, dtype=object),
+        "nps_comment": pd.Series([item[1] for item in nps], index=df.index, dtype=object),
+        "contact_key": ("CSV_CONTACT_" + contact_slug).str.slice(0, 100),
+        "conv_id": ("CSV_CONV_" + conv_key).str.slice(0, 100),
+        "channel": text_column(df, "channel").fillna("whatsapp"),
+    }).astype(object)
+    return frame.where(frame.notna(), None)
+
+
+def _load_by_keys(model: Any, column: Any, keys: Iterable[Any]) -> Dict[Any, Any]:
+    """Uma consulta IN: {valor da coluna: primeira linha (menor id)}."""
+    keys = [key for key in dict.fromkeys(keys) if key]
+    found: Dict[Any, Any] = {}
+    if not keys:
+        return found
+    for item in model.query.filter(column.in_(keys)).order_by(model.id):
+        found.setdefault(getattr(item, column.key), item)
+    return found
+
+
 def enrich_contacts_from_conversations_csv(data: Any, period: Optional[str] = None) -> Dict[str, Any]:
     df = read_input_data(data, "phone")
     if df is None:
@@ -457,79 +606,163 @@ def enrich_contacts_from_conversations_csv(data: Any, period: Optional[str] = No
         "errors": 0,
         "months_breakdown": {},
     }
+    frame = _prepare_conversations(df, period)
 
-    for _, row in df.iterrows():
-        try:
-            row_id = normalize_empty(row.get("id"))
-            name = normalize_empty(row.get("name")) or normalize_empty(row.get("phone")) or "Desconhecido"
-            phone = normalize_empty(row.get("phone"))
-            email = normalize_empty(row.get("email"))
-            created_at = parse_datetime(row.get("created_at"))
-            row_period = period_from_datetime(created_at, period)
-            nps_score, nps_comment = _extract_nps(row.get("extra"))
-
-            contact_slug = slugify(phone or name)
-            contact = SupportContact.query.filter_by(phone=phone).first() if phone else None
-            if not contact:
-                contact = SupportContact.query.filter_by(zenvia_contact_id=f"CSV_CONTACT_{contact_slug}").first()
-
-            if contact:
-                contact.name = (name or contact.name or "Desconhecido")[:255]
-                if phone:
-                    contact.phone = phone
-                if email:
-                    contact.email = email
-                if created_at and not contact.created_at_zenvia:
-                    contact.created_at_zenvia = created_at
-                contact.updated_at = datetime.utcnow()
-                stats["contacts_updated"] += 1
-            else:
-                contact = SupportContact(
-                    zenvia_contact_id=f"CSV_CONTACT_{contact_slug}"[:100],
-                    name=name[:255],
-                    phone=phone,
-                    email=email,
-                    created_at_zenvia=created_at,
-                )
-                db.session.add(contact)
-                db.session.flush()
-                stats["contacts_created"] += 1
-
-            conv_key = row_id or f"{slugify(phone or name)[:58]}_{created_at.strftime('%Y%m%d%H%M%S') if created_at else row_period.replace('-', '')}"
-            conv_id = f"CSV_CONV_{conv_key}"[:100]
-            conv = SupportConversation.query.filter_by(zenvia_conversation_id=conv_id).first()
-            if not conv:
-                conv = SupportConversation(
-                    zenvia_conversation_id=conv_id,
-                    contact_id=contact.id,
-                    channel=normalize_empty(row.get("channel")) or "whatsapp",
-                    status="OPEN",
-                    created_at_zenvia=created_at,
-                    last_message_at=created_at,
-                )
-                db.session.add(conv)
-                db.session.flush()
-                stats["conversations_created"] += 1
-            elif created_at and (not conv.last_message_at or created_at > conv.last_message_at):
-                conv.last_message_at = created_at
-            if nps_score is not None:
-                conv.nps_score = nps_score
-                stats["nps_extracted"] += 1
-            if nps_comment and (not conv.nps_comment or len(nps_comment) > len(conv.nps_comment)):
-                conv.nps_comment = nps_comment
-
-            stats["months_breakdown"][row_period] = stats["months_breakdown"].get(row_period, 0) + 1
-            if (stats["contacts_created"] + stats["contacts_updated"]) % 500 == 0:
-                db.session.commit()
-        except Exception as exc:
-            db.session.rollback()
-            stats["errors"] += 1
-            logger.debug("Erro ao enriquecer contato de suporte: %s", exc)
+    for start in range(0, len(frame), IMPORT_CHUNK_ROWS):
+        chunk = frame.iloc[start:start + IMPORT_CHUNK_ROWS]
+        contacts_by_phone = _load_by_keys(SupportContact, SupportContact.phone, chunk["phone"])
+        contacts_by_key = _load_by_keys(SupportContact, SupportContact.zenvia_contact_id, chunk["contact_key"])
+        conversations = _load_by_keys(SupportConversation, SupportConversation.zenvia_conversation_id, chunk["conv_id"])
+
+        for row in chunk.itertuples(index=False):
+            try:
+                contact = contacts_by_phone.get(row.phone) if row.phone else None
+                if not contact:
+                    contact = contacts_by_key.get(row.contact_key)
+
+                if contact:
+                    contact.name = (row.name or contact.name or "Desconhecido")[:255]
+                    if row.phone:
+                        contact.phone = row.phone
+                    if row.email:
+                        contact.email = row.email
+                    if row.created_at and not contact.created_at_zenvia:
+                        contact.created_at_zenvia = row.created_at
+                    contact.updated_at = datetime.utcnow()
+                    stats["contacts_updated"] += 1
+                else:
+                    contact = SupportContact(
+                        zenvia_contact_id=row.contact_key,
+                        name=row.name[:255],
+                        phone=row.phone,
+                        email=row.email,
+                        created_at_zenvia=row.created_at,
+                    )
+                    db.session.add(contact)
+                    contacts_by_key[row.contact_key] = contact
+                    stats["contacts_created"] += 1
+                if row.phone:
+                    contacts_by_phone.setdefault(row.phone, contact)
+
+                conv = conversations.get(row.conv_id)
+                if not conv:
+                    conv = SupportConversation(
+                        zenvia_conversation_id=row.conv_id,
+                        contact=contact,
+                        channel=row.channel,
+                        status="OPEN",
+                        created_at_zenvia=row.created_at,
+                        last_message_at=row.created_at,
+                    )
+                    db.session.add(conv)
+                    conversations[row.conv_id] = conv
+                    stats["conversations_created"] += 1
+                elif row.created_at and (not conv.last_message_at or row.created_at > conv.last_message_at):
+                    conv.last_message_at = row.created_at
+                if row.nps_score is not None:
+                    conv.nps_score = row.nps_score
+                    stats["nps_extracted"] += 1
+                if row.nps_comment and (not conv.nps_comment or len(row.nps_comment) > len(conv.nps_comment)):
+                    conv.nps_comment = row.nps_comment
+
+                stats["months_breakdown"][row.row_period] = stats["months_breakdown"].get(row.row_period, 0) + 1
+            except Exception as exc:
+                stats["errors"] += 1
+                logger.debug("Erro ao enriquecer contato de suporte: %s", exc)
+        db.session.flush()
 
     db.session.commit()
     return stats
 
 
+def _prepare_activities(df: pd.DataFrame) -> pd.DataFrame:
+    frame = pd.DataFrame({
+        "ts": datetime_column(df, "Data"),
+        "contact_name": text_column(df, "Cliente"),
+        "agent_name": text_column(df, "Agente"),
+        "group_name": text_column(df, "Grupo"),
+        "details": text_column(df, "Detalhes"),
+    })
+    frame = frame[frame["ts"].notna() & frame["contact_name"].notna() & frame["details"].notna()].copy()
+
+    details = frame["details"].astype(str)
+    incoming = details.str.startswith(WHATSAPP_IN_PREFIX)
+    outgoing = details.str.startswith(WHATSAPP_OUT_PREFIX)
+    msg_text = frame["details"].copy()
+    msg_text[incoming] = details[incoming].str.slice(len(WHATSAPP_IN_PREFIX)).str.strip()
+    sent = details[outgoing].str.slice(len(WHATSAPP_OUT_PREFIX)).str.strip()
+    parts = sent.str.split(":", n=1, expand=True)
+    if len(parts.columns) > 1:
+        # Remove o prefixo "Atendente:" das mensagens enviadas.
+        labeled = parts[1].notna() & (parts[0].str.len() < 35)
+        sent = sent.where(~labeled, parts[1].str.strip())
+    msg_text[outgoing] = sent
+
+    direction = pd.Series(None, index=frame.index, dtype=object)
+    direction[incoming] = "IN"
+    direction[outgoing] = "OUT"
+    frame["direction"] = direction
+    frame["msg_text"] = msg_text.astype(object)
+    frame["contact_slug"] = slugify_column(frame["contact_name"])
+    frame["row_period"] = frame["ts"].map(lambda value: value.strftime("%Y-%m"))
+
+    keys = frame["contact_slug"] + "_" + frame["ts"].map(datetime.isoformat) + "_" + direction.fillna("") + "_" + frame["msg_text"]
+    frame["message_id"] = pd.Series(
+        [f"CSV_MSG_{get_hash(key)}"[:100] if has_direction else None for key, has_direction in zip(keys, direction.notna())],
+        index=frame.index,
+        dtype=object,
+    )
+    return frame.astype(object).where(frame.notna(), None)
+
+
+def _resolve_activity_contacts(frame: pd.DataFrame, stats: Dict[str, Any]) -> Dict[str, SupportContact]:
+    contacts: Dict[str, SupportContact] = {}
+    now = datetime.utcnow()
+    first_rows = frame.drop_duplicates("contact_slug")
+    keys = {contact_slug: f"CSV_CONTACT_{contact_slug}"[:100] for contact_slug in first_rows["contact_slug"]}
+    exact = _load_by_keys(SupportContact, SupportContact.zenvia_contact_id, keys.values())
+    name_index: Optional[NameTokenIndex] = None
+
+    for contact_slug, contact_name in zip(first_rows["contact_slug"], first_rows["contact_name"]):
+        contact = exact.get(keys[contact_slug])
+        if not contact:
+            if name_index is None:
+                name_index = build_contact_name_index()
+            contact = name_index.find(contact_name)
+        if not contact:
+            contact = SupportContact(
+                zenvia_contact_id=keys[contact_slug],
+                name=contact_name[:255],
+            )
+            db.session.add(contact)
+            name_index.add(contact)
+            stats["contacts_created"] += 1
+        contact.updated_at = now
+        contacts[contact_slug] = contact
+    db.session.flush()
+    return contacts
+
+
+def _load_conversations_by_contact(contact_ids: List[int]) -> Dict[int, List[SupportConversation]]:
+    conversations: Dict[int, List[SupportConversation]] = {contact_id: [] for contact_id in contact_ids}
+    for start in range(0, len(contact_ids), IMPORT_CHUNK_ROWS):
+        chunk = contact_ids[start:start + IMPORT_CHUNK_ROWS]
+        for conv in SupportConversation.query.filter(SupportConversation.contact_id.in_(chunk)).order_by(
+            SupportConversation.created_at_zenvia.asc(),
+            SupportConversation.id.asc(),
+        ):
+            conversations[conv.contact_id].append(conv)
+    return conversations
+
+
+def _existing_message_ids(message_ids: Iterable[str]) -> set:
+    message_ids = [message_id for message_id in dict.fromkeys(message_ids) if message_id]
+    if not message_ids:
+        return set()
+    rows = db.session.query(SupportMessage.zenvia_message_id).filter(SupportMessage.zenvia_message_id.in_(message_ids))
+    return {row[0] for row in rows}
+
+
 def import_zenvia_activities_csv(data: Any, period: Optional[str] = None) -> Dict[str, Any]:
     df = read_input_data(data, "Cliente")
     if df is None:
@@ -545,117 +778,131 @@ def import_zenvia_activities_csv(data: Any, period: Optional[str] = None) -> Dic
         "errors": 0,
         "months_breakdown": {},
     }
-    contact_cache: Dict[str, SupportContact] = {}
-    conv_cache: Dict[int, List[SupportConversation]] = {}
+    frame = _prepare_activities(df)
+    contact_cache = _resolve_activity_contacts(frame, stats)
+    conv_cache = _load_conversations_by_contact([contact.id for contact in contact_cache.values()])
 
-    for _, row in df.iterrows():
-        try:
-            ts = parse_datetime(row.get("Data"))
-            contact_name = normalize_empty(row.get("Cliente"))
-            agent_name = normalize_empty(row.get("Agente"))
-            group_name = normalize_empty(row.get("Grupo"))
-            details = normalize_empty(row.get("Detalhes"))
-            if not ts or not contact_name or not details:
-                continue
+    for start in range(0, len(frame), IMPORT_CHUNK_ROWS):
+        chunk = frame.iloc[start:start + IMPORT_CHUNK_ROWS]
+        known_messages = _existing_message_ids(chunk["message_id"])
+        new_messages = []
 
-            direction = None
-            msg_text = details
-            if details.startswith("WhatsApp recebido:"):
-                direction = "IN"
-                msg_text = details.replace("WhatsApp recebido:", "", 1).strip()
-            elif details.startswith("WhatsApp enviado:"):
-                direction = "OUT"
-                msg_text = details.replace("WhatsApp enviado:", "", 1).strip()
-                parts = msg_text.split(":", 1)
-                if len(parts) > 1 and len(parts[0]) < 35:
-                    msg_text = parts[1].strip()
-
-            contact_slug = slugify(contact_name)
-            contact = contact_cache.get(contact_slug)
-            if not contact:
-                contact = _find_contact_by_activity_name(contact_name)
-                if not contact:
-                    contact = SupportContact(
-                        zenvia_contact_id=f"CSV_CONTACT_{contact_slug}"[:100],
-                        name=contact_name[:255],
-                    )
-                    db.session.add(contact)
-                    db.session.flush()
-                    stats["contacts_created"] += 1
-                contact.updated_at = datetime.utcnow()
-                contact_cache[contact_slug] = contact
-
-            conversations = conv_cache.get(contact.id)
-            if conversations is None:
-                conversations = _load_contact_conversations(contact.id)
-                conv_cache[contact.id] = conversations
-
-            conv = _find_conversation_for_timestamp(conversations, ts)
-            if not conv:
-                conv = _ensure_fallback_conversation(contact, ts, agent_name, group_name)
-                conversations.append(conv)
-                conversations.sort(key=lambda item: (item.created_at_zenvia or datetime.min, item.id))
-                stats["conversations_created"] += 1
-
-            if group_name and not conv.group_id:
-                conv.group_id = group_name
-
-            if direction:
-                if agent_name and direction == "OUT":
-                    conv.agent_name = agent_name
-                if ts and (not conv.last_message_at or ts > conv.last_message_at):
-                    conv.last_message_at = ts
-                if direction == "OUT" and conv.first_response_at is None:
-                    conv.first_response_at = ts
+        for row in chunk.itertuples(index=False):
+            try:
+                ts = row.ts
+                agent_name = row.agent_name
+                contact = contact_cache[row.contact_slug]
+                conversations = conv_cache[contact.id]
+
+                conv = _find_conversation_for_timestamp(conversations, ts)
+                if not conv:
+                    conv = _ensure_fallback_conversation(contact, ts, agent_name, row.group_name)
+                    conversations.append(conv)
+                    conversations.sort(key=lambda item: (item.created_at_zenvia or datetime.min, item.id))
+                    stats["conversations_created"] += 1
+
+                if row.group_name and not conv.group_id:
+                    conv.group_id = row.group_name
+
+                if row.direction:
+                    if agent_name and row.direction == "OUT":
+                        conv.agent_name = agent_name
+                    if ts and (not conv.last_message_at or ts > conv.last_message_at):
+                        conv.last_message_at = ts
+                    if row.direction == "OUT" and conv.first_response_at is None:
+                        conv.first_response_at = ts
+                        if conv.created_at_zenvia:
+                            conv.response_time_seconds = max(int((ts - conv.created_at_zenvia).total_seconds()), 0)
+                    if row.message_id not in known_messages:
+                        known_messages.add(row.message_id)
+                        new_messages.append({
+                            "zenvia_message_id": row.message_id,
+                            "conversation_id": conv.id,
+                            "direction": row.direction,
+                            "channel": "whatsapp",
+                            "text": row.msg_text,
+                            "timestamp": ts,
+                            "status": "SENT" if row.direction == "OUT" else "READ",
+                        })
+                elif "Contato transferido para" in row.details or "Contato atribuído a agente" in row.details:
+                    if agent_name:
+                        conv.agent_name = agent_name
+                        stats["agent_links"] += 1
+                elif row.details == "Arquivou o cliente":
+                    conv.status = "CLOSED"
+                    conv.closed_at = ts
+                    conv.last_message_at = ts if not conv.last_message_at or ts > conv.last_message_at else conv.last_message_at
+                    if agent_name:
+                        conv.agent_name = agent_name
                     if conv.created_at_zenvia:
-                        conv.response_time_seconds = max(int((ts - conv.created_at_zenvia).total_seconds()), 0)
-                msg_hash = get_hash(f"{contact_slug}_{ts.isoformat()}_{direction}_{msg_text}")
-                zenvia_message_id = f"CSV_MSG_{msg_hash}"[:100]
-                if not SupportMessage.query.filter_by(zenvia_message_id=zenvia_message_id).first():
-                    db.session.add(SupportMessage(
-                        zenvia_message_id=zenvia_message_id,
-                        conversation_id=conv.id,
-                        direction=direction,
-                        channel="whatsapp",
-                        text=msg_text,
-                        timestamp=ts,
-                        status="SENT" if direction == "OUT" else "READ",
-                    ))
-                    stats["messages_imported"] += 1
-            elif "Contato transferido para" in details or "Contato atribuído a agente" in details:
-                if agent_name:
-                    conv.agent_name = agent_name
-                    stats["agent_links"] += 1
-            elif details == "Arquivou o cliente":
-                conv.status = "CLOSED"
-                conv.closed_at = ts
-                conv.last_message_at = ts if not conv.last_message_at or ts > conv.last_message_at else conv.last_message_at
-                if agent_name:
-                    conv.agent_name = agent_name
-                if conv.created_at_zenvia:
-                    conv.resolution_time_seconds = max(int((ts - conv.created_at_zenvia).total_seconds()), 0)
-                stats["conversations_closed"] += 1
-            elif details == "Desarquivou o cliente":
-                conv.status = "OPEN"
-                conv.closed_at = None
-                if agent_name:
-                    conv.agent_name = agent_name
-
-            row_period = period_from_datetime(ts, period)
-            stats["months_breakdown"][row_period] = stats["months_breakdown"].get(row_period, 0) + 1
-            if stats["messages_imported"] and stats["messages_imported"] % 1000 == 0:
-                db.session.commit()
-        except Exception as exc:
-            db.session.rollback()
-            contact_cache.pop(contact_slug, None)
-            conv_cache.clear()
-            stats["errors"] += 1
-            logger.debug("Erro ao importar atividade Zenvia: %s", exc)
+                        conv.resolution_time_seconds = max(int((ts - conv.created_at_zenvia).total_seconds()), 0)
+                    stats["conversations_closed"] += 1
+                elif row.details == "Desarquivou o cliente":
+                    conv.status = "OPEN"
+                    conv.closed_at = None
+                    if agent_name:
+                        conv.agent_name = agent_name
+
+                stats["months_breakdown"][row.row_period] = stats["months_breakdown"].get(row.row_period, 0) + 1
+            except Exception as exc:
+                stats["errors"] += 1
+                logger.debug("Erro ao importar atividade Zenvia: %s", exc)
+
+        # Mensagens novas do lote em INSERTs em lote; ids gravados por outra importacao nao contam.
+        stats["messages_imported"] += insert_missing_rows(SupportMessage, new_messages, ["zenvia_message_id"])
 
     db.session.commit()
     return stats
 
 
+def _load_agent_performance(names: Iterable[str], period: str, batch: Optional[SupportImportBatch]) -> Dict[str, SupportAgentPerformance]:
+    names = [name for name in dict.fromkeys(names) if name]
+    found: Dict[str, SupportAgentPerformance] = {}
+    if not names:
+        return found
+    query = SupportAgentPerformance.query.filter(
+        SupportAgentPerformance.period == period,
+        SupportAgentPerformance.agent_name.in_(names),
+    )
+    if batch:
+        query = query.filter_by(import_batch_id=batch.id)
+    for perf in query.order_by(SupportAgentPerformance.id):
+        found.setdefault(perf.agent_name, perf)
+    return found
+
+
+def _agent_performance_for(
+    found: Dict[str, SupportAgentPerformance],
+    name: str,
+    period: str,
+    batch: Optional[SupportImportBatch],
+    start_at: Optional[datetime],
+    end_at: Optional[datetime],
+    granularity: Optional[str],
+    window_label_value: Optional[str],
+) -> SupportAgentPerformance:
+    perf = found.get(name)
+    if not perf:
+        perf = SupportAgentPerformance(
+            agent_name=name,
+            period=period,
+            import_batch_id=batch.id if batch else None,
+            range_start=start_at,
+            range_end=end_at,
+            granularity=granularity,
+            window_label=window_label_value,
+        )
+        db.session.add(perf)
+        found[name] = perf
+    else:
+        perf.import_batch_id = batch.id if batch else perf.import_batch_id
+        perf.range_start = start_at
+        perf.range_end = end_at
+        perf.granularity = granularity
+        perf.window_label = window_label_value
+    return perf
+
+
 def import_agent_performance_csv(
     data: Any,
     period: Optional[str] = None,
@@ -671,40 +918,33 @@ def import_agent_performance_csv(
     period = period or datetime.now().strftime("%Y-%m")
     stats = {"total_rows": len(df), "agents_imported": 0, "errors": 0}
 
-    for _, row in df.iterrows():
+    names = text_column(df, "Consultor")
+    rows = zip(
+        column_values(names),
+        column_values(text_column(df, "Grupo")),
+        column_values(text_column(df, "Total de contatos").map(safe_int)),
+        column_values(text_column(df, "Conv. totais").map(safe_int)),
+        column_values(text_column(df, "Novas converas", fallback="Novas conversas").map(safe_int)),
+        column_values(text_column(df, "Conv. fechadas").map(safe_int)),
+        column_values(text_column(df, "Fecha em").map(parse_time_to_seconds)),
+        column_values(text_column(df, "Responde em").map(parse_time_to_seconds)),
+        column_values(text_column(df, "Mensagens enviadas").map(safe_int)),
+    )
+    found = _load_agent_performance(names, period, batch)
+
+    for name, group_name, contacts, conversations, new_conversations, closed, close_time, response_time, sent in rows:
         try:
-            name = normalize_empty(row.get("Consultor"))
             if not name or name.upper() == "TOTAL":
                 continue
-            query = SupportAgentPerformance.query.filter_by(agent_name=name, period=period)
-            if batch:
-                query = query.filter_by(import_batch_id=batch.id)
-            perf = query.first()
-            if not perf:
-                perf = SupportAgentPerformance(
-                    agent_name=name,
-                    period=period,
-                    import_batch_id=batch.id if batch else None,
-                    range_start=start_at,
-                    range_end=end_at,
-                    granularity=granularity,
-                    window_label=window_label_value,
-                )
-                db.session.add(perf)
-            else:
-                perf.import_batch_id = batch.id if batch else perf.import_batch_id
-                perf.range_start = start_at
-                perf.range_end = end_at
-                perf.granularity = granularity
-                perf.window_label = window_label_value
-            perf.group_name = normalize_empty(row.get("Grupo")) or perf.group_name or "Suporte N1"
-            perf.total_contacts = safe_int(row.get("Total de contatos"))
-            perf.total_conversations = safe_int(row.get("Conv. totais"))
-            perf.new_conversations = safe_int(row.get("Novas converas", row.get("Novas conversas")))
-            perf.closed_conversations = safe_int(row.get("Conv. fechadas"))
-            perf.avg_close_time_seconds = parse_time_to_seconds(row.get("Fecha em"))
-            perf.avg_response_time_seconds = parse_time_to_seconds(row.get("Responde em"))
-            perf.total_messages_sent = safe_int(row.get("Mensagens enviadas"))
+            perf = _agent_performance_for(found, name, period, batch, start_at, end_at, granularity, window_label_value)
+            perf.group_name = group_name or perf.group_name or "Suporte N1"
+            perf.total_contacts = contacts
+            perf.total_conversations = conversations
+            perf.new_conversations = new_conversations
+            perf.closed_conversations = closed
+            perf.avg_close_time_seconds = close_time
+            perf.avg_response_time_seconds = response_time
+            perf.total_messages_sent = sent
             stats["agents_imported"] += 1
         except Exception as exc:
             stats["errors"] += 1
@@ -728,36 +968,25 @@ def import_agents_status_csv(
     period = period or datetime.now().strftime("%Y-%m")
     stats = {"total_rows": len(df), "agents_updated": 0, "errors": 0}
 
-    for _, row in df.iterrows():
+    names = text_column(df, "Consultor")
+    rows = zip(
+        column_values(names),
+        column_values(datetime_column(df, "Ult. Atividade")),
+        column_values(text_column(df, "Ativ. realizadas hoje").map(safe_int)),
+        column_values(text_column(df, "Atendimentos pendentes").map(safe_int)),
+        column_values(text_column(df, "Atendimentos abertos").map(safe_int)),
+    )
+    found = _load_agent_performance(names, period, batch)
+
+    for name, last_activity_at, activities_today, pending, open_tickets in rows:
         try:
-            name = normalize_empty(row.get("Consultor"))
             if not name:
                 continue
-            query = SupportAgentPerformance.query.filter_by(agent_name=name, period=period)
-            if batch:
-                query = query.filter_by(import_batch_id=batch.id)
-            perf = query.first()
-            if not perf:
-                perf = SupportAgentPerformance(
-                    agent_name=name,
-                    period=period,
-                    import_batch_id=batch.id if batch else None,
-                    range_start=start_at,
-                    range_end=end_at,
-                    granularity=granularity,
-                    window_label=window_label_value,
-                )
-                db.session.add(perf)
-            else:
-                perf.import_batch_id = batch.id if batch else perf.import_batch_id
-                perf.range_start = start_at
-                perf.range_end = end_at
-                perf.granularity = granularity
-                perf.window_label = window_label_value
-            perf.last_activity_at = parse_datetime(row.get("Ult. Atividade"))
-            perf.activities_today = safe_int(row.get("Ativ. realizadas hoje"))
-            perf.pending_tickets = safe_int(row.get("Atendimentos pendentes"))
-            perf.open_tickets = safe_int(row.get("Atendimentos abertos"))
+            perf = _agent_performance_for(found, name, period, batch, start_at, end_at, granularity, window_label_value)
+            perf.last_activity_at = last_activity_at
+            perf.activities_today = activities_today
+            perf.pending_tickets = pending
+            perf.open_tickets = open_tickets
             stats["agents_updated"] += 1
         except Exception as exc:
             stats["errors"] += 1
@@ -782,56 +1011,55 @@ def import_snapshot_csv(
         return {"error": "CSV invalido ou ilegivel."}
 
     period = period or datetime.now().strftime("%Y-%m")
-    stats = {"total_rows": len(df), "snapshots": 0, "errors": 0}
-    source = filename or csv_type
+    stats = {"total_rows": len(df), "snapshots": 0, "snapshots_inserted": 0, "snapshots_updated": 0, "errors": 0}
     batch_id = batch.id if batch else None
+    writer = SnapshotWriter(period, batch_id, start_at, end_at, granularity, window_label_value, filename or csv_type)
 
     try:
         if csv_type == "hourly_response":
-            for _, row in df.iterrows():
-                day = normalize_empty(row.get("Day")) or "unknown"
-                for col in df.columns:
-                    if not str(col).endswith("h"):
-                        continue
-                    seconds = parse_time_to_seconds(row.get(col))
-                    upsert_snapshot(period, batch_id, start_at, end_at, granularity, window_label_value, source, "hourly_response", str(col), {"day": day}, seconds, None)
+            days = column_values(text_column(df, "Day").fillna("unknown"))
+            hour_columns = [col for col in df.columns if str(col).endswith("h")]
+            seconds_by_column = {col: column_values(df[col].map(parse_time_to_seconds)) for col in hour_columns}
+            for index, day in enumerate(days):
+                for col in hour_columns:
+                    writer.add("hourly_response", str(col), {"day": day}, seconds_by_column[col][index], None)
                     stats["snapshots"] += 1
         elif csv_type == "close_reasons":
             reason_col = "Razão para fechar" if "Razão para fechar" in df.columns else "Razao para fechar"
-            for _, row in df.iterrows():
-                reason = normalize_empty(row.get(reason_col))
+            rows = zip(
+                column_values(text_column(df, reason_col)),
+                column_values(text_column(df, "Total de contatos").map(safe_float)),
+                column_values(text_column(df, "Conversas").map(safe_float)),
+                column_values(text_column(df, "Hora de fechar / HT").map(parse_time_to_seconds)),
+            )
+            for reason, contacts, conversations, close_time in rows:
                 if not reason:
                     continue
-                upsert_snapshot(period, batch_id, start_at, end_at, granularity, window_label_value, source, "close_reason", reason, {"field": "contacts"}, safe_float(row.get("Total de contatos")), None)
-                upsert_snapshot(period, batch_id, start_at, end_at, granularity, window_label_value, source, "close_reason", reason, {"field": "conversations"}, safe_float(row.get("Conversas")), None)
-                upsert_snapshot(period, batch_id, start_at, end_at, granularity, window_label_value, source, "close_reason", reason, {"field": "close_time_seconds"}, parse_time_to_seconds(row.get("Hora de fechar / HT")), None)
+                writer.add("close_reason", reason, {"field": "contacts"}, contacts, None)
+                writer.add("close_reason", reason, {"field": "conversations"}, conversations, None)
+                writer.add("close_reason", reason, {"field": "close_time_seconds"}, close_time, None)
                 stats["snapshots"] += 3
         elif csv_type in {"new_conversations_series", "new_contacts_series", "closed_conversations_series", "interactions_series"}:
             metric_type = csv_type.replace("_series", "")
             for col in df.columns:
                 value = safe_float(df.iloc[0].get(col)) if len(df) else None
                 if value is not None:
-                    upsert_snapshot(period, batch_id, start_at, end_at, granularity, window_label_value, source, metric_type, str(col), {}, value, None)
+                    writer.add(metric_type, str(col), {}, value, None)
                     stats["snapshots"] += 1
         else:
             # Snapshot generico para paineis exportados em formato cruzado.
-            for row_index, row in df.iterrows():
-                for col in df.columns:
-                    raw = normalize_empty(row.get(col))
+            first_column = str(df.columns[0]) if len(df.columns) else ""
+            columns = [(col, column_values(text_column(df, col))) for col in df.columns]
+            for position, row_index in enumerate(df.index):
+                for col, values in columns:
+                    raw = values[position]
                     if raw is None:
                         continue
                     numeric = safe_float(raw)
-                    upsert_snapshot(
-                        period,
-                        batch_id,
-                        start_at,
-                        end_at,
-                        granularity,
-                        window_label_value,
-                        source,
+                    writer.add(
                         csv_type,
                         str(col),
-                        {"row": int(row_index), "first_column": str(df.columns[0])},
+                        {"row": int(row_index), "first_column": first_column},
                         numeric,
                         None if numeric is not None else raw,
                     )
@@ -840,6 +1068,9 @@ def import_snapshot_csv(
         stats["errors"] += 1
         logger.debug("Erro ao importar snapshot %s: %s", csv_type, exc)
 
+    written = writer.write()
+    stats["snapshots_inserted"] = written["inserted"]
+    stats["snapshots_updated"] = written["updated"]
     db.session.commit()
     return stats
 
@@ -1030,16 +1261,12 @@ def import_support_files(files_map: Any, form: Any, period: Optional[str] = None
         batch.finished_at = datetime.utcnow()
 
         sync_time = datetime.now().strftime("%d/%m/%Y %H:%M:%S")
-        config = SystemConfig.query.filter_by(key="last_support_import").first()
-        if config:
-            config.value = sync_time
-        else:
-            db.session.add(SystemConfig(
-                key="last_support_import",
-                value=sync_time,
-                category="import",
-                description="Ultima importacao de CSV de suporte pelo sistema online",
-            ))
+        ConfigService.set(
+            "last_support_import",
+            sync_time,
+            description="Ultima importacao de CSV de suporte pelo sistema online",
+            category="import",
+        )
         db.session.commit()
         return {
             "status": batch.status,
@@ -1,9 +1,10 @@
 import json
+import time as time_module
 from collections import defaultdict
 from datetime import date, datetime, time, timedelta
 from typing import Any, Dict, List, Optional, Tuple
 
-from sqlalchemy import and_, func, or_
+from sqlalchemy import and_, case, func, or_
 
 from app.models import (
     SupportAgentPerformance,
@@ -12,9 +13,16 @@ from app.models import (
     SupportImportBatch,
     SupportMessage,
     SupportMetricSnapshot,
-    SystemConfig,
     ZenviaWebhookEvent,
+    db,
 )
+from app.services.bulk_writer import dialect_name
+from app.services.config_service import ConfigService
+from config import Config
+
+# KPIs por janela: {(inicio, fim, periodo): (expira_em, versao dos dados, kpis)}.
+_kpi_cache: Dict[Tuple[Any, ...], Tuple[float, Tuple[Any, ...], Dict[str, Any]]] = {}
+KPI_CACHE_MAX_WINDOWS = 64
 
 
 def format_seconds(seconds: Optional[float]) -> str:
@@ -267,60 +275,71 @@ def get_support_kpis(
 ) -> Dict[str, Any]:
     start_at, end_at, selected = resolve_window(start_date, end_date, period)
 
-    open_convs = SupportConversation.query.filter(
-        SupportConversation.status == "OPEN",
-        SupportConversation.created_at_zenvia >= start_at,
-        SupportConversation.created_at_zenvia <= end_at,
-    ).count()
-    closed_convs = SupportConversation.query.filter(
-        SupportConversation.status == "CLOSED",
+    key = (start_at, end_at, selected)
+    version = _support_data_version()
+    cached = _kpi_cache.get(key)
+    if cached and cached[0] > time_module.monotonic() and cached[1] == version:
+        kpis = cached[2]
+    else:
+        kpis = _compute_support_kpis(start_at, end_at, selected)
+        if len(_kpi_cache) >= KPI_CACHE_MAX_WINDOWS:
+            _kpi_cache.clear()
+        _kpi_cache[key] = (time_module.monotonic() + Config.SUPPORT_KPI_CACHE_SECONDS, version, kpis)
+
+    return dict(
+        kpis,
+        last_sync=ConfigService.get("last_support_sync", "Nunca"),
+        last_import=ConfigService.get("last_support_import", "Nunca"),
+    )
+
+
+def _support_data_version() -> Tuple[Any, ...]:
+    """Ultimo evento Zenvia processado e ultima importacao: mudam sempre que chegam dados novos."""
+    last_event = db.session.query(func.max(ZenviaWebhookEvent.id)).filter(
+        ZenviaWebhookEvent.processed_at.isnot(None),
+    ).scalar_subquery()
+    last_import = db.session.query(func.max(SupportImportBatch.id)).scalar_subquery()
+    last_import_finished = db.session.query(func.max(SupportImportBatch.finished_at)).scalar_subquery()
+    return tuple(db.session.query(last_event, last_import, last_import_finished).one())
+
+
+def _compute_support_kpis(start_at: datetime, end_at: datetime, selected: Optional[str]) -> Dict[str, Any]:
+    open_convs, closed_convs, avg_nps = db.session.query(
+        func.coalesce(func.sum(case((SupportConversation.status == "OPEN", 1), else_=0)), 0),
+        func.coalesce(func.sum(case((SupportConversation.status == "CLOSED", 1), else_=0)), 0),
+        func.avg(SupportConversation.nps_score),
+    ).filter(
         SupportConversation.created_at_zenvia >= start_at,
         SupportConversation.created_at_zenvia <= end_at,
-    ).count()
-    messages_in = SupportMessage.query.filter(
-        SupportMessage.direction == "IN",
+    ).one()
+    messages_in, messages_out = db.session.query(
+        func.coalesce(func.sum(case((SupportMessage.direction == "IN", 1), else_=0)), 0),
+        func.coalesce(func.sum(case((SupportMessage.direction == "OUT", 1), else_=0)), 0),
+    ).filter(
         SupportMessage.timestamp >= start_at,
         SupportMessage.timestamp <= end_at,
-    ).count()
-    messages_out = SupportMessage.query.filter(
-        SupportMessage.direction == "OUT",
-        SupportMessage.timestamp >= start_at,
-        SupportMessage.timestamp <= end_at,
-    ).count()
+    ).one()
 
     agent_rows = _aggregate_agent_rows(_agent_rows_for_window(start_at, end_at))
     response_values = [row["avg_response_time_seconds"] for row in agent_rows if row["avg_response_time_seconds"]]
     avg_response_seconds = round(sum(response_values) / len(response_values), 0) if response_values else 0
 
-    nps_rows = SupportConversation.query.filter(
-        SupportConversation.nps_score.isnot(None),
-        SupportConversation.created_at_zenvia >= start_at,
-        SupportConversation.created_at_zenvia <= end_at,
-    ).all()
-    nps_scores = [row.nps_score for row in nps_rows if row.nps_score is not None]
-    avg_nps = round(sum(nps_scores) / len(nps_scores), 2) if nps_scores else None
-
     pending_tickets = sum(row["pending_tickets"] for row in agent_rows)
     open_tickets = sum(row["open_tickets"] for row in agent_rows)
 
-    last_sync = SystemConfig.query.filter_by(key="last_support_sync").first()
-    last_import = SystemConfig.query.filter_by(key="last_support_import").first()
-
     return {
         "period": selected,
         "start_date": start_at.date().isoformat(),
         "end_date": end_at.date().isoformat(),
-        "open_conversations": open_convs,
-        "closed_conversations": closed_convs,
-        "messages_in": messages_in,
-        "messages_out": messages_out,
+        "open_conversations": int(open_convs),
+        "closed_conversations": int(closed_convs),
+        "messages_in": int(messages_in),
+        "messages_out": int(messages_out),
         "avg_response_time": format_seconds(avg_response_seconds),
         "avg_response_time_seconds": avg_response_seconds,
-        "avg_nps": avg_nps,
+        "avg_nps": round(float(avg_nps), 2) if avg_nps is not None else None,
         "pending_tickets": pending_tickets,
         "open_tickets": open_tickets,
-        "last_sync": last_sync.value if last_sync else "Nunca",
-        "last_import": last_import.value if last_import else "Nunca",
     }
 
 
@@ -513,19 +532,35 @@ def _group_label(value: datetime, group_by: str) -> str:
     return value.strftime("%d/%m")
 
 
-def _group_datetime(value: datetime, group_by: str) -> datetime:
+def _bucket_expression(column: Any, group_by: str) -> Any:
+    """Inicio do bucket (dia, semana iniciando na segunda ou mes) calculado no banco."""
+    if dialect_name() == "postgresql":
+        return func.date_trunc(group_by if group_by in ("week", "month") else "day", column)
     if group_by == "week":
-        week_start = value.date() - timedelta(days=value.weekday())
-        return start_of_day(week_start)
+        return func.strftime("%Y-%m-%d", column, "weekday 0", "-6 days")
     if group_by == "month":
-        return start_of_day(value.date().replace(day=1))
-    return start_of_day(value.date())
+        return func.strftime("%Y-%m-01", column)
+    return func.strftime("%Y-%m-%d", column)
+
+
+def _bucket_start(value: Any) -> datetime:
+    if isinstance(value, datetime):
+        return start_of_day(value.date())
+    if isinstance(value, date):
+        return start_of_day(value)
+    return start_of_day(date.fromisoformat(str(value)[:10]))
+
+
+def _bucket_counts(column: Any, group_by: str, start_at: datetime, end_at: datetime, *aggregates: Any) -> List[Tuple[Any, ...]]:
+    bucket = _bucket_expression(column, group_by)
+    return db.session.query(bucket, func.count(), *aggregates).filter(
+        column >= start_at,
+        column <= end_at,
+    ).group_by(bucket).all()
 
 
 def _timeline_for_window(start_at: datetime, end_at: datetime, group_by: str) -> List[Dict[str, Any]]:
     buckets: Dict[datetime, Dict[str, Any]] = defaultdict(lambda: {
-        "bucket_date": None,
-        "label": "",
         "new_conversations": 0,
         "new_contacts": 0,
         "closed_conversations": 0,
@@ -534,55 +569,33 @@ def _timeline_for_window(start_at: datetime, end_at: datetime, group_by: str) ->
         "nps_count": 0,
     })
 
-    conversations = SupportConversation.query.filter(
-        SupportConversation.created_at_zenvia >= start_at,
-        SupportConversation.created_at_zenvia <= end_at,
-    ).all()
-    for conversation in conversations:
-        if not conversation.created_at_zenvia:
-            continue
-        bucket = _group_datetime(conversation.created_at_zenvia, group_by)
-        row = buckets[bucket]
-        row["bucket_date"] = bucket
-        row["label"] = _group_label(conversation.created_at_zenvia, group_by)
-        row["new_conversations"] += 1
-        if conversation.status == "CLOSED":
-            row["closed_conversations"] += 1
-        if conversation.nps_score is not None:
-            row["nps_sum"] += conversation.nps_score
-            row["nps_count"] += 1
-
-    contacts = SupportContact.query.filter(
-        SupportContact.created_at_zenvia >= start_at,
-        SupportContact.created_at_zenvia <= end_at,
-    ).all()
-    for contact in contacts:
-        if not contact.created_at_zenvia:
-            continue
-        bucket = _group_datetime(contact.created_at_zenvia, group_by)
-        row = buckets[bucket]
-        row["bucket_date"] = bucket
-        row["label"] = _group_label(contact.created_at_zenvia, group_by)
-        row["new_contacts"] += 1
-
-    messages = SupportMessage.query.filter(
-        SupportMessage.timestamp >= start_at,
-        SupportMessage.timestamp <= end_at,
-    ).all()
-    for message in messages:
-        if not message.timestamp:
-            continue
-        bucket = _group_datetime(message.timestamp, group_by)
-        row = buckets[bucket]
-        row["bucket_date"] = bucket
-        row["label"] = _group_label(message.timestamp, group_by)
-        row["interactions"] += 1
+    # Apenas contagens por bucket voltam do banco (date_trunc no Postgres, strftime no SQLite).
+    for bucket, total, closed, nps_sum, nps_count in _bucket_counts(
+        SupportConversation.created_at_zenvia,
+        group_by,
+        start_at,
+        end_at,
+        func.sum(case((SupportConversation.status == "CLOSED", 1), else_=0)),
+        func.sum(SupportConversation.nps_score),
+        func.count(SupportConversation.nps_score),
+    ):
+        row = buckets[_bucket_start(bucket)]
+        row["new_conversations"] += total
+        row["closed_conversations"] += int(closed or 0)
+        row["nps_sum"] += int(nps_sum or 0)
+        row["nps_count"] += nps_count
+
+    for bucket, total in _bucket_counts(SupportContact.created_at_zenvia, group_by, start_at, end_at):
+        buckets[_bucket_start(bucket)]["new_contacts"] += total
+
+    for bucket, total in _bucket_counts(SupportMessage.timestamp, group_by, start_at, end_at):
+        buckets[_bucket_start(bucket)]["interactions"] += total
 
     timeline = []
     for bucket in sorted(buckets.keys()):
         row = buckets[bucket]
         timeline.append({
-            "label": row["label"],
+            "label": _group_label(bucket, group_by),
             "bucket_date": bucket.date().isoformat(),
             "new_conversations": row["new_conversations"],
             "new_contacts": row["new_contacts"],
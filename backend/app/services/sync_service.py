@@ -1,9 +1,15 @@
 from app.services.clickup import ClickUpService
 from app.services.metrics import MetricsService
+from app.services.change_detection import TaskFingerprintService
+from app.services.step_stats_service import StepStatsService
+from app.services.risk_service import StoreRiskService
+from app.services.rollup_service import MonthlyRollupService
 from app.models import db, SyncState
 from config import Config
 from concurrent.futures import ThreadPoolExecutor, as_completed
 import logging
+import queue
+import threading
 from datetime import datetime
 
 class SyncService:
@@ -11,6 +17,7 @@ class SyncService:
         self.logger = logging.getLogger(__name__)
         self.clickup = ClickUpService()
         self.metrics = MetricsService()
+        self.fingerprints = TaskFingerprintService()
         
     def _sync_verbal_context(self, task_data):
         """
@@ -26,26 +33,28 @@ class SyncService:
         
         # 2. Comentários (Endpoint separado)
         try:
-            comments = self.clickup.get_task_comments(task_id)
+            comments = self.clickup.get_task_comments(task_id, date_updated=task_data.get('date_updated'))
             if comments:
-                # Pegar os 15 mais recentes
-                recent = comments[:15]
-                formatted = []
-                for c in recent:
-                    user = c.get('user', {}).get('username', 'N/A')
-                    text = c.get('comment_text', '').strip()
-                    date_ms = c.get('date')
-                    date_str = ""
-                    if date_ms:
-                        date_str = datetime.fromtimestamp(int(date_ms)/1000).strftime('%d/%m')
-                    
-                    if text:
-                        formatted.append(f"[{date_str}] {user}: {text}")
-                
-                task_data['comments_text'] = "\n".join(formatted)
+                task_data['comments_text'] = self._format_comments(comments)
         except Exception as e:
             self.logger.warning(f"Erro ao buscar comentários para task {task_id}: {e}")
 
+    @staticmethod
+    def _format_comments(comments):
+        """Texto do Raio-X com os 15 comentarios mais recentes."""
+        formatted = []
+        for c in comments[:15]:
+            user = c.get('user', {}).get('username', 'N/A')
+            text = c.get('comment_text', '').strip()
+            date_ms = c.get('date')
+            date_str = ""
+            if date_ms:
+                date_str = datetime.fromtimestamp(int(date_ms)/1000).strftime('%d/%m')
+            
+            if text:
+                formatted.append(f"[{date_str}] {user}: {text}")
+        return "\n".join(formatted)
+
     def _extract_latest_human_comment(self, comments):
         for comment in comments or []:
             user = comment.get('user', {}) or {}
@@ -165,15 +174,10 @@ class SyncService:
             # 1. Buscar Lojas (Lógica de Cobertura Total 2026 + Ativas)
             parent_tasks_dict = {}
             
-            # Passo A: Ativas (Sempre)
-            active_tasks = self.clickup.fetch_parent_tasks(include_closed=False)
-            for t in active_tasks:
-                parent_tasks_dict[t['id']] = t
-            
-            # Passo B: Ciclo Atual (2026)
-            recent_tasks = self.clickup.fetch_parent_tasks(date_updated_gt=last_ts, include_closed=True)
-            for t in recent_tasks:
-                parent_tasks_dict[t['id']] = t
+            # Passo A (ativas, sempre) e Passo B (ciclo atual 2026) paginados em paralelo.
+            for batch in self.clickup.fetch_parent_sync_generator(last_ts):
+                for t in batch:
+                    parent_tasks_dict[t['id']] = t
                 
             parent_tasks = list(parent_tasks_dict.values())
             self.logger.info(f"Lojas modificadas/ativas encontradas: {len(parent_tasks)}")
@@ -269,6 +273,8 @@ class SyncService:
                     db.session.add(err)
                     db.session.commit()
 
+            self._refresh_step_stats({s.get('step_type_name') for s in all_steps})
+            self._refresh_store_aggregates()
             self.metrics.commit()
             self.update_sync_state(success=True)
             
@@ -314,7 +320,8 @@ class SyncService:
             self.logger.info(f"Iniciando Deep Sync para loja: {store.store_name} ({store.clickup_task_id})")
             
             # Buscar do ClickUp
-            data = self.clickup.get_task_history(store.clickup_task_id)
+            # Deep Sync manual e uma reconciliacao explicita: ignora o cache.
+            data = self.clickup.get_task_history(store.clickup_task_id, use_cache=False)
             if not data:
                 return {"error": "Falha ao buscar historico no ClickUp"}
             
@@ -353,6 +360,7 @@ class SyncService:
             # FORÇAR REAVALIAÇÃO DE REGRAS DE CONCLUSÃO
             self.metrics.apply_training_completion_rule(store)
             db.session.commit()
+            self._refresh_store_aggregates()
             
             self.logger.info(f"Deep Sync finalizado para {store.store_name}")
             return {"status": "success", "history_items": len(status_history)}
@@ -369,9 +377,206 @@ class SyncService:
                 db.session.commit()
             return {"error": str(e)}
 
+    # Recursos por loja buscados no Deep: tipo no cache -> endpoint do ClickUp.
+    DEEP_ENDPOINTS = {
+        'comments': 'comment',
+        'time_tracking': 'time',
+        'time_in_status': 'time_in_status',
+    }
+
+    def _enrich_store_batch(self, batch, sync_run_id):
+        """
+        Deep: comentarios (Raio-X), time tracking e time_in_status de uma pagina de lojas.
+        O cache e lido/gravado nesta thread (dona da sessao); os misses vao ao ClickUp em
+        paralelo num pool limitado, que respeita o rate limiter compartilhado do cliente.
+        Falha em uma loja vira SyncError sem interromper o lote. Gerador: emite o progresso
+        em SSE e devolve {task_id: time_in_status} (use com `yield from`).
+        """
+        from app.models import SyncError
+
+        versions = {t['id']: t.get('date_updated') for t in batch}
+        cache = self.clickup.response_cache
+        payloads = {kind: cache.get_many(list(versions), kind, versions) for kind in self.DEEP_ENDPOINTS}
+        missing = [
+            (task_id, kind)
+            for task_id in versions
+            for kind in self.DEEP_ENDPOINTS
+            if task_id not in payloads[kind]
+        ]
+
+        failures = {}
+        if missing:
+            fetched = {kind: {} for kind in self.DEEP_ENDPOINTS}
+            pending_by_task = {}
+            for task_id, _ in missing:
+                pending_by_task[task_id] = pending_by_task.get(task_id, 0) + 1
+            done_stores = len(versions) - len(pending_by_task)
+
+            with ThreadPoolExecutor(max_workers=Config.SYNC_DEEP_FETCH_WORKERS) as executor:
+                futures = {
+                    executor.submit(self.clickup._get, f"task/{task_id}/{self.DEEP_ENDPOINTS[kind]}"): (task_id, kind)
+                    for task_id, kind in missing
+                }
+                for future in as_completed(futures):
+                    task_id, kind = futures[future]
+                    try:
+                        payload = future.result()
+                    except Exception as e:
+                        self.logger.warning(f"Erro ao buscar {kind} da task {task_id}: {e}")
+                        payload = None
+                    if payload is None:
+                        failures.setdefault(task_id, []).append(kind)
+                    else:
+                        fetched[kind][task_id] = payload
+
+                    pending_by_task[task_id] -= 1
+                    if not pending_by_task[task_id]:
+                        done_stores += 1
+                        # MANTÉM A CONEXÃO SSE VIVA (EVITA TIMEOUT NO RENDER)
+                        if done_stores % 3 == 0:
+                            yield f"data: ⏳ [Deep] {done_stores}/{len(versions)} lojas do lote detalhadas...\n\n"
+
+            for kind, by_task in fetched.items():
+                cache.put_many(kind, by_task, versions)
+                payloads[kind].update(by_task)
+
+        for p_task in batch:
+            task_id = p_task['id']
+            comments = (payloads['comments'].get(task_id) or {}).get('comments')
+            if comments:
+                p_task['comments_text'] = self._format_comments(comments)
+            time_tracking = payloads['time_tracking'].get(task_id)
+            if time_tracking is not None:
+                # Capturar Time Tracking (V6)
+                try:
+                    total_ms = sum(int(entry.get('duration', 0)) for entry in time_tracking.get('data', []))
+                    p_task['total_time_tracked'] = int(total_ms / 1000) # segundos
+                except (TypeError, ValueError):
+                    pass
+
+        for task_id, kinds in failures.items():
+            db.session.add(SyncError(
+                sync_run_id=sync_run_id,
+                task_id=task_id,
+                error_msg=f"Deep sync: falha ao buscar {', '.join(sorted(kinds))} no ClickUp",
+            ))
+        db.session.commit()
+        if failures:
+            self.logger.warning(f"[Deep] {len(failures)} lojas do lote com falha no enriquecimento.")
+        return payloads['time_in_status']
+
+    def _store_time_in_status(self, store_db, status_data):
+        """Capturar Time In Status (Histórico de Métricas V6)."""
+        from app.models import TimeInStatusCache
+        try:
+            if status_data:
+                # Limpar e atualizar
+                TimeInStatusCache.query.filter_by(store_id=store_db.id).delete()
+                for item in status_data.get('status_history', []):
+                    status_name = item.get('status')
+                    total_min = item.get('total_time', {}).get('by_minute', 0)
+                    if total_min:
+                        cache = TimeInStatusCache(
+                            store_id=store_db.id,
+                            status_name=status_name,
+                            total_seconds=int(total_min) * 60,
+                            total_days=round((int(total_min) * 60) / 86400, 2)
+                        )
+                        db.session.add(cache)
+        except (ValueError, TypeError, Exception): 
+            pass
+
+    def _produce_step_pages(self, list_name, list_id, search_ts, out_queue, stop_event):
+        """
+        Produtor do pipeline de etapas: pagina uma lista (abertas + atualizadas
+        desde o corte) e entrega as paginas novas na fila do escritor.
+        """
+        def put(item):
+            while not stop_event.is_set():
+                try:
+                    out_queue.put(item, timeout=1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        try:
+            self.logger.info(f"Sincronizando lista de etapas: {list_name} ({list_id})")
+            seen_ids = set()
+            for page in self.clickup.fetch_list_sync_generator(list_id, search_ts):
+                batch = [t for t in page if t['id'] not in seen_ids]
+                seen_ids.update(t['id'] for t in batch)
+                if batch and not put((list_name, 'page', batch)):
+                    return
+            self.logger.info(f"[{list_name}] Total de etapas encontradas: {len(seen_ids)}")
+            put((list_name, 'done', None))
+        except Exception as e:
+            put((list_name, 'error', str(e)))
+
+    def _refresh_step_stats(self, list_names=None):
+        """Recalcula as estatisticas de duracao das listas sincronizadas (falha nao derruba o sync)."""
+        try:
+            StepStatsService.refresh(list_names)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            self.logger.warning(f"Erro ao recalcular estatisticas de etapas: {e}")
+
+    def _refresh_store_aggregates(self):
+        """
+        Recalcula o score de risco das lojas tocadas pelo MetricsService e o rollup
+        mensal dos meses de entrega afetados (falha nao derruba o sync; a varredura
+        noturna e o rebuild reconciliam).
+        """
+        store_ids = self.metrics.touched_store_ids
+        try:
+            if store_ids:
+                StoreRiskService().refresh(store_ids)
+            MonthlyRollupService().apply_pending()
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            self.logger.warning(f"Erro ao recalcular agregados das lojas: {e}")
+        finally:
+            store_ids.clear()
+
+    def _flush_step_batch(self, pending_steps, touched_stores, manual_flags=None):
+        """
+        Grava o lote de etapas com um unico upsert (caindo para etapa a etapa se
+        o lote falhar) e reaplica a regra de conclusao uma vez por loja.
+        """
+        if pending_steps:
+            try:
+                self.metrics.process_step_batch(pending_steps, manual_flags=manual_flags)
+                db.session.commit()
+                # Impressoes digitais so depois do commit: uma falha nunca marca a etapa como sincronizada.
+                self.fingerprints.record([s_task for _, s_task in pending_steps], 'step')
+                db.session.commit()
+            except Exception as batch_error:
+                db.session.rollback()
+                self.logger.warning(f"Lote de etapas falhou ({batch_error}); reprocessando etapa a etapa.")
+                for store_db, s_task in pending_steps:
+                    try:
+                        self.metrics.process_step_data(store_db, s_task, manual_flags=manual_flags)
+                        db.session.commit()
+                    except Exception as inner_e:
+                        db.session.rollback()
+                        self.logger.error(f"Erro na etapa {s_task.get('id')}: {inner_e}")
+            pending_steps.clear()
+
+        try:
+            for store_db in touched_stores.values():
+                self.metrics.apply_training_completion_rule(store_db)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            self.logger.error(f"Erro ao gravar lote de etapas: {e}")
+        finally:
+            touched_stores.clear()
+
     def run_sync_stream(self, force_full=False, vital_only=False):
         """Gerador SSE com sincronismo incremental e logs de progresso."""
-        from app.models import SyncRun, SyncError
+        from app.models import SyncRun, SyncError, Store, TaskStep
         import traceback
         
         # Registra a execucao antes de iniciar o streaming.
@@ -404,105 +609,86 @@ class SyncService:
             yield "data: 🔍 Buscando e processando lojas...\n\n"
             self.logger.info(f"--- INICIANDO BUSCA DE LOJAS (Cutoff: {AnalystsReportService.CUTOFF_DATE}) ---")
             
-            parent_tasks_dict = {}
-            # A: Lojas em Aberto (Sempre sincronizar)
-            yield "data: 📥 Sincronizando lojas em andamento...\n\n"
-            self.logger.info("Buscando lojas com status 'Open'...")
-            for batch in self.clickup.fetch_parent_tasks_generator(include_closed=False):
-                for t in batch:
-                    parent_tasks_dict[t['id']] = t
-            
-            # B: Lojas Concluídas este ano
-            yield f"data: 📥 Sincronizando histórico desde {AnalystsReportService.CUTOFF_DATE.strftime('%d/%m/%Y')}...\n\n"
-            self.logger.info(f"Buscando histórico de lojas desde {AnalystsReportService.CUTOFF_DATE}...")
-            for batch in self.clickup.fetch_parent_tasks_generator(date_updated_gt=last_ts, include_closed=True):
-                for t in batch:
-                    parent_tasks_dict[t['id']] = t
-            
-            parent_tasks_list = list(parent_tasks_dict.values())
-            self.logger.info(f"Total de lojas para processar: {len(parent_tasks_list)}")
+            # A: Lojas em Aberto (Sempre sincronizar) + B: Lojas atualizadas este ano.
+            # As duas passadas compartilham o paginador com prefetch: a proxima pagina
+            # ja esta em voo enquanto a atual e gravada no banco.
+            yield f"data: 📥 Sincronizando lojas em andamento e histórico desde {AnalystsReportService.CUTOFF_DATE.strftime('%d/%m/%Y')}...\n\n"
+            self.logger.info(f"Buscando lojas em aberto e histórico desde {AnalystsReportService.CUTOFF_DATE}...")
+            seen_parent_ids = set()
             stores_processed = 0
-            
-            def to_chunks(data_list, chunk_size):
-                for i in range(0, len(data_list), chunk_size):
-                    yield data_list[i:i + chunk_size]
+            stores_skipped = 0
+            # Deteccao de mudancas: no modo completo tudo e reprocessado. Lojas no modo
+            # Deep tambem, pois comentarios e time tracking nao entram na impressao digital.
+            skip_unchanged = not force_full
 
-            for batch in to_chunks(parent_tasks_list, 20):
+            for page in self.clickup.fetch_parent_sync_generator(last_ts):
+                # Uma loja pode aparecer nas duas passadas; processa apenas a primeira.
+                batch = [t for t in page if t['id'] not in seen_parent_ids]
+                seen_parent_ids.update(t['id'] for t in batch)
+                if batch and skip_unchanged and vital_only:
+                    batch, unchanged = self.fingerprints.split_changed(batch)
+                    if unchanged:
+                        unchanged_ids = [t['id'] for t in unchanged]
+                        self.fingerprints.refresh_derived_fields(Store, unchanged_ids)
+                        db.session.commit()
+                        # idle_days mudou em SQL: o score de risco tambem precisa ser renovado.
+                        self.metrics.touched_store_ids.update(
+                            row[0] for row in db.session.query(Store.id).filter(Store.clickup_task_id.in_(unchanged_ids))
+                        )
+                        stores_skipped += len(unchanged)
                 if batch:
-                    for p_task in batch:
-                        try:
-                            store_name = p_task.get('name', 'Desconhecido')
-                            self.logger.info(f"Processando loja [{stores_processed + 1}]: {store_name}")
-                            
-                            # Sincronizar Contexto Verbal (Raio-X) apenas se NÃO for Vital
-                            if not vital_only:
-                                self._sync_verbal_context(p_task)
-                                
-                                # Capturar Time Tracking (V6)
-                                try:
-                                    tt_data = self.clickup.get_task_time_tracking(p_task.get('id'))
-                                    total_ms = sum(int(entry.get('duration', 0)) for entry in tt_data)
-                                    p_task['total_time_tracked'] = int(total_ms / 1000) # segundos
-                                except (ValueError, TypeError, Exception): 
-                                    pass
-                            
-                            store_db = self.metrics.process_store_data(p_task)
-                            
-                            # Se tivermos time tracked no p_task, atualizar no model
-                            if p_task.get('total_time_tracked') is not None:
-                                store_db.total_time_tracked = p_task['total_time_tracked']
-                                
-                                # Capturar Time In Status (Histórico de Métricas V6)
-                                try:
-                                    status_data = self.clickup.get_task_history(p_task.get('id'))
-                                    if status_data:
-                                        from app.models import TimeInStatusCache
-                                        # Limpar e atualizar
-                                        TimeInStatusCache.query.filter_by(store_id=store_db.id).delete()
-                                        for item in status_data.get('status_history', []):
-                                            status_name = item.get('status')
-                                            total_min = item.get('total_time', {}).get('by_minute', 0)
-                                            if total_min:
-                                                cache = TimeInStatusCache(
-                                                    store_id=store_db.id,
-                                                    status_name=status_name,
-                                                    total_seconds=int(total_min) * 60,
-                                                    total_days=round((int(total_min) * 60) / 86400, 2)
-                                                )
-                                                db.session.add(cache)
-                                except (ValueError, TypeError, Exception): 
-                                    pass
-                            
-                            db.session.commit()
-                            stores_processed += 1
-                        except Exception as e:
-                            db.session.rollback()
-                            self.logger.error(f"Erro store {p_task.get('name')}: {e}")
-                            err = SyncError(
-                                sync_run_id=run_record.id,
-                                task_id=p_task.get('id'),
-                                error_msg=f"Atualizacao de loja: {str(e)}",
-                                traceback=traceback.format_exc()
-                            )
-                            db.session.add(err)
-                            db.session.commit()
-                            
-                        # MANTÉM A CONEXÃO SSE VIVA (EVITA TIMEOUT NO RENDER)
-                        if not vital_only and stores_processed % 3 == 0:
-                            yield f"data: ⏳ [Deep] {stores_processed} lojas detalhadas processadas...\n\n"
+                    # Enriquecimento (Raio-X + Time Tracking + Time in Status) apenas se NÃO for Vital
+                    time_in_status = {}
+                    if not vital_only:
+                        time_in_status = yield from self._enrich_store_batch(batch, run_record.id)
+
+                    self.logger.info(f"Processando lote de {len(batch)} lojas (total ate aqui: {stores_processed})")
+                    try:
+                        # Caminho rapido: uma leitura IN (...) e um upsert para a pagina inteira.
+                        stores_by_task = self.metrics.process_store_batch(batch)
+                        if not vital_only:
+                            for p_task in batch:
+                                store_db = stores_by_task.get(p_task['id'])
+                                if store_db:
+                                    self._store_time_in_status(store_db, time_in_status.get(p_task['id']))
+                        db.session.commit()
+                        self.fingerprints.record(batch, 'store')
+                        db.session.commit()
+                        stores_processed += len(batch)
+                    except Exception as batch_error:
+                        db.session.rollback()
+                        self.logger.warning(f"Lote de lojas falhou ({batch_error}); reprocessando loja a loja.")
+                        for p_task in batch:
+                            try:
+                                store_db = self.metrics.process_store_data(p_task)
+                                if not vital_only:
+                                    self._store_time_in_status(store_db, time_in_status.get(p_task['id']))
+                                db.session.commit()
+                                stores_processed += 1
+                            except Exception as e:
+                                db.session.rollback()
+                                self.logger.error(f"Erro store {p_task.get('name')}: {e}")
+                                err = SyncError(
+                                    sync_run_id=run_record.id,
+                                    task_id=p_task.get('id'),
+                                    error_msg=f"Atualizacao de loja: {str(e)}",
+                                    traceback=traceback.format_exc()
+                                )
+                                db.session.add(err)
+                                db.session.commit()
                     
                     yield f"data: ⏳ Lote de lojas concluído. Total: {stores_processed}...\n\n"
                     batch = None # Libera referencia do lote processado.
 
-            self.logger.info(f"--- FIM DO PROCESSAMENTO DE LOJAS: {stores_processed} processadas ---")
-            yield f"data: ✅ {stores_processed} lojas sincronizadas.\n\n"
+            self.logger.info(f"--- FIM DO PROCESSAMENTO DE LOJAS: {stores_processed} processadas, {stores_skipped} sem mudancas ---")
+            yield f"data: ✅ {stores_processed} lojas sincronizadas ({stores_skipped} sem mudanças).\n\n"
             
             # 2. Steps (Processamento em Tempo Real por Batch) - OTIMIZADO
             yield "data: 📦 Buscando e processando etapas...\n\n"
             self.logger.info("--- INICIANDO BUSCA DE ETAPAS (SUBTAREFAS) ---")
             steps_processed = 0
+            steps_skipped = 0
             father_field_id = self.clickup.get_father_field_id()
-            from app.models import Store, StoreSyncLog
             
             # CACHE DE LOJAS: Evita milhares de queries individuais
             self.logger.info("Construindo cache de lojas...")
@@ -510,44 +696,57 @@ class SyncService:
             
             # CACHE DE FLAGS MANUAIS: Evita milhares de queries individuais a StoreSyncLog
             self.logger.info("Construindo cache de flags manuais...")
-            manual_flags = {}
-            all_manual = StoreSyncLog.query.filter(
-                StoreSyncLog.source == 'manual',
-                StoreSyncLog.field_name.like('step_%')
-            ).all()
-            for log in all_manual:
-                if log.store_id not in manual_flags:
-                    manual_flags[log.store_id] = set()
-                manual_flags[log.store_id].add(log.field_name)
+            manual_flags = self.metrics.load_manual_step_flags()
 
+            # Pipeline produtor/consumidor: as listas sao buscadas em paralelo e esta
+            # thread (dona da sessao do banco) e o unico escritor.
+            search_ts = last_ts if last_ts else int(AnalystsReportService.CUTOFF_DATE.timestamp() * 1000)
+            step_queue = queue.Queue(maxsize=Config.SYNC_STEP_QUEUE_PAGES)
+            stop_event = threading.Event()
+            executor = ThreadPoolExecutor(max_workers=Config.SYNC_STEP_FETCH_WORKERS)
             for list_name, list_id in Config.LIST_IDS_STEPS.items():
-                try:
-                    yield f"data: 📥 Iniciando busca da lista '{list_name}'...\n\n"
-                    self.logger.info(f"Sincronizando lista de etapas: {list_name} ({list_id})")
-                    
-                    # Lógica Dupla para Etapas:
-                    # 1. Busca TODAS as etapas em aberto (independentemente da data)
-                    # 2. Busca TODAS as etapas atualizadas desde o corte
-                    
-                    steps_dict = {}
-                    
-                    # A: Etapas em Aberto
-                    self.logger.info(f"[{list_name}] Buscando etapas em aberto...")
-                    for batch in self.clickup.fetch_tasks_from_list_generator(list_id, include_closed=False):
-                        for t in batch:
-                            steps_dict[t['id']] = t
-                    
-                    # B: Etapas do Ciclo Atual
-                    self.logger.info(f"[{list_name}] Buscando etapas concluídas em 2026...")
-                    search_ts = last_ts if last_ts else int(AnalystsReportService.CUTOFF_DATE.timestamp() * 1000)
-                    for batch in self.clickup.fetch_tasks_from_list_generator(list_id, date_updated_gt=search_ts, include_closed=True):
-                        for t in batch:
-                            steps_dict[t['id']] = t
-                    
-                    steps_list = list(steps_dict.values())
-                    self.logger.info(f"[{list_name}] Total de etapas encontradas: {len(steps_list)}")
-                    
-                    for s_task in steps_list:
+                executor.submit(self._produce_step_pages, list_name, list_id, search_ts, step_queue, stop_event)
+            yield f"data: 📥 Buscando {len(Config.LIST_IDS_STEPS)} listas de etapas em paralelo...\n\n"
+
+            pending_lists = len(Config.LIST_IDS_STEPS)
+            list_counts = {name: 0 for name in Config.LIST_IDS_STEPS}
+            touched_stores = {}
+            pending_steps = []
+            try:
+                while pending_lists:
+                    try:
+                        list_name, kind, payload = step_queue.get(timeout=15)
+                    except queue.Empty:
+                        # MANTÉM A CONEXÃO SSE VIVA enquanto as listas ainda estao em download
+                        yield "data: ⏳ Aguardando etapas do ClickUp...\n\n"
+                        continue
+
+                    if kind == 'error':
+                        pending_lists -= 1
+                        self.logger.error(f"[{list_name}] {payload}")
+                        yield f"data: ⚠️ Erro ao buscar lista '{list_name}': {payload}\n\n"
+                        yield f"data: 🔄 Etapas processadas: {steps_processed}\n\n"
+                        continue
+
+                    if kind == 'done':
+                        pending_lists -= 1
+                        # Commit ao final de cada lista
+                        self._flush_step_batch(pending_steps, touched_stores, manual_flags)
+                        self.logger.info(f"[{list_name}] Sincronização concluída.")
+                        yield f"data: 📦 Lista '{list_name}' concluída: {list_counts[list_name]} etapas.\n\n"
+                        continue
+
+                    for s_task in payload:
+                        s_task['step_type_name'] = list_name
+                    list_counts[list_name] += len(payload)
+                    if skip_unchanged:
+                        payload, unchanged = self.fingerprints.split_changed(payload)
+                        if unchanged:
+                            self.fingerprints.refresh_derived_fields(TaskStep, [t['id'] for t in unchanged])
+                            db.session.commit()
+                            steps_skipped += len(unchanged)
+
+                    for s_task in payload:
                         try:
                             # Encontrar Store via Custom Field
                             custom_id = None
@@ -560,19 +759,15 @@ class SyncService:
                                 # Usar CACHE em vez de Query
                                 store_db = store_cache.get(custom_id)
                                 if store_db:
-                                    s_task['step_type_name'] = list_name
-                                    
-                                    # Processar com Cache de Manual Flags
-                                    self.metrics.process_step_data(store_db, s_task, manual_flags=manual_flags)
-                                    
-                                    # Aplicar regra de treinamento
-                                    self.metrics.apply_training_completion_rule(store_db)
+                                    # Acumula para o upsert em lote (com Cache de Manual Flags)
+                                    pending_steps.append((store_db, s_task))
+                                    touched_stores[store_db.id] = store_db
                                     
                                     steps_processed += 1
                                     
-                                    # BATCH COMMIT: Commita a cada 50 etapas em vez de 1 por 1
-                                    if steps_processed % 50 == 0:
-                                        db.session.commit()
+                                    # BATCH COMMIT: um upsert a cada 50 etapas em vez de 1 por 1
+                                    if len(pending_steps) >= 50:
+                                        self._flush_step_batch(pending_steps, touched_stores, manual_flags)
                                         self.logger.info(f"[{list_name}] Batch de 50 etapas commitado. Total: {steps_processed}")
                                     
                                     # MANTÉM A CONEXÃO SSE VIVA
@@ -582,15 +777,12 @@ class SyncService:
                         except Exception as inner_e:
                             db.session.rollback()
                             self.logger.error(f"Erro na etapa {s_task.get('id')}: {inner_e}")
-                    
-                    # Commit ao final de cada lista
-                    db.session.commit()
-                    self.logger.info(f"[{list_name}] Sincronização concluída.")
-                    yield f"data: 📦 Lista '{list_name}' concluída: {len(steps_list)} etapas.\n\n"
-                except Exception as e:
-                    self.logger.error(str(e))
-                    yield f"data: ⚠️ Erro ao buscar lista '{list_name}': {str(e)}\n\n"
-                    yield f"data: 🔄 Etapas processadas: {steps_processed}\n\n"
+            finally:
+                stop_event.set()
+                executor.shutdown(wait=False)
+            self.logger.info(f"--- FIM DO PROCESSAMENTO DE ETAPAS: {steps_processed} atualizadas, {steps_skipped} sem mudancas ---")
+            self._refresh_step_stats([name for name, count in list_counts.items() if count])
+            self._refresh_store_aggregates()
     
             self.metrics.commit()
             self.update_sync_state(success=True)
@@ -753,19 +945,27 @@ class SyncService:
             updated_count = 0
             affected_store_ids = set()
             
+            pending = []
             for task in all_steps:
                 custom_id = None
                 for cf in task.get('custom_fields', []):
                     if cf['id'] == father_field_id:
                         custom_id = cf.get('value')
                         break
-                
                 if custom_id:
-                    store = Store.query.filter_by(custom_store_id=custom_id).first()
-                    if store:
-                        self.metrics.process_step_data(store, task)
-                        affected_store_ids.add(store.id)
-                        updated_count += 1
+                    pending.append((custom_id, task))
+
+            # Uma query para as lojas e um upsert por lote de etapas.
+            custom_ids = list({custom_id for custom_id, _ in pending})
+            stores_by_custom_id = {
+                s.custom_store_id: s for s in Store.query.filter(Store.custom_store_id.in_(custom_ids)).all()
+            } if custom_ids else {}
+            items = [(stores_by_custom_id[custom_id], task) for custom_id, task in pending if custom_id in stores_by_custom_id]
+            manual_flags = self.metrics.load_manual_step_flags()
+            for start in range(0, len(items), 200):
+                self.metrics.process_step_batch(items[start:start + 200], manual_flags=manual_flags)
+            affected_store_ids.update(store.id for store, _ in items)
+            updated_count = len(items)
             
             db.session.commit()
             
@@ -776,6 +976,8 @@ class SyncService:
                     self.metrics.apply_training_completion_rule(store)
             
             db.session.commit()
+            self._refresh_step_stats({task['step_type_name'] for _, task in items})
+            self._refresh_store_aggregates()
             self.logger.info(f"--- SYNC IMPLANTAÇÃO FINALIZADO: {updated_count} steps atualizados ---")
             
             return {"processed": updated_count, "stores_updated": len(affected_store_ids)}
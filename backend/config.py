@@ -12,6 +12,31 @@ class Config:
     IS_PRODUCTION = os.getenv("FLASK_ENV") == "production"
     
     CLICKUP_API_KEY = os.getenv("CLICKUP_API_KEY", "").strip()
+    # Orcamento compartilhado de chamadas ao ClickUp (o plano atual libera 100/min por token).
+    CLICKUP_RATE_LIMIT_PER_MIN = int(os.getenv("CLICKUP_RATE_LIMIT_PER_MIN", "100"))
+    CLICKUP_POOL_MAXSIZE = int(os.getenv("CLICKUP_POOL_MAXSIZE", "10"))
+    # Paginas buscadas antecipadamente por passada enquanto a anterior e processada.
+    CLICKUP_PAGE_PREFETCH = int(os.getenv("CLICKUP_PAGE_PREFETCH", "2"))
+    # Pipeline de etapas do sync: listas buscadas em paralelo e paginas aguardando o escritor.
+    SYNC_STEP_FETCH_WORKERS = int(os.getenv("SYNC_STEP_FETCH_WORKERS", "5"))
+    SYNC_STEP_QUEUE_PAGES = int(os.getenv("SYNC_STEP_QUEUE_PAGES", "20"))
+    # Deep sync: chamadas por loja (comentarios, time tracking, time_in_status) em paralelo.
+    SYNC_DEEP_FETCH_WORKERS = int(os.getenv("SYNC_DEEP_FETCH_WORKERS", "8"))
+    # Webhooks do ClickUp: segredo HMAC do webhook, intervalo do aplicador e tentativas por evento.
+    CLICKUP_WEBHOOK_SECRET = os.getenv("CLICKUP_WEBHOOK_SECRET", "").strip()
+    CLICKUP_WEBHOOK_APPLY_SECONDS = int(os.getenv("CLICKUP_WEBHOOK_APPLY_SECONDS", "15"))
+    CLICKUP_WEBHOOK_MAX_ATTEMPTS = int(os.getenv("CLICKUP_WEBHOOK_MAX_ATTEMPTS", "5"))
+    # Webhooks da Zenvia: eventos por lote (um commit por lote) e intervalo do processador.
+    ZENVIA_EVENTS_CHUNK_SIZE = int(os.getenv("ZENVIA_EVENTS_CHUNK_SIZE", "500"))
+    ZENVIA_EVENTS_PROCESS_SECONDS = int(os.getenv("ZENVIA_EVENTS_PROCESS_SECONDS", "30"))
+    # Cache persistente de comentarios/time tracking/time_in_status por tarefa.
+    CLICKUP_CACHE_TTL_HOURS = int(os.getenv("CLICKUP_CACHE_TTL_HOURS", "24"))
+    CLICKUP_CACHE_MAX_ROWS = int(os.getenv("CLICKUP_CACHE_MAX_ROWS", "20000"))
+    # Jobs em segundo plano: threads por processo, varredura da fila, heartbeat sem sinal e retencao.
+    JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+    JOB_POLL_SECONDS = int(os.getenv("JOB_POLL_SECONDS", "10"))
+    JOB_STALE_SECONDS = int(os.getenv("JOB_STALE_SECONDS", "120"))
+    JOB_RETENTION_DAYS = int(os.getenv("JOB_RETENTION_DAYS", "30"))
     GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
     
     # Origens permitidas no CORS. Mantem defaults de producao/desenvolvimento e
@@ -50,6 +75,10 @@ class Config:
     AUTH_COOKIE_DOMAIN = os.getenv("AUTH_COOKIE_DOMAIN") or None
     TOTP_VALID_WINDOW = int(os.getenv("TOTP_VALID_WINDOW", "2"))
     TWO_FACTOR_CHALLENGE_MINUTES = int(os.getenv("TWO_FACTOR_CHALLENGE_MINUTES", "5"))
+    # Tempo que o conjunto de permissoes de um usuario fica em cache no processo.
+    PERMISSION_CACHE_SECONDS = int(os.getenv("PERMISSION_CACHE_SECONDS", "60"))
+    # Validade maxima dos KPIs de suporte em cache (tambem invalidados por evento/importacao novos).
+    SUPPORT_KPI_CACHE_SECONDS = int(os.getenv("SUPPORT_KPI_CACHE_SECONDS", "60"))
     MAX_CONTENT_LENGTH = int(os.getenv("MAX_CONTENT_LENGTH", str(30 * 1024 * 1024)))
     SUPPORT_MAX_IMPORT_FILES = int(os.getenv("SUPPORT_MAX_IMPORT_FILES", "20"))
     SUPPORT_MAX_IMPORT_FILE_MB = int(os.getenv("SUPPORT_MAX_IMPORT_FILE_MB", "10"))
@@ -1,8 +1,12 @@
 # Script para rodar via Cron ou Task Scheduler
 # Ex: 0 1 * * * python run_daily_snapshot.py
+# Backfill de um intervalo: python run_daily_snapshot.py --start 2026-01-01 --end 2026-01-31
+# (preenche so os dias/lojas sem snapshot; --overwrite regrava os existentes)
 
+import argparse
 import sys
 import os
+from datetime import date, datetime
 
 # Adicionar diretório raiz ao path para imports funcionarem
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -12,14 +16,30 @@ from app.services.snapshot_service import SnapshotService
 
 app = create_app()
 
-def run():
+def parse_date(value):
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
+def run(start_date=None, end_date=None, overwrite=False):
     with app.app_context():
         print("--- Iniciando Job de Snapshot Diário ---")
         # Cria tabela se não existir (garantia)
         db.create_all()
         
-        SnapshotService.generate_daily_snapshot()
-        print("--- Job Finalizado ---")
+        if not start_date and not end_date:
+            # Execucao padrao (entrypoint): falha so e registrada, sem impedir a subida da API.
+            SnapshotService.generate_daily_snapshot()
+            print("--- Job Finalizado ---")
+            return
+
+        # Backfill explicito: erros interrompem o script.
+        start_date = start_date or date.today()
+        result = SnapshotService.generate_snapshots(start_date, end_date or start_date, overwrite=overwrite)
+        print(f"--- Job Finalizado: {result['days']} dia(s), {result['rows']} snapshots ---")
 
 if __name__ == "__main__":
-    run()
+    parser = argparse.ArgumentParser(description="Gera os snapshots diarios (ou um intervalo de datas).")
+    parser.add_argument("--start", type=parse_date, help="Data inicial (YYYY-MM-DD). Padrao: hoje.")
+    parser.add_argument("--end", type=parse_date, help="Data final (YYYY-MM-DD). Padrao: a data inicial.")
+    parser.add_argument("--overwrite", action="store_true", help="Regrava os snapshots ja existentes de dias passados.")
+    args = parser.parse_args()
+    run(args.start, args.end, args.overwrite)
@@ -0,0 +1,13 @@
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from app import create_app
+from app.services.store_dates_service import StoreDatesService
+
+app = create_app()
+
+with app.app_context():
+    resultado = StoreDatesService().backfill()
+    print(f"{resultado['updated']} de {resultado['stores']} lojas com datas efetivas recalculadas.")
@@ -0,0 +1,13 @@
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from app import create_app
+from app.services.rollup_service import MonthlyRollupService
+
+app = create_app()
+
+with app.app_context():
+    total = MonthlyRollupService().rebuild()
+    print(f"{total} linhas do rollup mensal de entregas recalculadas.")
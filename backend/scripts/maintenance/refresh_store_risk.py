@@ -0,0 +1,13 @@
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from app import create_app
+from app.services.risk_service import StoreRiskService
+
+app = create_app()
+
+with app.app_context():
+    total = StoreRiskService().sweep()
+    print(f"{total} scores de risco recalculados.")
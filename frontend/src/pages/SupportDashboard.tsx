@@ -125,6 +125,7 @@ interface OrphanContact {
   name: string;
   phone?: string;
   created_at?: string | null;
+  suggested_store?: string | null;
 }
 
 interface ConversationItem {
@@ -615,7 +616,10 @@ export const SupportDashboard = () => {
                       <p className="text-xs text-zinc-500">{contact.phone || '-'}</p>
                     </div>
                     <button
-                      onClick={() => setLinkingContact(contact)}
+                      onClick={() => {
+                        setLinkingContact(contact);
+                        setStoreName(contact.suggested_store || '');
+                      }}
                       className="inline-flex items-center gap-1 rounded-md border border-orange-200 px-2 py-1 text-xs font-semibold text-orange-600 transition hover:bg-orange-50"
                     >
                       <Link2 size={13} />